@@ -0,0 +1,179 @@
+import json
+from urllib.error import HTTPError
+from urllib.parse import quote, urlencode
+from urllib.request import Request, urlopen
+from metrics import instrumented
+import logging
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+class APIClient:
+    def __init__(self, base_url, token=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, method, path, query=None, body=None):
+        url = f"{self.base_url}{path}"
+        if query:
+            url += "?" + urlencode(query)
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["X-Api-Token"] = self.token
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            with urlopen(Request(url, data=data, headers=headers, method=method), timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("error", e.reason)
+            logging.error(f"API {method} {path} failed: {e.code} {message}")
+            raise APIError(e.code, message)
+
+@instrumented("db")
+class RemoteDatabaseManager:
+    """DatabaseManager stand-in that sends every operation to a FeeServer"""
+
+    def __init__(self, client):
+        self.client = client
+        self.ledger = RemoteLedger(client)
+        self.history = RemoteHistory(client)
+        self._verified_answers = {}
+
+    def has_users(self):
+        return self.client.request("GET", "/users")["has_users"]
+
+    def register_user(self, username, password, question, answer):
+        self.client.request("POST", "/users", body={"username": username, "password": password,
+                                                    "question": question, "answer": answer})
+
+    def authenticate_user(self, username, password):
+        return self.client.request("POST", "/login", body={"username": username, "password": password})["authenticated"]
+
+    def is_admin(self, username):
+        return self.client.request("GET", f"/users/{quote(username, safe='')}/role")["is_admin"]
+
+    def get_user_security_info(self, username):
+        try:
+            question = self.client.request("GET", f"/users/{quote(username, safe='')}/security-question")["question"]
+        except APIError as e:
+            if e.status == 404:
+                return None
+            raise
+        # The answer hash stays on the server
+        return username, question, None
+
+    def verify_security_answer(self, username, answer):
+        verified = self.client.request("POST", f"/users/{quote(username, safe='')}/security-answer",
+                                       body={"answer": answer})["verified"]
+        if verified:
+            # The server re-checks the answer when the password is reset
+            self._verified_answers[username] = answer
+        return verified
+
+    def update_password(self, username, new_password):
+        self.client.request("POST", f"/users/{quote(username, safe='')}/password",
+                            body={"answer": self._verified_answers.pop(username, ""), "new_password": new_password})
+
+    def add_student(self, name, form, email, phone):
+        return self.client.request("POST", "/students", body={"name": name, "form": form,
+                                                              "email": email, "phone": phone})["id"]
+
+    def get_student(self, student_id):
+        try:
+            return tuple(self.client.request("GET", f"/students/{int(student_id)}"))
+        except APIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def update_payment(self, student_id, amount):
+        """Return the student's new total_paid, or None, recording nothing, when the student does not exist"""
+        try:
+            return self.client.request("POST", "/payments",
+                                       body={"student_id": student_id, "amount": amount})["total_paid"]
+        except APIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def get_students_page(self, after_id=0, limit=200):
+        return self.client.request("GET", "/students", {"after_id": after_id, "limit": limit})
+
+    def search_students(self, term, limit=-1, offset=0):
+        return self.client.request("GET", "/students/search", {"q": term, "limit": limit, "offset": offset})
+
+    def get_balance(self, student_id):
+        try:
+            return tuple(self.client.request("GET", f"/students/{int(student_id)}/balance"))
+        except APIError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def get_fees(self):
+        return self.client.request("GET", "/fees")
+
+    def get_payment_history(self, student_id, limit=-1):
+        if not str(student_id).strip().isdigit():
+            return []
+        return self.client.request("GET", f"/students/{int(student_id)}/payments", {"limit": limit})
+
+class RemoteLedger:
+    def __init__(self, client):
+        self.client = client
+
+    def form_totals(self):
+        return self.client.request("GET", "/balances")
+
+    def daily_totals(self, day):
+        return self.client.request("GET", "/balances/daily", {"day": day})
+
+    def check_consistency(self):
+        return self.client.request("GET", "/balances/check")
+
+    def rebuild(self):
+        self.client.request("POST", "/balances/rebuild")
+
+class RemoteHistory:
+    """PaymentHistory stand-in; the server keeps the cache"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def filters(self, student_id, form, start, end):
+        return {name: value for name, value in (("student_id", student_id), ("form", form), ("start", start),
+                                                ("end", end)) if value is not None}
+
+    def invalidate(self):
+        pass
+
+    def page(self, student_id=None, form=None, start=None, end=None, before=None, limit=100):
+        query = dict(self.filters(student_id, form, start, end), limit=limit)
+        if before is not None:
+            query.update(before_date=before[0], before_id=before[1])
+        return self.client.request("GET", "/history/payments", query)
+
+    def monthly(self, student_id=None, form=None, start=None, end=None):
+        return self.client.request("GET", "/history/monthly", self.filters(student_id, form, start, end))
+
+    def terms(self, student_id=None, form=None, start=None, end=None):
+        return self.client.request("GET", "/history/terms", self.filters(student_id, form, start, end))
+
+class RemoteBackupManager:
+    def __init__(self, client):
+        self.client = client
+
+    def create_backup(self, progress=None):
+        try:
+            return self.client.request("POST", "/backups", body={})["file"]
+        except (APIError, OSError):
+            return None
+
+    def create_incremental_backup(self):
+        try:
+            return self.client.request("POST", "/backups", body={"incremental": True})["file"]
+        except (APIError, OSError):
+            return None
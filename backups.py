@@ -1,27 +1,227 @@
+import json
+import os
+import shutil
 import sqlite3
+import time
 import zipfile
+from contextlib import contextmanager
 from datetime import datetime
+from metrics import metrics
 import logging
 
+SNAPSHOT_NAME = "school_fees.db"
+STUDENT_COLUMNS = ("id", "name", "form", "parent_email", "parent_phone", "total_paid")
+PAYMENT_COLUMNS = ("id", "student_id", "amount", "date")
+MARKS = ("last_student_id", "last_payment_id", "last_reference_rowid", "last_fee_schedule_id")
+
+# Other tables an incremental carries, with the rows it takes since the previous backup's marks.
+# Users, fee schedules and campaigns are small and copied whole; bank references
+# are append-only, and carry-overs are written when open_year adds a year's fees.
+TABLES = {
+    "users": (("id", "username", "password", "security_question", "security_answer", "is_admin"), "1"),
+    "fee_schedules": (("id", "form", "academic_year", "term", "amount", "effective_date"), "1"),
+    "fee_carry_over": (("student_id", "academic_year", "arrears", "paid_before"),
+                       "academic_year IN (SELECT academic_year FROM fee_schedules WHERE id > :last_fee_schedule_id)"),
+    "payment_references": (("reference", "payment_id", "status", "statement", "created"),
+                           "rowid > :last_reference_rowid"),
+    "campaigns": (("id", "subject", "template", "threshold", "status", "last_student_id", "sent", "failed",
+                   "created", "finished"), "1"),
+    "campaign_failures": (("campaign_id", "student_id", "error"), "1"),
+}
+
 class BackupManager:
-    def __init__(self, db_connection):
-        self.conn = db_connection
+    def __init__(self, db_manager, backup_dir=".", max_memory=64 * 1024 * 1024):
+        self.db = db_manager
+        self.backup_dir = backup_dir
+        # Largest database create_backup serializes in memory rather than copying to a snapshot file;
+        # the image is held whole for the length of the compression
+        self.max_memory = max_memory
 
-    def create_backup(self):
+    @metrics.timed("backup.create")
+    def create_backup(self, progress=None, pages=256):
+        """Write a full backup zip.
+
+        A database up to max_memory (64 MB by default) is serialized inside
+        one read transaction and compressed straight into the zip, so the
+        only extra disk used is the zip itself. A larger one is first copied
+        to a snapshot file with SQLite's online backup API, pages at a time
+        so other work can interleave; the copy costs the database's size in
+        temporary disk, but no more memory than a step of pages. Pages cannot
+        be streamed from the file itself: under WAL the latest commits may
+        only be in the log. progress is called as
+        progress(remaining_pages, total_pages) after each step of pages.
+        """
+        start = time.perf_counter()
+        backup_file = self._backup_name("")
+        snapshot_file = f"{backup_file}.snapshot"
         try:
-            backup_file = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            sql_file = f"{backup_file}.sql"
-            with open(sql_file, 'w') as f:
-                for line in self.conn.iterdump():
-                    f.write(f'{line}\n')
-            
+            conn = self.db.conn
+            page_size, page_count = (conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                                     for pragma in ("page_size", "page_count"))
             with zipfile.ZipFile(f"{backup_file}.zip", 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(sql_file)
-            
-            import os
-            os.remove(sql_file)
-            logging.info(f"Backup created: {backup_file}.zip")
+                if page_size * page_count <= self.max_memory:
+                    with self._read_snapshot(conn):
+                        marks, change_seq = self._high_water_marks(conn), self._change_seq(conn)
+                        image = memoryview(conn.serialize())
+                    step = page_size * pages
+                    with zipf.open(SNAPSHOT_NAME, 'w', force_zip64=True) as out:
+                        for offset in range(0, len(image), step):
+                            out.write(image[offset:offset + step])
+                            if progress:
+                                progress(max(len(image) - offset - step, 0) // page_size, len(image) // page_size)
+                    del image
+                else:
+                    # Read before the copy, which then contains at least every change logged so far
+                    change_seq = self._change_seq(conn)
+                    snapshot = sqlite3.connect(snapshot_file)
+                    try:
+                        conn.backup(snapshot, pages=pages,
+                                    progress=(lambda status, remaining, total: progress(remaining, total))
+                                    if progress else None)
+                        marks = self._high_water_marks(snapshot)
+                    finally:
+                        snapshot.close()
+                    zipf.write(snapshot_file, SNAPSHOT_NAME)
+                zipf.writestr("manifest.json", json.dumps({"kind": "full", **marks}))
+            self._record_backup("full", f"{backup_file}.zip", marks, change_seq)
+            logging.info(f"Backup created: {backup_file}.zip",
+                         extra={"operation": "backup", "file": f"{backup_file}.zip",
+                                "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
             return f"{backup_file}.zip"
         except Exception as e:
             logging.error(f"Backup failed: {str(e)}")
-            return None
\ No newline at end of file
+            if os.path.exists(f"{backup_file}.zip"):
+                os.remove(f"{backup_file}.zip")
+            return None
+        finally:
+            if os.path.exists(snapshot_file):
+                os.remove(snapshot_file)
+
+    @metrics.timed("backup.incremental")
+    def create_incremental_backup(self):
+        """Back up what changed since the last backup.
+
+        Captures payments recorded since then, plus students that are new,
+        were edited, or whose total_paid those payments changed, and the
+        changed rows of the TABLES reconciliation, fees and logins depend on.
+        Falls back to a full backup when there is no earlier backup to build
+        on. Everything is read from one snapshot, so totals, payments and the
+        change log agree.
+        """
+        previous = self.db.conn.execute(
+            f"SELECT file, {', '.join(MARKS)} FROM backups ORDER BY id DESC LIMIT 1").fetchone()
+        if previous is None:
+            return self.create_backup()
+        base_file, since = previous[0], dict(zip(MARKS, previous[1:]))
+        backup_file = self._backup_name("_incr") + ".zip"
+        try:
+            conn = self.db.conn
+            with self._read_snapshot(conn), zipfile.ZipFile(backup_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                marks = self._high_water_marks(conn)
+                change_seq = self._change_seq(conn)
+                self._write_rows(zipf, "students", conn.execute(
+                    f"""SELECT {', '.join(STUDENT_COLUMNS)} FROM students
+                    WHERE id > ? OR id IN (SELECT student_id FROM payments WHERE id > ?)
+                    OR id IN (SELECT student_id FROM student_changes)""",
+                    (since["last_student_id"], since["last_payment_id"])))
+                self._write_rows(zipf, "payments", conn.execute(
+                    f"SELECT {', '.join(PAYMENT_COLUMNS)} FROM payments WHERE id > ? AND id <= ?",
+                    (since["last_payment_id"], marks["last_payment_id"])))
+                for table, (columns, where) in TABLES.items():
+                    self._write_rows(zipf, table, conn.execute(
+                        f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", since))
+                zipf.writestr("manifest.json", json.dumps({
+                    "kind": "incremental", "base": os.path.basename(base_file),
+                    "since_payment_id": since["last_payment_id"], **marks}))
+            self._record_backup("incremental", backup_file, marks, change_seq)
+            logging.info(f"Incremental backup created: {backup_file}")
+            return backup_file
+        except Exception as e:
+            logging.error(f"Incremental backup failed: {str(e)}")
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            return None
+
+    def _backup_name(self, suffix):
+        base = os.path.join(self.backup_dir, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}")
+        name, counter = base, 1
+        while os.path.exists(f"{name}.zip"):
+            counter += 1
+            name = f"{base}_{counter}"
+        return name
+
+    @contextmanager
+    def _read_snapshot(self, conn):
+        """Hold one read transaction, so every query inside sees the database as of its first read"""
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def _write_rows(self, zipf, table, rows):
+        with zipf.open(f"{table}.jsonl", 'w') as out:
+            for row in rows:
+                out.write((json.dumps(row) + "\n").encode())
+
+    def _high_water_marks(self, conn):
+        return dict(zip(MARKS, conn.execute(
+            """SELECT (SELECT COALESCE(MAX(id), 0) FROM students), (SELECT COALESCE(MAX(id), 0) FROM payments),
+            (SELECT COALESCE(MAX(rowid), 0) FROM payment_references),
+            (SELECT COALESCE(MAX(id), 0) FROM fee_schedules)""").fetchone()))
+
+    def _change_seq(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM student_changes").fetchone()[0]
+
+    def _record_backup(self, kind, backup_file, marks, change_seq):
+        with self.db.pool.transaction() as conn:
+            conn.execute(f"""INSERT INTO backups (kind, file, created, {', '.join(MARKS)})
+                         VALUES (?, ?, ?, {', '.join('?' * len(MARKS))})""",
+                         (kind, backup_file, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          *(marks[mark] for mark in MARKS)))
+            # Changes logged after the backup read the database stay for the next one
+            conn.execute("DELETE FROM student_changes WHERE seq <= ?", (change_seq,))
+
+def read_manifest(backup_file):
+    with zipfile.ZipFile(backup_file) as zipf:
+        return json.loads(zipf.read("manifest.json"))
+
+def restore_backup(full_backup, incremental_backups, target_path):
+    """Rebuild a database at target_path from a full backup and its incrementals"""
+    with zipfile.ZipFile(full_backup) as zipf:
+        with zipf.open(SNAPSHOT_NAME) as src, open(target_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    incremental_backups = sorted(incremental_backups, key=lambda f: read_manifest(f)["last_payment_id"])
+    conn = sqlite3.connect(target_path)
+    try:
+        for backup_file in incremental_backups:
+            with zipfile.ZipFile(backup_file) as zipf:
+                with zipf.open("students.jsonl") as rows:
+                    # An upsert rather than INSERT OR REPLACE so the search index triggers see an UPDATE
+                    conn.executemany(f"INSERT INTO students ({', '.join(STUDENT_COLUMNS)}) "
+                                     f"VALUES ({', '.join('?' * len(STUDENT_COLUMNS))}) "
+                                     f"ON CONFLICT(id) DO UPDATE SET "
+                                     f"{', '.join(f'{c}=excluded.{c}' for c in STUDENT_COLUMNS[1:])}",
+                                     (json.loads(line) for line in rows))
+                with zipf.open("payments.jsonl") as rows:
+                    conn.executemany(f"INSERT OR IGNORE INTO payments ({', '.join(PAYMENT_COLUMNS)}) "
+                                     f"VALUES ({', '.join('?' * len(PAYMENT_COLUMNS))})",
+                                     (json.loads(line) for line in rows))
+                # Incrementals written before these tables were included leave them as of the full backup
+                names = set(zipf.namelist())
+                for table, (columns, _) in TABLES.items():
+                    if f"{table}.jsonl" in names:
+                        with zipf.open(f"{table}.jsonl") as rows:
+                            conn.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                                             f"VALUES ({', '.join('?' * len(columns))})",
+                                             (json.loads(line) for line in rows))
+            conn.commit()
+            logging.info(f"Applied incremental backup {backup_file}")
+        if incremental_backups:
+            # The fee ledger rebuilds empty aggregates the next time the database is opened
+            conn.execute("DELETE FROM form_totals")
+            conn.execute("DELETE FROM daily_totals")
+            conn.commit()
+    finally:
+        conn.close()
+    return target_path
@@ -0,0 +1,82 @@
+"""Timing and peak extra disk usage of backup strategies.
+
+Compares the old iterdump -> .sql -> zip approach with create_backup, both
+streamed from memory (what it does for databases up to max_memory, 64 MB by
+default; forced here whatever the size) and through an online-backup
+snapshot file (larger ones), and with create_incremental_backup after a day
+of payments.
+
+Usage: python benchmarks/bench_backup.py [payments]   (~80 bytes/payment on disk)
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from backups import BackupManager
+
+def legacy_backup(conn, path):
+    with open(f"{path}.sql", 'w') as f:
+        for line in conn.iterdump():
+            f.write(f'{line}\n')
+    with zipfile.ZipFile(f"{path}.zip", 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.write(f"{path}.sql")
+    peak = os.path.getsize(f"{path}.sql") + os.path.getsize(f"{path}.zip")
+    os.remove(f"{path}.sql")
+    return peak
+
+def mb(size):
+    return f"{size / 1024 / 1024:8.1f}MB"
+
+def main():
+    payments = int(sys.argv[1]) if len(sys.argv) > 1 else 3000000
+    students = max(payments // 20, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        security = SecurityManager(Fernet.generate_key().decode())
+        db = DatabaseManager(os.path.join(tmp, "school_fees.db"), security)
+        contact = security.encrypt_data("parent@example.com")
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                              [(f"Student {i}", "Form 1", contact, contact) for i in range(students)])
+        db.cursor.executemany("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                              ((random.randint(1, students), 1000, "2024-03-01 08:00:00") for _ in range(payments)))
+        db.conn.commit()
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"database: {mb(os.path.getsize(os.path.join(tmp, 'school_fees.db')))}")
+
+        start = time.perf_counter()
+        peak = legacy_backup(db.conn, os.path.join(tmp, "legacy"))
+        print(f"iterdump + zip:      {time.perf_counter() - start:7.2f}s  peak extra disk {mb(peak)}")
+
+        database_size = os.path.getsize(os.path.join(tmp, "school_fees.db"))
+        backup = BackupManager(db, tmp, max_memory=database_size)
+        start = time.perf_counter()
+        full = backup.create_backup()
+        elapsed = time.perf_counter() - start
+        # Only the zip is written; the serialized image costs memory instead
+        print(f"streamed from memory:{elapsed:7.2f}s  peak extra disk {mb(os.path.getsize(full))}  "
+              f"zip {mb(os.path.getsize(full))}  extra memory {mb(database_size)}")
+
+        backup.max_memory = 0
+        start = time.perf_counter()
+        snapshot_full = backup.create_backup()
+        elapsed = time.perf_counter() - start
+        # The page snapshot and the zip coexist until the snapshot is removed
+        peak = database_size + os.path.getsize(snapshot_full)
+        print(f"snapshot file + zip: {elapsed:7.2f}s  peak extra disk {mb(peak)}  zip {mb(os.path.getsize(snapshot_full))}")
+
+        db.bulk_update_payments([(random.randint(1, students), 500, None) for _ in range(2000)])
+        start = time.perf_counter()
+        incremental = backup.create_incremental_backup()
+        elapsed = time.perf_counter() - start
+        print(f"incremental (2000):  {elapsed:7.2f}s  peak extra disk {mb(os.path.getsize(incremental))}")
+        db.conn.close()
+
+if __name__ == "__main__":
+    main()
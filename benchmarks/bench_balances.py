@@ -0,0 +1,90 @@
+"""Balance computation on large rosters: Python loop versus the student_balances view.
+
+"python" is the old path, fetching every student and working out the balance
+per row from a fee dict, extended with a dict of carried-over arrears so that
+it produces the same figures. "sql" reads them from the student_balances view
+and totals them with GROUP BY. A new academic year is opened first so that
+every student has arrears carried over.
+
+Usage: python benchmarks/bench_balances.py [students...]
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def best(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def carried(db):
+    year = db.fees.academic_year()
+    return {student_id: (arrears, paid_before) for student_id, arrears, paid_before in db.conn.execute(
+        "SELECT student_id, arrears, paid_before FROM fee_carry_over WHERE academic_year=?", (year,))}
+
+def python_listing(db, fees):
+    carry = carried(db)
+    rows = []
+    for student_id, name, form, total_paid in db.conn.execute("SELECT id, name, form, total_paid FROM students"):
+        arrears, paid_before = carry.get(student_id, (0, 0))
+        paid = total_paid - paid_before
+        rows.append((student_id, name, form, paid, fees.get(form, 0) + arrears - paid))
+    return rows
+
+def python_totals(db, fees):
+    carry = carried(db)
+    totals = defaultdict(lambda: [0, 0])
+    for student_id, form, total_paid in db.conn.execute("SELECT id, form, total_paid FROM students"):
+        arrears, paid_before = carry.get(student_id, (0, 0))
+        balance = fees.get(form, 0) + arrears - total_paid + paid_before
+        totals[form][0] += max(balance, 0)
+        totals[form][1] += balance <= 0
+    return dict(totals)
+
+def sql_listing(db):
+    return db.conn.execute("SELECT student_id, name, form, paid, balance FROM student_balances").fetchall()
+
+def sql_totals(db):
+    return {form: [outstanding, fully_paid] for form, outstanding, fully_paid in db.conn.execute(
+        "SELECT form, SUM(MAX(balance, 0)), SUM(balance <= 0) FROM student_balances GROUP BY form")}
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000, 500000]
+    print(f"{'students':>9} {'python list':>12} {'sql list':>10} {'python totals':>14} {'sql totals':>11} "
+          f"{'outstanding >0':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db = DatabaseManager(os.path.join(tmp, f"{size}.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+            generate(db, FEES, size, 2)
+            # Close one year and open the next, so balances include carried arrears
+            db.fees.open_year("next", {form: fee + 50000 for form, fee in FEES.items()}, datetime.now().strftime("%Y-%m-%d"))
+            fees = dict(db.fees)
+            python_list, _ = best(lambda: python_listing(db, fees))
+            sql_list, rows = best(lambda: sql_listing(db))
+            assert rows == python_listing(db, fees)
+            python_sum, _ = best(lambda: python_totals(db, fees))
+            sql_sum, totals = best(lambda: sql_totals(db))
+            assert totals == python_totals(db, fees)
+            count, _ = best(lambda: db.count_outstanding_students(0))
+            print(f"{size:>9,} {python_list * 1000:>10.0f}ms {sql_list * 1000:>8.0f}ms {python_sum * 1000:>12.0f}ms "
+                  f"{sql_sum * 1000:>9.0f}ms {count * 1000:>13.0f}ms")
+            assert len(rows) == size
+            db.pool.close_all()
+
+if __name__ == "__main__":
+    main()
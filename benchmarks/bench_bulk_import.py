@@ -0,0 +1,47 @@
+"""Compare bulk_update_payments with a per-row update_payment loop.
+
+Usage: python benchmarks/bench_bulk_import.py [payments] [students]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+
+def make_db(path, students):
+    db = DatabaseManager(path, SecurityManager(Fernet.generate_key().decode()))
+    db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                          [(f"Student {i}", "Form 1", "", "") for i in range(students)])
+    db.conn.commit()
+    return db
+
+def main():
+    payments = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rows = [(random.randint(1, students), random.randint(1, 50) * 1000, None) for _ in range(payments)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(os.path.join(tmp, "loop.db"), students)
+        start = time.perf_counter()
+        for student_id, amount, _ in rows:
+            db.update_payment(student_id, amount)
+        loop = time.perf_counter() - start
+        db.conn.close()
+
+        db = make_db(os.path.join(tmp, "bulk.db"), students)
+        start = time.perf_counter()
+        db.bulk_update_payments(rows)
+        bulk = time.perf_counter() - start
+        db.conn.close()
+
+    print(f"{payments} payments over {students} students")
+    print(f"update_payment loop:  {loop:8.3f}s  {payments / loop:10.0f} rows/s")
+    print(f"bulk_update_payments: {bulk:8.3f}s  {payments / bulk:10.0f} rows/s  ({loop / bulk:.1f}x)")
+
+if __name__ == "__main__":
+    main()
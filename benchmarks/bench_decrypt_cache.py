@@ -0,0 +1,32 @@
+"""Decrypting 50k contacts cold versus warm through SecurityManager's cache.
+
+Usage: python benchmarks/bench_decrypt_cache.py [contacts]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:7.3f}s  {count / elapsed:10.0f} contacts/s")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    security = SecurityManager(Fernet.generate_key().decode(), cache_size=count)
+    encrypted = security.encrypt_many(f"parent{i}@example.com" for i in range(count))
+    print(f"{count} contacts")
+    timed("decrypt_data, cold", count, lambda: [security.decrypt_data(value) for value in encrypted])
+    timed("decrypt_data, warm", count, lambda: [security.decrypt_data(value) for value in encrypted])
+    security.clear_cache()
+    timed("decrypt_many, cold", count, lambda: security.decrypt_many(encrypted))
+    timed("decrypt_many, warm", count, lambda: security.decrypt_many(encrypted))
+
+if __name__ == "__main__":
+    main()
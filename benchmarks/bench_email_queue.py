@@ -0,0 +1,47 @@
+"""Messages/sec for connect-per-message send_email versus the pooled EmailQueue.
+
+Usage: python benchmarks/bench_email_queue.py [messages] [handshake_delay_seconds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from notifications import NotificationManager
+from smtp_stub import StubSMTPServer
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    server = StubSMTPServer(handshake_delay=delay).start()
+    notif = NotificationManager("bursar@example.com", "secret", "127.0.0.1", server.port, use_tls=False)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        notif.send_email(f"Student {i}", "Form 1", f"parent{i}@example.com", 1000, 1000, 1250000)
+    direct = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        notif.start_queue(os.path.join(tmp, "queue.db"), SecurityManager(Fernet.generate_key().decode()))
+        start = time.perf_counter()
+        for i in range(messages):
+            notif.queue_email(f"Student {i}", "Form 1", f"parent{i}@example.com", 1000, 1000, 1250000)
+        enqueue = time.perf_counter() - start
+        while notif.queue.pending_count():
+            time.sleep(0.01)
+        queued = time.perf_counter() - start
+        notif.queue.stop()
+        notif.queue.conn.close()
+    server.stop()
+
+    print(f"{messages} messages, simulated handshake {delay * 1000:.0f} ms, {server.delivered} delivered")
+    print(f"send_email (connect per message): {direct:7.3f}s  {messages / direct:8.1f} msg/s")
+    print(f"EmailQueue (shared session):      {queued:7.3f}s  {messages / queued:8.1f} msg/s")
+    print(f"caller blocked while enqueuing:   {enqueue * 1000 / messages:7.3f} ms/message")
+
+if __name__ == "__main__":
+    main()
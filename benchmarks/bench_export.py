@@ -0,0 +1,81 @@
+"""Rows/sec and peak RSS of streaming payment exports.
+
+Generates a database with about a million payments, then runs each export
+(CSV and XLSX, with and without decrypted contacts) in a fresh process so
+its peak resident memory can be read on its own.
+
+Usage: python benchmarks/bench_export.py [students] [payments_per_student]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from exports import ReportExporter
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def peak_rss_kb():
+    # ru_maxrss of a child starts at its parent's value, VmHWM starts fresh at exec
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def child(db_path, key, output, include_contacts):
+    db = DatabaseManager(db_path, SecurityManager(key), FEES)
+    exporter = ReportExporter(db)
+    baseline = peak_rss_kb()
+    start = time.perf_counter()
+    rows = exporter.export(output, include_contacts=include_contacts)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_kb()
+    print(json.dumps({"rows": rows, "seconds": elapsed, "peak_kb": peak, "growth_kb": peak - baseline}))
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    per_student = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        key = Fernet.generate_key().decode()
+        db_path = os.path.join(tmp, "school_fees.db")
+        db = DatabaseManager(db_path, SecurityManager(key), FEES)
+        start = time.perf_counter()
+        generate(db, FEES, students, per_student)
+        db.pool.close_all()
+        print(f"Generated {students * per_student:,} payments in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'export':<22} {'rows':>10} {'seconds':>8} {'rows/s':>9} {'peak RSS':>9} {'growth':>8} {'size':>8}")
+        for extension in (".csv", ".xlsx"):
+            for include_contacts in (False, True):
+                output = os.path.join(tmp, f"payments{extension}")
+                result = subprocess.run([sys.executable, __file__, "--child", db_path, key, output,
+                                         str(int(include_contacts))], capture_output=True, text=True, check=True)
+                stats = json.loads(result.stdout.strip().splitlines()[-1])
+                if extension == ".xlsx":
+                    with zipfile.ZipFile(output) as workbook:
+                        assert workbook.testzip() is None
+                label = f"{extension[1:]}{' + contacts' if include_contacts else ''}"
+                print(f"{label:<22} {stats['rows']:>10,} {stats['seconds']:>8.1f} {stats['rows'] / stats['seconds']:>9,.0f} "
+                      f"{stats['peak_kb'] / 1024:>7.1f}MB {stats['growth_kb'] / 1024:>6.1f}MB "
+                      f"{os.path.getsize(output) / 1024 / 1024:>6.1f}MB")
+                os.remove(output)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5] == "1")
+    else:
+        main()
@@ -0,0 +1,86 @@
+"""Federated query latency as the number of campus databases grows.
+
+Each campus is a synthetic database of the same size. For 1, 2, 4, ... shards
+it times a student search and the ledger totals fanned out in parallel
+(against querying the campuses one after another), and the streamed,
+merged reports of every payment and balance: time to the first row and
+throughput.
+
+Usage: python benchmarks/bench_federation.py [max_shards=8] [students_per_shard=20000] [payments=3]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from federation import CampusFederation
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+TERMS = ["Amani Mu", "Neema", "Juma Kimaro", "Grace M", "Peter S"]
+
+def median_ms(fn, iterations=40):
+    fn(0)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def stream(rows):
+    """Return (ms to the first row, total ms, rows)"""
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in rows:
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return (first or 0) * 1000, (time.perf_counter() - start) * 1000, count
+
+def main():
+    max_shards = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    payments = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    security = SecurityManager(Fernet.generate_key().decode())
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        start = time.perf_counter()
+        for shard in range(max_shards):
+            paths[f"Campus {shard + 1}"] = os.path.join(tmp, f"campus{shard + 1}.db")
+            db = DatabaseManager(paths[f"Campus {shard + 1}"], security, FEES)
+            generate(db, FEES, students, payments, seed=shard)
+            db.pool.close_all()
+        print(f"{max_shards} campuses of {students:,} students and {students * payments:,} payments "
+              f"generated in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'shards':>6} {'search':>9} {'serial':>9} {'totals':>9} {'serial':>9} "
+              f"{'payments first/total':>22} {'rows/s':>9} {'balances first/total':>22} {'rows/s':>9}")
+        shards = 1
+        while shards <= max_shards:
+            campuses = dict(list(paths.items())[:shards])
+            federation = CampusFederation(campuses, security, FEES)
+            serial = [DatabaseManager(path, security, FEES) for path in campuses.values()]
+            search = median_ms(lambda i: federation.search_students(TERMS[i % len(TERMS)]))
+            search_serial = median_ms(lambda i: [db.search_students(TERMS[i % len(TERMS)], 50) for db in serial])
+            totals = median_ms(lambda i: federation.totals())
+            totals_serial = median_ms(lambda i: [db.ledger.form_totals() for db in serial])
+            payments_first, payments_total, payment_rows = stream(federation.iter_payments())
+            balances_first, balances_total, balance_rows = stream(federation.iter_balances())
+            print(f"{shards:>6} {search:>7.2f}ms {search_serial:>7.2f}ms {totals:>7.2f}ms {totals_serial:>7.2f}ms "
+                  f"{payments_first:>9.1f}/{payments_total:>8.0f}ms {payment_rows / payments_total * 1000:>9,.0f} "
+                  f"{balances_first:>9.1f}/{balances_total:>8.0f}ms {balance_rows / balances_total * 1000:>9,.0f}")
+            federation.close()
+            for db in serial:
+                db.pool.close_all()
+            shards *= 2
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Payment history range queries and rollups over a large payments table.
+
+Builds a year of three terms and STUDENTS x PAYMENTS payments (5 million by
+default), then times PaymentHistory's listings and rollups uncached, cached
+and right after a payment has invalidated the cache. The comparisons are
+the same results computed the naive way: a date filter the index cannot
+use, OFFSET paging, and rollups grouped from payments instead of the
+ledger's daily_totals.
+
+Usage: python benchmarks/bench_history.py [students=100000] [payments=50]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from history import day_after
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def median_ms(fn, iterations=20):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def schedule_terms(db, year_start):
+    """Date the seeded fees from year_start and add second and third terms"""
+    academic_year = year_start.strftime("%Y")
+    with db.pool.transaction() as conn:
+        conn.execute("UPDATE fee_schedules SET academic_year=?, effective_date=?",
+                     (academic_year, year_start.strftime("%Y-%m-%d")))
+    for term, days in (("Term 2", 120), ("Term 3", 240)):
+        for form, fee in FEES.items():
+            db.fees.set_fee(form, fee, (year_start + timedelta(days=days)).strftime("%Y-%m-%d"), academic_year, term)
+
+def row(label, timing, naive=None):
+    uncached, cached, rows = timing
+    print(f"{label:<38} {uncached:9.2f} ms {cached:9.3f} ms"
+          + (f" {naive:10.1f} ms" if naive is not None else " " * 14) + f"  {rows:>5} rows")
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payments = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "fees.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+        year_start = datetime.now() - timedelta(days=300)
+        schedule_terms(db, year_start)
+        start = time.perf_counter()
+        generate(db, FEES, students, payments, term_start=year_start)
+        first, last = db.conn.execute("SELECT MIN(date), MAX(date) FROM payments").fetchone()
+        print(f"{students * payments:,} payments from {first[:10]} to {last[:10]} "
+              f"generated in {time.perf_counter() - start:.0f}s")
+        history = db.history
+        conn = db.conn
+        student = conn.execute("SELECT id FROM students ORDER BY id LIMIT 1 OFFSET ?", (students // 2,)).fetchone()[0]
+
+        def timed(fn):
+            """(uncached ms, cached ms, rows) for a history query"""
+            def uncached(i):
+                history.invalidate()
+                fn()
+            return median_ms(uncached, 10), median_ms(lambda i: fn()), len(fn())
+
+        print(f"{'query':<38} {'uncached':>12} {'cached':>12} {'naive':>13}")
+        week_end = (year_start + timedelta(days=60)).strftime("%Y-%m-%d")
+        week_start = (year_start + timedelta(days=54)).strftime("%Y-%m-%d")
+        month_start = (year_start + timedelta(days=30)).strftime("%Y-%m-%d")
+        for label, start_day, end_day in (("week", week_start, week_end), ("month", month_start, week_end)):
+            naive = median_ms(lambda i: conn.execute(
+                """SELECT p.id, p.date, p.student_id, s.name, s.form, p.amount FROM payments p
+                JOIN students s ON s.id = p.student_id WHERE substr(p.date, 1, 10) BETWEEN ? AND ?
+                ORDER BY p.date DESC, p.id DESC LIMIT 100""", (start_day, end_day)).fetchall(), 3)
+            row(f"first page, one {label}", timed(lambda: history.page(start=start_day, end=end_day)), naive)
+            count = conn.execute("SELECT COUNT(*) FROM payments WHERE date >= ? AND date < ?",
+                                 (start_day, day_after(end_day))).fetchone()[0]
+            print(f"{'':<38} ({count:,} payments in range)")
+
+        row("first page, Form 3, all dates", timed(lambda: history.page(form="Form 3")))
+        row(f"student {student}, all payments", timed(lambda: history.page(student_id=student)))
+
+        # A late page of the month: walk the keyset once to find it, then time fetching it both ways
+        before, pages = None, 1
+        while pages < 200:
+            rows = history.page(start=month_start, end=week_end, before=before)
+            if len(rows) < 100:
+                break
+            before, pages = (rows[-1][1], rows[-1][0]), pages + 1
+        naive = median_ms(lambda i: conn.execute(
+            """SELECT p.id, p.date, p.student_id, s.name, s.form, p.amount FROM payments p
+            JOIN students s ON s.id = p.student_id WHERE p.date >= ? AND p.date < ?
+            ORDER BY p.date DESC, p.id DESC LIMIT 100 OFFSET ?""",
+            (month_start, day_after(week_end), (pages - 1) * 100)).fetchall(), 5)
+        row(f"page {pages} of the month (keyset/OFFSET)",
+            timed(lambda: history.page(start=month_start, end=week_end, before=before)), naive)
+
+        year = (year_start.strftime("%Y-%m-%d"), (year_start + timedelta(days=364)).strftime("%Y-%m-%d"))
+        naive = median_ms(lambda i: conn.execute(
+            """SELECT substr(date, 1, 7) AS month, COUNT(*), SUM(amount) FROM payments
+            WHERE date >= ? AND date < ? GROUP BY month""", (year[0], day_after(year[1]))).fetchall(), 3)
+        months = history.monthly(None, None, *year)
+        assert months == conn.execute("""SELECT substr(date, 1, 7) AS month, COUNT(*), SUM(amount) FROM payments
+                                      WHERE date >= ? AND date < ? GROUP BY month ORDER BY month""",
+                                      (year[0], day_after(year[1]))).fetchall()
+        row("monthly rollup, school, one year", timed(lambda: history.monthly(None, None, *year)), naive)
+        naive = median_ms(lambda i: conn.execute(
+            """SELECT substr(p.date, 1, 7) AS month, COUNT(*), SUM(p.amount) FROM payments p
+            JOIN students s ON s.id = p.student_id WHERE s.form = ? GROUP BY month""", ("Form 2",)).fetchall(), 3)
+        row("monthly rollup, Form 2, all dates", timed(lambda: history.monthly(form="Form 2")), naive)
+        row("term rollup, school", timed(lambda: history.terms()))
+        row(f"monthly rollup, student {student}", timed(lambda: history.monthly(student_id=student)))
+        row(f"term rollup, student {student}", timed(lambda: history.terms(student_id=student)))
+
+        history.monthly(None, None, *year)
+        start = time.perf_counter()
+        db.update_payment(student, 1000)
+        months = history.monthly(None, None, *year)
+        print(f"payment then monthly rollup (invalidated)  {(time.perf_counter() - start) * 1000:.2f} ms")
+        db.pool.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Encryption-key rotation on a synthetic database: throughput, crash resume and desk latency.
+
+Contacts are generated under one key, then a rotation process is killed
+part way through and the rotation is resumed from its checkpoint on a
+background thread while the main thread keeps reading students, as the
+desk would. Finally every contact is checked against the new key alone.
+
+Usage: python benchmarks/bench_key_rotation.py [students=100000]
+"""
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from key_rotation import KeyRotation
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def rotate(path, key, old_key):
+    db = DatabaseManager(path, SecurityManager(key, previous_keys=[old_key]), FEES)
+    KeyRotation(db).run()
+
+def read_latencies(db, ids, until=None):
+    """get_student latencies in milliseconds, over ids or until the event is set"""
+    samples = []
+    for student_id in ids:
+        if until is not None and until():
+            break
+        start = time.perf_counter()
+        db.get_student(student_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def describe(samples):
+    samples = sorted(samples)
+    return (f"{len(samples):6} reads  p50 {statistics.median(samples):6.2f} ms  "
+            f"p95 {samples[int(len(samples) * 0.95)]:6.2f} ms  max {samples[-1]:6.2f} ms")
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    old_key, key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fees.db")
+        start = time.perf_counter()
+        generate(DatabaseManager(path, SecurityManager(old_key), FEES), FEES, students, 1)
+        print(f"{students:,} students generated under the old key in {time.perf_counter() - start:.1f}s")
+
+        # The desk after a restart with the new key; no cache, so every read decrypts
+        db = DatabaseManager(path, SecurityManager(key, cache_size=0, previous_keys=[old_key]), FEES)
+        rng = random.Random(0)
+        ids = [rng.randint(1, students) for _ in range(100000)]
+        print(f"idle, old-key contacts   {describe(read_latencies(db, ids[:2000]))}")
+
+        child = multiprocessing.get_context("spawn").Process(target=rotate, args=(path, key, old_key))
+        child.start()
+        while not (KeyRotation(db).checkpoint() or (0,))[0] >= students // 3 and child.is_alive():
+            time.sleep(0.05)
+        child.kill()
+        child.join()
+        last_id, rows, _, finished = KeyRotation(db).checkpoint()
+        print(f"rotation killed after student {last_id:,} ({rows:,} re-encrypted, finished={finished})")
+
+        rotation = KeyRotation(db)
+        start = time.perf_counter()
+        rotation.start()
+        samples = read_latencies(db, ids, lambda: not rotation._thread.is_alive())
+        rotation.stop()
+        elapsed = time.perf_counter() - start
+        print(f"resumed in background    {rotation.rows:,} students in {elapsed:.1f}s, "
+              f"{rotation.rows / elapsed:,.0f} rows/s")
+        print(f"desk during rotation     {describe(samples)}")
+        print(f"idle, new-key contacts   {describe(read_latencies(db, ids[:2000]))}")
+
+        total = db.conn.execute("SELECT rows FROM key_rotations WHERE key_id = ?", (rotation.key_id,)).fetchone()[0]
+        failed = rotation.verify()
+        email = db.get_student(students)[2]
+        print(f"checkpoint total {total:,} rows; {len(failed)} students still need the old key; "
+              f"student {students} email {email}")
+        assert not failed and email == f"parent{students}@example.com"
+
+if __name__ == "__main__":
+    main()
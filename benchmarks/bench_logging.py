@@ -0,0 +1,91 @@
+"""Caller-side cost of logging under the old and new logging setups.
+
+"before" is the former logging.basicConfig FileHandler, which formats and
+writes on the calling thread; "queue" and "queue+json" are logs.setup_logging
+with plain and JSON lines, which hand records to a QueueListener thread.
+Each setup runs in its own process and times a bare structured logging
+call, update_payment (one record per payment) and a chunked bulk import.
+For the queue setups the time the listener then needs to catch up is
+reported separately, since on a single core it competes with the caller.
+
+Usage: python benchmarks/bench_logging.py [payments]
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from logs import setup_logging
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def child(mode, tmp, payments):
+    log_file = os.path.join(tmp, f"{mode}.log")
+    listener = None
+    if mode == "before":
+        logging.basicConfig(filename=log_file, level=logging.INFO)
+    else:
+        listener = setup_logging({"file": log_file, "json": mode == "queue+json"})
+
+    def drained():
+        # Seconds until the listener has written everything logged so far
+        if listener is None:
+            return 0.0
+        start = time.perf_counter()
+        listener.stop()
+        listener.start()
+        return time.perf_counter() - start
+
+    db = DatabaseManager(os.path.join(tmp, f"{mode}.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+    db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                          [(f"Student {i}", f"Form {i % 4 + 1}", "", "") for i in range(1000)])
+    db.conn.commit()
+    results = {}
+
+    start = time.perf_counter()
+    for i in range(payments):
+        logging.info(f"Payment of {i:,} TSH recorded for student {i % 1000 + 1}",
+                     extra={"operation": "payment", "student_id": i % 1000 + 1, "amount": i, "duration_ms": 0.1})
+    results["log_call_us"] = (time.perf_counter() - start) / payments * 1e6
+    results["drain_s"] = drained()
+
+    start = time.perf_counter()
+    for i in range(payments // 10):
+        db.update_payment(i % 1000 + 1, 1000)
+    results["update_payment_per_s"] = payments // 10 / (time.perf_counter() - start)
+    results["drain_s"] += drained()
+
+    rows = [(i % 1000 + 1, 1000, "2026-01-15") for i in range(payments)]
+    start = time.perf_counter()
+    db.bulk_update_payments(rows, chunk_size=100)
+    results["bulk_import_s"] = time.perf_counter() - start
+    results["drain_s"] += drained()
+    db.pool.close_all()
+    print(json.dumps(results))
+
+def main():
+    payments = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for mode in ("before", "queue", "queue+json"):
+            output = subprocess.run([sys.executable, __file__, "--child", mode, tmp, str(payments)],
+                                    capture_output=True, text=True, check=True).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+    print(f"{'':<12} {'log call':>10} {'update_payment':>16} {'bulk import':>12} {'catch-up':>10}")
+    for mode, stats in results.items():
+        print(f"{mode:<12} {stats['log_call_us']:>8.1f}us {stats['update_payment_per_s']:>14,.0f}/s "
+              f"{stats['bulk_import_s']:>11.2f}s {stats['drain_s'] * 1000:>8.0f}ms")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,75 @@
+"""Overhead of the metrics instrumentation on common DatabaseManager calls.
+
+The fixed per-call cost of the timing wrapper is measured on a no-op
+function, where it is not lost in noise, and expressed as a share of each
+operation's undecorated time. Direct instrumented/undecorated timings are
+shown alongside.
+
+Usage: python benchmarks/bench_metrics_overhead.py [calls]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from metrics import metrics
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def timed_calls(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls
+
+def compare(raw, fn, calls, repeats=15):
+    """Best per-call times of raw and fn, measured in alternation"""
+    best = [float("inf")] * 2
+    for _ in range(repeats):
+        for slot, target in enumerate((raw, fn)):
+            best[slot] = min(best[slot], timed_calls(target, calls))
+    return best
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    def noop(i):
+        return i
+
+    base, wrapped = compare(noop, metrics.timed("bench.noop")(noop), calls * 10)
+    wrapper_cost = wrapped - base
+    print(f"timing wrapper: {wrapper_cost * 1e6:.2f}us per call")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        security = SecurityManager(Fernet.generate_key().decode())
+        db = DatabaseManager(os.path.join(tmp, "school_fees.db"), security, FEES)
+        contact = security.encrypt_data("parent@example.com")
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                              [(f"Student {i}", f"Form {i % 4 + 1}", contact, contact) for i in range(10000)])
+        db.conn.commit()
+
+        undecorated = {name: getattr(type(db), name).__wrapped__ for name in
+                       ("get_student", "get_students_page", "search_students", "update_payment")}
+        operations = {
+            "get_student": (lambda i: undecorated["get_student"](db, i % 10000 + 1),
+                            lambda i: db.get_student(i % 10000 + 1)),
+            "get_students_page": (lambda i: undecorated["get_students_page"](db, i % 9800, 200),
+                                  lambda i: db.get_students_page(i % 9800, 200)),
+            "search_students": (lambda i: undecorated["search_students"](db, "stud 12", 50),
+                                lambda i: db.search_students("stud 12", 50)),
+            "update_payment": (lambda i: undecorated["update_payment"](db, i % 10000 + 1, 100),
+                               lambda i: db.update_payment(i % 10000 + 1, 100)),
+        }
+        print(f"{'operation':<20} {'undecorated':>12} {'instrumented':>13} {'overhead':>9}")
+        for name, (raw, fn) in operations.items():
+            base, instrumented = compare(raw, fn, calls if name == "get_student" else calls // 50)
+            print(f"{name:<20} {base * 1e6:10.2f}us {instrumented * 1e6:11.2f}us {wrapper_cost / base * 100:8.2f}%")
+        db.pool.close_all()
+
+if __name__ == "__main__":
+    main()
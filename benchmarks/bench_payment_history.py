@@ -0,0 +1,50 @@
+"""Query plan and timing of get_payment_history before and after the
+idx_payments_student_date index from migration 3.
+
+Usage: python benchmarks/bench_payment_history.py [students] [payments_per_student]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+
+HISTORY_SQL = "SELECT date, amount FROM payments WHERE student_id=? ORDER BY date DESC, id DESC LIMIT ?"
+
+def report(db, label, lookups):
+    plan = db.conn.execute(f"EXPLAIN QUERY PLAN {HISTORY_SQL}", (1, -1)).fetchall()
+    start = time.perf_counter()
+    for student_id in lookups:
+        db.get_payment_history(student_id)
+    elapsed = (time.perf_counter() - start) / len(lookups) * 1000
+    print(f"{label:<16} {elapsed:8.3f} ms/lookup   plan: {'; '.join(row[-1] for row in plan)}")
+    return elapsed
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    per_student = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "history.db"), SecurityManager(Fernet.generate_key().decode()))
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                              [(f"Student {i}", "Form 1", "", "") for i in range(students)])
+        db.cursor.executemany("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                              ((random.randint(1, students), 1000, f"2024-{m % 12 + 1:02d}-01 08:00:00")
+                               for m in range(students * per_student)))
+        db.conn.commit()
+        lookups = [random.randint(1, students) for _ in range(200)]
+        print(f"{students * per_student} payments across {students} students")
+        db.conn.execute("DROP INDEX idx_payments_student_date")
+        before = report(db, "without index", lookups)
+        db.conn.execute("CREATE INDEX idx_payments_student_date ON payments(student_id, date)")
+        after = report(db, "with index", lookups)
+        print(f"speedup: {before / after:.0f}x")
+        db.conn.close()
+
+if __name__ == "__main__":
+    main()
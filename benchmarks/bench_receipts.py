@@ -0,0 +1,31 @@
+"""Receipts/sec for single-process versus pooled ReceiptRenderer.render_batch.
+
+Usage: python benchmarks/bench_receipts.py [receipts] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipts import ReceiptRenderer
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    payments = [(i, i, f"Student {i}", f"Form {i % 4 + 1}", 50000, 50000 * (i % 20 + 1), FEES[f"Form {i % 4 + 1}"],
+                 "2024-03-01 08:00:00") for i in range(1, count + 1)]
+    print(f"{count} receipts, {workers} workers")
+    for label, worker_count, merge in (("single process", 1, False), ("process pool", workers, False),
+                                       ("single, per form", 1, True), ("pool, per form", workers, True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            files = ReceiptRenderer(FEES, tmp).render_batch(payments, worker_count, merge)
+            elapsed = time.perf_counter() - start
+        print(f"{label:<18} {elapsed:7.2f}s  {count / elapsed:8.0f} receipts/s  {len(files)} files")
+
+if __name__ == "__main__":
+    main()
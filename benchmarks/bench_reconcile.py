@@ -0,0 +1,106 @@
+"""Reconciling a 100k-line bank statement against recorded payments.
+
+The statement mixes deposits that match a payment exactly, ones dated a
+day or two off, wrong amounts, deposits never recorded and repeated
+transaction IDs. Times a dry run, an applied run (recording matches and
+posting the rest) and a re-import of the same file, which must post
+nothing. A naive nested-loop match over a sample of lines is timed for
+comparison and extrapolated to the full statement.
+
+Usage: python benchmarks/bench_reconcile.py [lines] [students]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from reconcile import Reconciler, read_statement_lines
+from generate_dataset import generate
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def write_statement(path, payments, lines, students, seed=0):
+    """Write a statement built from recorded payments; returns the intended mix of line kinds"""
+    rng = random.Random(seed)
+    sample = rng.sample(payments, min(len(payments), int(lines * 0.85)))
+    kinds = Counter()
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Transaction ID", "Value Date", "Student ID", "Amount"])
+        for n in range(lines):
+            roll = rng.random()
+            if n < len(sample) and roll < 0.82:
+                _, student_id, amount, date = sample[n]
+                day = datetime.strptime(date[:10], "%Y-%m-%d")
+                if roll < 0.70:
+                    kind = "exact"
+                elif roll < 0.78:
+                    kind, day = "shifted", day + timedelta(days=rng.choice((-2, -1, 1, 2)))
+                else:
+                    kind, amount = "wrong amount", amount + 1000
+            elif roll < 0.95 or n == 0:
+                kind, student_id, amount = "new deposit", rng.randint(1, students), rng.randrange(50, 400) * 1000
+                day = datetime.strptime(payments[0][3][:10], "%Y-%m-%d") + timedelta(days=rng.randint(0, 60))
+            else:
+                kind = "repeated ID"
+                writer.writerow([f"TX{rng.randrange(n)}", day.strftime("%Y-%m-%d"), student_id, amount])
+                kinds[kind] += 1
+                continue
+            writer.writerow([f"TX{n}", day.strftime("%Y-%m-%d"), student_id, amount])
+            kinds[kind] += 1
+    return kinds
+
+def naive_match(lines, payments):
+    """Nested loop: scan every payment for each line"""
+    claimed = set()
+    for _, student_id, amount, date in lines:
+        for payment_id, p_student, p_amount, p_date in payments:
+            if p_student == student_id and p_amount == amount and p_date[:10] == date[:10] and payment_id not in claimed:
+                claimed.add(payment_id)
+                break
+    return len(claimed)
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 40000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+        _, payment_count = generate(db, FEES, students, 3)
+        payments = db.conn.execute("SELECT id, student_id, amount, date FROM payments").fetchall()
+        statement = os.path.join(tmp, "statement.csv")
+        kinds = write_statement(statement, payments, lines, students)
+        print(f"{payment_count:,} payments recorded; statement of {lines:,} lines: "
+              + ", ".join(f"{count:,} {kind}" for kind, count in kinds.items()))
+
+        reconciler = Reconciler(db)
+        for label, apply in (("dry run", False), ("apply", True), ("re-import", True)):
+            start = time.perf_counter()
+            report, unclaimed = reconciler.reconcile(read_statement_lines(statement), apply, statement)
+            elapsed = time.perf_counter() - start
+            counts = Counter(line[5] for line in report)
+            print(f"{label:<10} {elapsed:6.2f}s {lines / elapsed:9,.0f} lines/s  "
+                  + ", ".join(f"{count:,} {status}" for status, count in sorted(counts.items()))
+                  + f"; {len(unclaimed):,} payments not on statement")
+        assert "posted" not in counts and "unmatched" not in counts, "re-import posted payments twice"
+        drift = db.ledger.check_consistency()
+        print(f"ledger drift after posting: {len(drift)} aggregates")
+
+        sample = [(reference, int(student_id), int(amount), date)
+                  for reference, student_id, amount, date in list(read_statement_lines(statement))[:200]]
+        start = time.perf_counter()
+        naive_match(sample, payments)
+        per_line = (time.perf_counter() - start) / len(sample)
+        print(f"nested loop: {per_line * 1000:.1f} ms/line, about {per_line * lines:,.0f}s for {lines:,} lines")
+        db.pool.close_all()
+
+if __name__ == "__main__":
+    main()
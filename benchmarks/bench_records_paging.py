@@ -0,0 +1,48 @@
+"""Refresh latency and peak memory of the records view data path.
+
+Compares the old get_all_students() full load with the first keyset page
+used by UIManager.view_records, at 1k/10k/100k students.
+
+Usage: python benchmarks/bench_records_paging.py [sizes...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from ui import RECORDS_PAGE_SIZE
+
+FORMS = ["Form 1", "Form 2", "Form 3", "Form 4"]
+
+def measure(fetch):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = [(id, name, form, f"{paid:,}") for id, name, form, paid, *_ in fetch()]
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(rows)
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f"{'students':>9} {'full load':>12} {'full peak':>11} {'first page':>12} {'page peak':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db = DatabaseManager(os.path.join(tmp, f"{size}.db"), SecurityManager(Fernet.generate_key().decode()))
+            db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                                  [(f"Student {i}", FORMS[i % 4], "", "") for i in range(size)])
+            db.conn.commit()
+            full_time, full_peak, _ = measure(db.get_all_students)
+            page_time, page_peak, _ = measure(lambda: db.get_students_page(0, RECORDS_PAGE_SIZE))
+            print(f"{size:>9} {full_time * 1000:>10.1f}ms {full_peak / 1024:>9.0f}KB "
+                  f"{page_time * 1000:>10.2f}ms {page_peak / 1024:>9.0f}KB")
+            db.conn.close()
+
+if __name__ == "__main__":
+    main()
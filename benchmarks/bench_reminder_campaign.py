@@ -0,0 +1,68 @@
+"""Throughput and memory of a reminder campaign against the local SMTP stub.
+
+Runs half of the campaign, pauses it, then resumes it to check that every
+parent is reminded exactly once. Peak memory is traced with tracemalloc.
+
+Usage: python benchmarks/bench_reminder_campaign.py [students] [rate_per_second]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from notifications import NotificationManager
+from campaigns import ReminderCampaigns
+from smtp_stub import StubSMTPServer
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    server = StubSMTPServer().start()
+    notif = NotificationManager("bursar@example.com", "secret", "127.0.0.1", server.port, use_tls=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        security = SecurityManager(Fernet.generate_key().decode())
+        db = DatabaseManager(os.path.join(tmp, "school_fees.db"), security, FEES)
+        emails = security.encrypt_many(f"parent{i}@example.com" for i in range(students))
+        # Every fifth student has paid in full and must not be reminded
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone, total_paid) VALUES (?, ?, ?, ?, ?)",
+                              [(f"Student {i}", f"Form {i % 4 + 1}", email, email, 1500000 if i % 5 == 0 else i * 100)
+                               for i, email in enumerate(emails)])
+        db.conn.commit()
+        expected = db.count_outstanding_students(0)
+
+        campaigns = ReminderCampaigns(db, notif, FEES, rate=rate or None)
+        campaign_id = campaigns.create(0)
+        stop_event = threading.Event()
+
+        def progress(sent, failed, remaining):
+            if sent >= expected // 2:
+                stop_event.set()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        first, _ = campaigns.run(campaign_id, progress, stop_event)
+        status_after_pause = campaigns.get(campaign_id)[3]
+        sent, failed = campaigns.run(campaign_id)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        status = campaigns.get(campaign_id)[3]
+        db.pool.close_all()
+    server.stop()
+
+    print(f"{students} students, {expected} with a balance, rate limit {rate or 'none'}")
+    print(f"paused at {first} ({status_after_pause}), finished with {sent} sent, {failed} failed ({status})")
+    print(f"{server.delivered} delivered in {elapsed:.2f}s  {server.delivered / elapsed:8.1f} msg/s")
+    print(f"peak traced memory {peak / 1024 / 1024:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
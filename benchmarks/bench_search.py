@@ -0,0 +1,50 @@
+"""Query latency of FTS5 search_students versus the old LIKE '%term%' scan.
+
+Usage: python benchmarks/bench_search.py [sizes...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+
+FIRST = ["Amina", "John", "Neema", "Baraka", "Zawadi", "Juma", "Rehema", "Daudi", "Upendo", "Hassan"]
+LAST = ["Mwita", "Ali", "Kimaro", "Mushi", "Lyimo", "Massawe", "Otieno", "Shayo", "Temba", "Swai"]
+TERMS = ["ami", "john mw", "kima", "zawadi sw", "hass"]
+
+def like_scan(db, term):
+    db.cursor.execute("SELECT id, name, form, total_paid FROM students WHERE name LIKE ? OR id LIKE ?",
+                      (f"%{term}%", f"%{term}%"))
+    return db.cursor.fetchall()
+
+def timed(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for term in TERMS:
+            fn(term)
+    return (time.perf_counter() - start) / (repeat * len(TERMS)) * 1000
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [10000, 100000, 500000]
+    print(f"{'students':>9} {'LIKE scan':>11} {'FTS5 top 50':>12} {'exact ID':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db = DatabaseManager(os.path.join(tmp, f"{size}.db"), SecurityManager(Fernet.generate_key().decode()))
+            db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                                  [(f"{random.choice(FIRST)} {random.choice(FIRST)}{i} {random.choice(LAST)}",
+                                    "Form 1", "", "") for i in range(size)])
+            db.conn.commit()
+            like = timed(lambda term: like_scan(db, term), 5)
+            fts = timed(lambda term: db.search_students(term, 50))
+            exact = timed(lambda term: db.search_students(str(size // 2)))
+            print(f"{size:>9} {like:>9.2f}ms {fts:>10.2f}ms {exact:>8.3f}ms")
+            db.conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""SMS messages/sec through SMSQueue against a local Twilio stand-in.
+
+Queues a balance reminder for every student of a synthetic database, then
+drains the queue with one connection (the email queue's one-at-a-time
+pattern) and with larger connection pools, and finally against a provider
+rate limit with and without the queue's own rate matching it.
+
+Usage: python benchmarks/bench_sms.py [students=2000] [latency_seconds=0.05]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from sms import SMSGateway, SMSNotifier
+from generate_dataset import generate
+from twilio_stub import StubTwilioServer
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def drain(db, label, stub, connections, rate, provider_limit=None):
+    stub.reset(provider_limit)
+    with db.pool.transaction() as conn:
+        conn.execute("DELETE FROM sms_messages")
+    notifier = SMSNotifier(db, SMSGateway(stub.sid, stub.token, "+15005550006", stub.base_url, connections), rate,
+                           batch_size=200, retry_delay=1, poll_interval=0.05)
+    start = time.perf_counter()
+    queued = notifier.queue_reminders(0)
+    enqueued = time.perf_counter() - start
+    start = time.perf_counter()
+    notifier.queue.start()
+    while notifier.queue.pending_count():
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    notifier.queue.stop()
+    counts = notifier.queue.counts()
+    print(f"{label:<34} {queued / elapsed:8.1f} msg/s  {elapsed:6.2f}s  {len(stub.messages):5} accepted  "
+          f"{stub.throttled:4} throttled  {counts}  (queued in {enqueued * 1000:.0f} ms)")
+    assert counts == {"sent": queued} and len(stub.messages) == queued
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    stub = StubTwilioServer(latency=latency).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "fees.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+        generate(db, FEES, students, 1)
+        print(f"{students} reminders, simulated provider latency {latency * 1000:.0f} ms")
+        drain(db, "1 connection", stub, 1, None)
+        for connections in (4, 16, 32):
+            drain(db, f"{connections} connections", stub, connections, None)
+        limit = 100
+        drain(db, f"16 connections, provider {limit}/s", stub, 16, None, limit)
+        drain(db, f"16 connections, rate {limit * 0.9:.0f}/s", stub, 16, limit * 0.9, limit)
+    stub.stop()
+
+if __name__ == "__main__":
+    main()
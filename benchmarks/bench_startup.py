@@ -0,0 +1,101 @@
+"""Startup cost of the desktop application.
+
+Reports the slowest imports from python -X importtime, checks that heavy
+dependencies (reportlab, cryptography, asyncio, smtplib) are not loaded
+before they are needed, and, when a display is available, times running
+main.py until the login window is drawn. Exits non-zero on a regression.
+
+Usage: python benchmarks/bench_startup.py [import_budget_ms] [login_budget_ms]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# What main.py imports before showing the login window
+STARTUP_IMPORTS = "import main, tkinter, security, database, backups, notifications, campaigns, ui"
+DEFERRED = ("reportlab", "cryptography", "asyncio", "smtplib", "email.mime", "urllib.request")
+
+# Runs main.py as __main__, stopping once the login window has been drawn
+LOGIN_PROBE = """
+import os, runpy, sys, time, tkinter
+def mainloop(self, n=0):
+    self.update()
+    print(time.time() - float(sys.argv[1]))
+    self.destroy()
+tkinter.Tk.mainloop = mainloop
+sys.argv = [sys.argv[2]]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+def import_times():
+    """Return (total_ms, [(cumulative_ms, module)]) for the top-level startup imports"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_IMPORTS], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if len(name) - len(name.lstrip()) <= 1:
+            modules.append((int(parts[1]) / 1000, name.strip()))
+    return sum(ms for ms, _ in modules), sorted(modules, reverse=True)
+
+def loaded_deferred():
+    code = f"import sys; {STARTUP_IMPORTS}; print(' '.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                          check=True).stdout.split()
+
+def time_to_login():
+    from cryptography.fernet import Fernet
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "config.json"), "w") as f:
+            json.dump({"encryption_key": Fernet.generate_key().decode(),
+                       "email": {"sender": "bursar@example.com", "password": "secret"},
+                       "fee_structure": {"Form 1": 1250000, "Form 2": 1350000}}, f)
+        times = []
+        for _ in range(3):
+            result = subprocess.run([sys.executable, "-c", LOGIN_PROBE, str(time.time()), os.path.join(ROOT, "main.py")],
+                                    cwd=tmp, capture_output=True, text=True)
+            if result.returncode != 0:
+                return None, result.stderr.strip().splitlines()[-1]
+            times.append(float(result.stdout.strip()) * 1000)
+    return min(times), None
+
+def main():
+    import_budget = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    login_budget = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    failures = []
+
+    total, modules = min((import_times() for _ in range(3)), key=lambda result: result[0])
+    print(f"startup imports: {total:.1f} ms (budget {import_budget:.0f} ms)")
+    for ms, name in modules[:10]:
+        print(f"  {ms:8.1f} ms  {name}")
+    if total > import_budget:
+        failures.append(f"imports took {total:.1f} ms")
+
+    early = loaded_deferred()
+    print(f"deferred modules loaded at startup: {', '.join(early) or 'none'}")
+    if early:
+        failures.append(f"loaded before use: {', '.join(early)}")
+
+    login_ms, error = time_to_login()
+    if login_ms is None:
+        print(f"time to login window: skipped ({error})")
+    else:
+        print(f"time to login window: {login_ms:.1f} ms (budget {login_budget:.0f} ms)")
+        if login_ms > login_budget:
+            failures.append(f"login window took {login_ms:.1f} ms")
+
+    if failures:
+        sys.exit("Startup regression: " + "; ".join(failures))
+
+if __name__ == "__main__":
+    main()
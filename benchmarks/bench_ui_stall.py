@@ -0,0 +1,183 @@
+"""Tk event-loop stalls while the desk's long operations run, headless.
+
+A stand-in for Tk's mainloop runs after() callbacks on one thread, with a
+heartbeat scheduled every 10 ms; how late each heartbeat fires is how long
+a click or a repaint would have waited. The same heavy jobs -- a full
+backup, receipt renders, paging through the whole roster and a run of
+payments that queue emails -- are run inline on the loop (as the UI did
+before tasks.TaskExecutor) and through the executor, with receipts
+rendered on a worker thread or in a worker process.
+
+Usage: python benchmarks/bench_ui_stall.py [students=50000] [payments=3] [receipts=20]
+"""
+import heapq
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from backups import BackupManager
+from notifications import NotificationManager
+from receipts import ReceiptRenderer, render_pdf
+from tasks import Job, TaskExecutor
+from ui import RECORDS_PAGE_SIZE, UIManager
+from generate_dataset import generate
+from smtp_stub import StubSMTPServer
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+HEARTBEAT_MS = 10
+
+class FakeRoot:
+    """The part of tk.Tk that TaskExecutor uses, with a single-threaded loop like mainloop()"""
+
+    def __init__(self):
+        self.timers = []
+        self.ids = itertools.count()
+        self.cancelled = set()
+
+    def after(self, ms, fn, *args):
+        timer_id = next(self.ids)
+        heapq.heappush(self.timers, (time.perf_counter() + ms / 1000, timer_id, fn, args))
+        return timer_id
+
+    def after_idle(self, fn, *args):
+        return self.after(0, fn, *args)
+
+    def after_cancel(self, timer_id):
+        self.cancelled.add(timer_id)
+
+    def run(self, until):
+        while not until():
+            due, timer_id, fn, args = heapq.heappop(self.timers)
+            # Waiting in sleep releases the GIL, as Tk's select() does
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if timer_id in self.cancelled:
+                self.cancelled.discard(timer_id)
+                continue
+            fn(*args)
+
+class Heartbeat:
+    def __init__(self, root):
+        self.root = root
+        self.late = []
+        self.expected = None
+
+    def start(self):
+        self.expected = time.perf_counter() + HEARTBEAT_MS / 1000
+        self.root.after(HEARTBEAT_MS, self.beat)
+
+    def beat(self):
+        now = time.perf_counter()
+        self.late.append((now - self.expected) * 1000)
+        self.expected = now + HEARTBEAT_MS / 1000
+        self.root.after(HEARTBEAT_MS, self.beat)
+
+def workloads(db, backup, desk, renderer, receipts, student_ids):
+    """Return [(name, fn(job), process_args)]; process_args is set for work that can run in another process"""
+    def full_backup(job):
+        return backup.create_backup(progress=lambda remaining, total: job.report(total - remaining, total))
+
+    def page_roster(job):
+        after_id, rows = 0, 0
+        while True:
+            page = db.get_students_page(after_id, RECORDS_PAGE_SIZE)
+            rows += len(page)
+            if len(page) < RECORDS_PAGE_SIZE:
+                return rows
+            after_id = page[-1][0]
+
+    def payments(job):
+        return [UIManager.record_payment(desk, job, student_id, 50000) for student_id in student_ids]
+
+    jobs = [("full backup", full_backup, None), ("page roster", page_roster, None), ("payments", payments, None)]
+    for i in range(receipts):
+        filename, rows = renderer.prepare(i + 1, f"Student {i + 1}", "Form 1", 50000, 100000)
+        jobs.append((f"receipt {i + 1}", lambda job, filename=filename, rows=rows: render_pdf(filename, rows),
+                     (filename, rows)))
+    return jobs
+
+def summarize(label, heartbeat, elapsed):
+    late = sorted(heartbeat.late)
+    p99 = late[min(int(len(late) * 0.99), len(late) - 1)]
+    print(f"{label:<30} {elapsed:7.2f}s  {len(late):6} beats  p50 {statistics.median(late):7.2f} ms  "
+          f"p99 {p99:8.2f} ms  max {late[-1]:8.2f} ms")
+
+def run_inline(jobs):
+    root = FakeRoot()
+    heartbeat = Heartbeat(root)
+    heartbeat.start()
+    remaining = list(jobs)
+    job = Job(0, "inline")
+
+    def next_job():
+        # Each operation runs in a button's callback, one per turn of the loop
+        name, fn, process_args = remaining.pop(0)
+        fn(job)
+        if remaining:
+            root.after(0, next_job)
+
+    start = time.perf_counter()
+    root.after(HEARTBEAT_MS * 5, next_job)
+    root.run(lambda: not remaining)
+    return heartbeat, time.perf_counter() - start
+
+def run_executor(jobs, processes):
+    root = FakeRoot()
+    executor = TaskExecutor(root)
+    if processes:
+        # Start the worker process (and its reportlab import) up front, as the first receipt of the day would
+        executor.submit("warm up", len, [], process=True)
+        root.run(lambda: not executor.callbacks)
+    heartbeat = Heartbeat(root)
+    heartbeat.start()
+    finished = []
+    start = time.perf_counter()
+    for name, fn, process_args in jobs:
+        if processes and process_args is not None:
+            executor.submit(name, render_pdf, *process_args, process=True, on_done=finished.append,
+                            on_error=finished.append)
+        else:
+            executor.submit(name, fn, on_done=finished.append, on_error=finished.append)
+    root.run(lambda: len(finished) == len(jobs))
+    elapsed = time.perf_counter() - start
+    failed = [job for job in executor.jobs if job.state != "done" and job.name != "warm up"]
+    executor.shutdown(wait=True)
+    assert not failed, [(job.name, job.error) for job in failed]
+    return heartbeat, elapsed
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    payments = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    receipts = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    smtp = StubSMTPServer(handshake_delay=0.2).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "fees.db"), SecurityManager(Fernet.generate_key().decode()), FEES)
+        generate(db, FEES, students, payments, seed=0)
+        notif = NotificationManager("desk@example.com", "secret", "127.0.0.1", smtp.port, use_tls=False)
+        notif.start_queue(os.path.join(tmp, "outbox.db"), db.security)
+        desk = SimpleNamespace(db=db, notifiers=[notif])
+        backup = BackupManager(db, tmp)
+        renderer = ReceiptRenderer(FEES, tmp)
+        # reportlab is imported on first use; keep that out of every measurement
+        render_pdf(*renderer.prepare(0, "Warm Up", "Form 1", 0, 0))
+        jobs = workloads(db, backup, desk, renderer, receipts, range(1, 201))
+        print(f"{students:,} students, {students * payments:,} payments; full backup, roster paging, "
+              f"200 payments and {receipts} receipts; heartbeat every {HEARTBEAT_MS} ms")
+        summarize("inline on the Tk thread", *run_inline(jobs))
+        summarize("executor, receipts on threads", *run_executor(jobs, False))
+        summarize("executor, receipts in process", *run_executor(jobs, True))
+        notif.queue.stop()
+    smtp.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Pick password KDF costs that hit a target login latency on this machine.
+
+Prints a "password_hashing" section to paste into config.json.
+
+Usage: python benchmarks/calibrate_password_hashing.py [target_ms] [scrypt|pbkdf2_sha256]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+
+def cost_ms(security, params, repeat=3):
+    stored = security.hash_password("calibration-password", params)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        security.check_password("calibration-password", stored)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    algorithm = sys.argv[2] if len(sys.argv) > 2 else "scrypt"
+    security = SecurityManager(Fernet.generate_key().decode())
+    chosen = None
+    if algorithm == "scrypt":
+        for log_n in range(12, 21):
+            params = {"algorithm": "scrypt", "n": 2 ** log_n, "r": 8, "p": 1}
+            elapsed = cost_ms(security, params)
+            print(f"scrypt n=2**{log_n:<2} {elapsed:8.1f} ms")
+            if elapsed > target:
+                break
+            chosen = params
+    else:
+        iterations = 100000
+        elapsed = cost_ms(security, {"algorithm": algorithm, "iterations": iterations})
+        iterations = int(iterations * target / elapsed) // 1000 * 1000
+        chosen = {"algorithm": algorithm, "iterations": iterations}
+        print(f"pbkdf2_sha256 iterations={iterations}: {cost_ms(security, chosen):.1f} ms")
+    if chosen is None:
+        print("Even the cheapest setting exceeds the target; the defaults are kept")
+        return
+    print(json.dumps({"password_hashing": chosen}, indent=4))
+
+if __name__ == "__main__":
+    main()
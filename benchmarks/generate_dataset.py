@@ -0,0 +1,81 @@
+"""Fill a fee database with synthetic students and payments.
+
+Contacts are encrypted with the configured key exactly as the application
+stores them, and payment totals, the search index and the fee ledger are
+all consistent, so the result can be opened with main.py. The same seed
+always produces the same data.
+
+Usage: python benchmarks/generate_dataset.py STUDENTS PAYMENTS_PER_STUDENT [--output school_fees.db] [--seed 0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from security import SecurityManager
+from database import DatabaseManager, DATE_FORMAT
+
+FIRST_NAMES = ["Amani", "Baraka", "Neema", "Juma", "Rehema", "Daudi", "Zawadi", "Faraja", "Halima", "Elia",
+               "Upendo", "Salim", "Imani", "Tumaini", "Mwajuma", "Hassani", "Grace", "Joseph", "Esther", "Peter"]
+LAST_NAMES = ["Mushi", "Mwakyusa", "Kimaro", "Said", "Massawe", "Lyimo", "Mbwambo", "Nyerere", "Shirima",
+              "Kapinga", "Mollel", "Swai", "Temba", "Urassa", "Makame", "Chuwa", "Minja", "Ngowi", "Mrema", "Kisanga"]
+
+def generate(db, fee_structure, students, payments_per_student, seed=0, chunk_size=5000, term_start=None):
+    """Insert students and payments into db and return (students, payments) added"""
+    rng = random.Random(seed)
+    forms = list(fee_structure)
+    term_start = term_start or datetime.now() - timedelta(days=90)
+    first_id = (db.conn.execute("SELECT MAX(id) FROM students").fetchone()[0] or 0) + 1
+    payments = 0
+    for offset in range(0, students, chunk_size):
+        count = min(chunk_size, students - offset)
+        ids = range(first_id + offset, first_id + offset + count)
+        contacts = db.security.encrypt_many(value for student_id in ids for value in
+                                            (f"parent{student_id}@example.com", f"+2557{student_id:08d}"))
+        student_rows = []
+        payment_rows = []
+        for index, student_id in enumerate(ids):
+            form = forms[student_id % len(forms)]
+            # Each payment is a share of the fee; some students end up fully paid
+            amounts = [rng.randrange(50, 400) * 1000 for _ in range(payments_per_student)]
+            day = term_start
+            for amount in amounts:
+                day += timedelta(days=rng.randint(0, 10), minutes=rng.randint(0, 600))
+                payment_rows.append((student_id, amount, day.strftime(DATE_FORMAT)))
+            student_rows.append((student_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", form,
+                                 contacts[2 * index], contacts[2 * index + 1], sum(amounts)))
+        with db.pool.transaction() as conn:
+            conn.executemany("""INSERT INTO students (id, name, form, parent_email, parent_phone, total_paid)
+                             VALUES (?, ?, ?, ?, ?, ?)""", student_rows)
+            conn.executemany("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)", payment_rows)
+        payments += len(payment_rows)
+    if db.ledger:
+        db.ledger.rebuild()
+    db.conn.execute("ANALYZE")
+    return students, payments
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic school fee database")
+    parser.add_argument("students", type=int)
+    parser.add_argument("payments", type=int, help="Payments per student")
+    parser.add_argument("--output", default="school_fees.db")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Replace an existing output database")
+    args = parser.parse_args()
+
+    from main import load_config
+    config = load_config()
+    if os.path.exists(args.output):
+        if not args.force:
+            sys.exit(f"{args.output} exists; pass --force to replace it")
+        for path in (args.output, f"{args.output}-wal", f"{args.output}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    db = DatabaseManager(args.output, SecurityManager(config["encryption_key"]), config["fee_structure"])
+    start = time.perf_counter()
+    students, payments = generate(db, config["fee_structure"], args.students, args.payments, args.seed)
+    print(f"Wrote {students} students and {payments} payments to {args.output} in {time.perf_counter() - start:.1f}s")
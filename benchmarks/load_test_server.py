@@ -0,0 +1,91 @@
+"""Load test for the FeeServer HTTP API.
+
+Starts a server on a temporary database, then drives concurrent simulated
+cashiers (each a thread with a keep-alive connection) that look students up
+and post payments. Reports p50/p99 latency and payments/sec.
+
+Usage: python benchmarks/load_test_server.py [cashiers] [payments_per_cashier]
+"""
+import asyncio
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from server import FeeServer
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+STUDENTS = 5000
+
+def start_server(db, port):
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_until_complete(FeeServer(db).serve("127.0.0.1", port))
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    time.sleep(0.2)
+
+def cashier(port, payments, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for _ in range(payments):
+        student_id = random.randint(1, STUDENTS)
+        start = time.perf_counter()
+        conn.request("GET", f"/students/{student_id}")
+        lookup = conn.getresponse()
+        lookup.read()
+        conn.request("POST", "/payments", json.dumps({"student_id": student_id, "amount": 1000}),
+                     {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if lookup.status != 200 or response.status != 201:
+            errors.append((lookup.status, response.status))
+    conn.close()
+
+def main():
+    cashiers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_cashier = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        security = SecurityManager(Fernet.generate_key().decode())
+        db = DatabaseManager(os.path.join(tmp, "school_fees.db"), security, FEES)
+        contact = security.encrypt_data("parent@example.com")
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                              [(f"Student {i}", f"Form {i % 4 + 1}", contact, contact) for i in range(STUDENTS)])
+        db.conn.commit()
+        db.ledger.rebuild()
+        port = 18765 + os.getpid() % 1000
+        start_server(db, port)
+
+        latencies, errors = [], []
+        threads = [threading.Thread(target=cashier, args=(port, per_cashier, latencies, errors))
+                   for _ in range(cashiers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        posted = db.conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+
+    latencies.sort()
+    print(f"{cashiers} cashiers x {per_cashier} lookup+payment round trips")
+    print(f"p50 {statistics.median(latencies) * 1000:7.2f} ms   p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms")
+    print(f"{posted / elapsed:.0f} payments/s, {posted} recorded, {len(errors)} errors")
+
+if __name__ == "__main__":
+    main()
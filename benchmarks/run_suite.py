@@ -0,0 +1,142 @@
+"""End-to-end benchmark suite on a synthetic dataset.
+
+Builds a database with generate_dataset.generate (or uses --db), times the
+main operations and writes the results as JSON, tagged with the current git
+commit, to benchmarks/results/. Pass --compare with an earlier results file
+to print the change per operation.
+
+Usage: python benchmarks/run_suite.py [--students 10000] [--payments 5] [--compare results/old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+from backups import BackupManager
+from receipts import ReceiptRenderer
+from generate_dataset import generate, FIRST_NAMES
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+
+def measure(fn, iterations, warmup=1):
+    """Return latency statistics in milliseconds for iterations calls of fn(i)"""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"iterations": iterations, "min_ms": samples[0], "median_ms": statistics.median(samples),
+            "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)], "max_ms": samples[-1],
+            "mean_ms": statistics.fmean(samples)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(db, tmp, scale):
+    students = db.conn.execute("SELECT MAX(id) FROM students").fetchone()[0]
+    rng = random.Random(1)
+    ids = [rng.randint(1, students) for _ in range(1000)]
+    renderer = ReceiptRenderer(FEES, os.path.join(tmp, "receipts"))
+    backups = BackupManager(db, os.path.join(tmp, "backups"))
+    os.makedirs(backups.backup_dir, exist_ok=True)
+    os.makedirs(renderer.output_dir, exist_ok=True)
+    receipt_rows = db.get_receipt_payments()[:200]
+
+    cases = {
+        "update_payment": (lambda i: db.update_payment(ids[i % len(ids)], 1000), 500),
+        "search_students.name": (lambda i: db.search_students(FIRST_NAMES[i % len(FIRST_NAMES)][:3], 50), 200),
+        "search_students.id": (lambda i: db.search_students(str(ids[i % len(ids)])), 500),
+        "get_all_students": (lambda i: db.get_all_students(), 5 if scale > 50000 else 20),
+        "get_students_page": (lambda i: db.get_students_page(ids[i % len(ids)], 200), 200),
+        "get_payment_history": (lambda i: db.get_payment_history(ids[i % len(ids)]), 500),
+        "get_student": (lambda i: db.get_student(ids[i % len(ids)]), 500),
+        "create_backup": (lambda i: backups.create_backup(), 3),
+        "receipt.render": (lambda i: renderer.render(ids[i % len(ids)], "Benchmark Student", "Form 1", 1000, 2000), 50),
+        "receipt.render_batch_200": (lambda i: renderer.render_batch(receipt_rows, workers=1), 3),
+    }
+    results = {}
+    for name, (fn, iterations) in cases.items():
+        results[name] = measure(fn, iterations)
+        print(f"  {name:<26} median {results[name]['median_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms")
+    return results
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nChange in median versus {previous.get('commit')} ({os.path.basename(previous_path)}):")
+    for name, stats in results["operations"].items():
+        before = previous["operations"].get(name)
+        if before:
+            change = (stats["median_ms"] - before["median_ms"]) / before["median_ms"] * 100
+            print(f"  {name:<26} {before['median_ms']:9.3f} -> {stats['median_ms']:9.3f} ms  {change:+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark suite")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--payments", type=int, default=5, help="Payments per student")
+    parser.add_argument("--db", help="Benchmark a copy of this existing database instead of generating one")
+    parser.add_argument("--key", help="Encryption key of --db")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "school_fees.db")
+        security = SecurityManager(args.key or Fernet.generate_key().decode())
+        if args.db:
+            source, target = sqlite3.connect(args.db), sqlite3.connect(path)
+            source.backup(target)
+            source.close()
+            target.close()
+            db = DatabaseManager(path, security, FEES)
+        else:
+            db = DatabaseManager(path, security, FEES)
+            start = time.perf_counter()
+            generate(db, FEES, args.students, args.payments)
+            print(f"Generated {args.students} students x {args.payments} payments "
+                  f"in {time.perf_counter() - start:.1f}s")
+        students, payments = db.conn.execute("SELECT (SELECT COUNT(*) FROM students), "
+                                             "(SELECT COUNT(*) FROM payments)").fetchone()
+        operations = run(db, tmp, students)
+        db.pool.close_all()
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dataset": {"students": students, "payments": payments},
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                        "platform": platform.platform(), "cpus": os.cpu_count()},
+        "operations": operations,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
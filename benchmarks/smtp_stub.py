@@ -0,0 +1,61 @@
+"""Minimal local SMTP server for exercising NotificationManager offline.
+
+Accepts any AUTH credentials and counts delivered messages. handshake_delay
+simulates the TLS + login round trips of a real provider.
+"""
+import socketserver
+import threading
+import time
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.wfile.write(b"250-stub\r\n250-AUTH PLAIN LOGIN\r\n250 OK\r\n")
+            elif command.startswith("AUTH"):
+                time.sleep(self.server.handshake_delay)
+                self.reply("235 Authenticated")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.delivered += 1
+                self.reply("250 Queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, handshake_delay=0.0):
+        super().__init__((host, port), _Handler)
+        self.handshake_delay = handshake_delay
+        self.delivered = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
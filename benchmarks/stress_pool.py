@@ -0,0 +1,98 @@
+"""Concurrency stress test for DatabaseManager on the connection pool.
+
+Parallel reader threads page, search and look up students while writer
+threads post payments. Reports throughput and fails if any thread raised
+(e.g. sqlite3.ProgrammingError) or if a payment update was lost.
+
+Usage: python benchmarks/stress_pool.py [seconds] [readers] [writers]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from security import SecurityManager
+from database import DatabaseManager
+
+FEES = {"Form 1": 1250000, "Form 2": 1350000, "Form 3": 1450000, "Form 4": 1500000}
+STUDENTS = 2000
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    with tempfile.TemporaryDirectory() as tmp:
+        security = SecurityManager(Fernet.generate_key().decode())
+        db = DatabaseManager(os.path.join(tmp, "school_fees.db"), security, FEES)
+        contact = security.encrypt_data("parent@example.com")
+        db.cursor.executemany("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                              [(f"Student {i}", f"Form {i % 4 + 1}", contact, contact) for i in range(STUDENTS)])
+        db.conn.commit()
+        db.ledger.rebuild()
+
+        stop = threading.Event()
+        errors = []
+        counts = Counter()
+        posted = Counter()
+        lock = threading.Lock()
+
+        def reader():
+            done = 0
+            try:
+                while not stop.is_set():
+                    db.get_students_page(random.randint(0, STUDENTS), 50)
+                    db.search_students(f"student {random.randint(1, 999)}", 20)
+                    db.get_student(random.randint(1, STUDENTS))
+                    db.get_payment_history(random.randint(1, STUDENTS))
+                    done += 4
+            except Exception as e:
+                errors.append(repr(e))
+            with lock:
+                counts["reads"] += done
+
+        def writer():
+            mine = Counter()
+            try:
+                while not stop.is_set():
+                    student_id = random.randint(1, STUDENTS)
+                    db.update_payment(student_id, 1000)
+                    mine[student_id] += 1000
+            except Exception as e:
+                errors.append(repr(e))
+            with lock:
+                posted.update(mine)
+                counts["writes"] += sum(mine.values()) // 1000
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        stored = dict(db.conn.execute("SELECT id, total_paid FROM students WHERE total_paid > 0"))
+        from_payments = dict(db.conn.execute("SELECT student_id, SUM(amount) FROM payments GROUP BY student_id"))
+        lost = sum(1 for student_id, amount in posted.items() if stored.get(student_id) != amount)
+        mismatched = sum(1 for student_id, amount in from_payments.items() if stored.get(student_id) != amount)
+        drift = db.ledger.check_consistency()
+
+    print(f"{readers} readers, {writers} writers, {seconds:.0f}s")
+    print(f"reads:  {counts['reads'] / seconds:10.0f} ops/s")
+    print(f"writes: {counts['writes'] / seconds:10.0f} payments/s")
+    print(f"errors: {len(errors)}  lost updates: {lost}  total_paid/payments mismatches: {mismatched}  "
+          f"ledger drift: {len(drift)}")
+    for error in errors[:5]:
+        print(f"  {error}")
+    if errors or lost or mismatched or drift:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
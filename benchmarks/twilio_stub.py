@@ -0,0 +1,108 @@
+"""Minimal local stand-in for Twilio's Messages API, for exercising sms.py offline.
+
+Accepts POST /2010-04-01/Accounts/{sid}/Messages.json with HTTP basic auth
+and keep-alive connections. latency simulates the provider's response
+time; rate_limit (messages per second) answers the excess with 429 and a
+Retry-After header; numbers that are not +E.164 are rejected with Twilio's
+error 21211.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from base64 import b64decode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body leave in one write, as a real server's would, instead of tripping delayed ACKs
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, payload, headers=()):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        body = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode())
+        match = re.fullmatch(r"/2010-04-01/Accounts/([^/]+)/Messages\.json", self.path)
+        if not match:
+            return self.reply(404, {"code": 20404, "message": "The requested resource was not found"})
+        scheme, _, credentials = (self.headers.get("Authorization") or "").partition(" ")
+        if scheme != "Basic" or b64decode(credentials).decode() != f"{server.sid}:{server.token}" \
+                or match.group(1) != server.sid:
+            return self.reply(401, {"code": 20003, "message": "Authenticate"})
+        time.sleep(server.latency)
+        if not server.take_slot():
+            with server.lock:
+                server.throttled += 1
+            return self.reply(429, {"code": 20429, "message": "Too Many Requests"}, [("Retry-After", "1")])
+        to = body.get("To", [""])[0]
+        if not re.fullmatch(r"\+\d{10,15}", to):
+            with server.lock:
+                server.rejected += 1
+            return self.reply(400, {"code": 21211, "message": f"The 'To' number {to} is not a valid phone number."})
+        sid = f"SM{uuid.uuid4().hex}"
+        with server.lock:
+            server.messages.append((sid, to, body.get("Body", [""])[0]))
+        self.reply(201, {"sid": sid, "status": "queued", "to": to, "from": body.get("From", [""])[0]})
+
+class StubTwilioServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, rate_limit=None, sid="ACtest", token="secret"):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.sid = sid
+        self.token = token
+        self.messages = []
+        self.throttled = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self._window = (0, 0)
+
+    def reset(self, rate_limit=None):
+        with self.lock:
+            self.rate_limit = rate_limit
+            self.messages.clear()
+            self.throttled = self.rejected = 0
+            self._window = (0, 0)
+
+    def take_slot(self):
+        """Count a message against this second's allowance; False once rate_limit is used up"""
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            second, used = self._window
+            now = int(time.monotonic())
+            if now != second:
+                second, used = now, 0
+            if used >= self.rate_limit:
+                return False
+            self._window = (second, used + 1)
+            return True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
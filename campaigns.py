@@ -0,0 +1,156 @@
+import threading
+import time
+from datetime import datetime
+from string import Template
+from metrics import metrics
+import logging
+
+DEFAULT_SUBJECT = "School Fee Balance Reminder"
+DEFAULT_TEMPLATE = """Dear Parent,
+
+This is a reminder that $name ($form) has an outstanding fee balance.
+Total Paid: $total_paid TSH
+Remaining Balance: $balance TSH
+
+Please settle the balance at the school office at your earliest convenience.
+
+Thank you,
+School Administration"""
+
+class ReminderCampaigns:
+    """Outstanding-balance reminder emails to every parent above a threshold.
+
+    Recipients are streamed from the database in id order and the position
+    of the last one handled is checkpointed after every message, so a
+    stopped or crashed campaign resumes where it left off. rate caps the
+    number of messages sent per second (None for no limit).
+    """
+
+    def __init__(self, db_manager, notif_manager, fee_structure, rate=5, batch_size=200, max_per_session=100):
+        self.db = db_manager
+        self.notif = notif_manager
+        self.fee_structure = fee_structure
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_per_session = max_per_session
+
+    def create(self, threshold, template=DEFAULT_TEMPLATE, subject=DEFAULT_SUBJECT):
+        # Fail now on a malformed template rather than once per recipient
+        Template(template).substitute(name="", form="", total_paid="", balance="", required_fee="")
+        with self.db.pool.transaction() as conn:
+            cursor = conn.execute("""INSERT INTO campaigns (subject, template, threshold, created)
+                                  VALUES (?, ?, ?, ?)""",
+                                  (subject, template, threshold, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        logging.info(f"Reminder campaign {cursor.lastrowid} created for balances above {threshold:,} TSH")
+        return cursor.lastrowid
+
+    def get(self, campaign_id):
+        """Return (id, subject, threshold, status, last_student_id, sent, failed, created)"""
+        return self.db.conn.execute("""SELECT id, subject, threshold, status, last_student_id, sent, failed, created
+                                    FROM campaigns WHERE id=?""", (campaign_id,)).fetchone()
+
+    def unfinished(self):
+        return self.db.conn.execute("""SELECT id, subject, threshold, status, last_student_id, sent, failed, created
+                                    FROM campaigns WHERE status != 'completed' ORDER BY id""").fetchall()
+
+    def failures(self, campaign_id):
+        return self.db.conn.execute("SELECT student_id, error FROM campaign_failures WHERE campaign_id=?",
+                                    (campaign_id,)).fetchall()
+
+    def remaining(self, campaign_id):
+        _, _, threshold, _, last_student_id, _, _, _ = self.get(campaign_id)
+        return self.db.count_outstanding_students(threshold, last_student_id)
+
+    def render(self, template, subject, name, form, email, total_paid, balance):
+        from email.mime.text import MIMEText
+        msg = MIMEText(Template(template).substitute(
+            name=name, form=form, total_paid=f"{total_paid:,}", balance=f"{balance:,}",
+            required_fee=f"{self.fee_structure.get(form, 0):,}"))
+        msg['Subject'] = subject
+        msg['From'] = self.notif.email_sender
+        msg['To'] = email
+        return msg
+
+    def run(self, campaign_id, progress=None, stop_event=None):
+        """Send the campaign's remaining messages and return (sent, failed).
+
+        progress(sent, failed, remaining) is called after each message from
+        the calling thread. Setting stop_event pauses the campaign; run() it
+        again to resume.
+        """
+        import smtplib
+        stop_event = stop_event or threading.Event()
+        subject, template, threshold, last_student_id, sent, failed = self.db.conn.execute(
+            "SELECT subject, template, threshold, last_student_id, sent, failed FROM campaigns WHERE id=?",
+            (campaign_id,)).fetchone()
+        remaining = self.db.count_outstanding_students(threshold, last_student_id)
+        self._set_status(campaign_id, "running")
+        interval = 1 / self.rate if self.rate else 0
+        next_send = time.monotonic()
+        server = None
+        sent_in_session = 0
+        try:
+            for batch in self.db.iter_outstanding_students(threshold, last_student_id, self.batch_size):
+                for student_id, name, form, total_paid, balance, email in batch:
+                    if stop_event.is_set():
+                        self._set_status(campaign_id, "paused")
+                        logging.info(f"Reminder campaign {campaign_id} paused after student {last_student_id}")
+                        return sent, failed
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        stop_event.wait(delay)
+                    next_send = max(next_send + interval, time.monotonic())
+                    error = None
+                    try:
+                        msg = self.render(template, subject, name, form, email, total_paid, balance)
+                        if server is None or sent_in_session >= self.max_per_session:
+                            if server:
+                                self._close(server)
+                            server = self.notif.connect()
+                            sent_in_session = 0
+                        with metrics.timer("email.reminder_send"):
+                            server.sendmail(self.notif.email_sender, [email], msg.as_string())
+                        sent_in_session += 1
+                    except Exception as e:
+                        error = str(e)
+                        logging.error(f"Reminder to {email} failed: {error}",
+                                      extra={"operation": "reminder", "campaign_id": campaign_id, "student_id": student_id})
+                        if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)) and server:
+                            self._close(server)
+                            server = None
+                    self._checkpoint(campaign_id, student_id, error)
+                    last_student_id = student_id
+                    if error is None:
+                        sent += 1
+                    else:
+                        failed += 1
+                    remaining -= 1
+                    if progress:
+                        progress(sent, failed, max(remaining, 0))
+        finally:
+            if server:
+                self._close(server)
+        self._set_status(campaign_id, "completed")
+        logging.info(f"Reminder campaign {campaign_id} completed: {sent} sent, {failed} failed",
+                     extra={"operation": "reminder_campaign", "campaign_id": campaign_id, "rows": sent + failed})
+        return sent, failed
+
+    def _checkpoint(self, campaign_id, student_id, error):
+        with self.db.pool.transaction() as conn:
+            column = "sent" if error is None else "failed"
+            conn.execute(f"UPDATE campaigns SET last_student_id=?, {column}={column}+1 WHERE id=?",
+                         (student_id, campaign_id))
+            if error is not None:
+                conn.execute("INSERT OR REPLACE INTO campaign_failures (campaign_id, student_id, error) VALUES (?, ?, ?)",
+                             (campaign_id, student_id, error))
+
+    def _set_status(self, campaign_id, status):
+        finished = datetime.now().strftime("%Y-%m-%d %H:%M:%S") if status == "completed" else None
+        with self.db.pool.transaction() as conn:
+            conn.execute("UPDATE campaigns SET status=?, finished=? WHERE id=?", (status, finished, campaign_id))
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
@@ -1,107 +1,416 @@
+import re
 import sqlite3
+import time
 from datetime import datetime
-from security import SecurityManager
+from security import SecurityManager, check_password_policy
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
+from ledger import FeeLedger
+from fees import FeeSchedule
+from history import PaymentHistory
+from pool import ConnectionPool
+from metrics import instrumented
 import logging
 
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+INPUT_DATE_FORMATS = (DATE_FORMAT, "%Y-%m-%d", "%d/%m/%Y", "%d/%m/%Y %H:%M")
+# Listing rows: (id, name, form, paid this academic year, balance)
+STUDENT_ROW = "b.student_id, b.name, b.form, b.paid, b.balance"
+
+def normalize_date(value):
+    """Return value as a DATE_FORMAT string, now() when empty, or None if unparseable"""
+    if value is None or not str(value).strip():
+        return datetime.now().strftime(DATE_FORMAT)
+    for fmt in INPUT_DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    return None
+
+@instrumented("db")
 class DatabaseManager:
-    def __init__(self, db_name, security_manager):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db_name, security_manager, fee_structure=None):
+        self.db_name = db_name
+        self.pool = ConnectionPool(db_name)
         self.security = security_manager
         self.setup_database()
-        logging.basicConfig(filename='school_fee_system.log', level=logging.INFO)
+        self.fees = FeeSchedule(self.pool)
+        self.ledger = None
+        if fee_structure is not None:
+            # config.json's fee_structure only seeds a new database; the schedule table is authoritative
+            self.fees.seed(fee_structure)
+            self.ledger = FeeLedger(self.pool, self.fees)
+            self.ledger.ensure_built()
+        self.history = PaymentHistory(self.pool, self.ledger)
+
+    @property
+    def conn(self):
+        """The calling thread's connection; write through self.pool.transaction()"""
+        return self.pool.connection()
+
+    @property
+    def cursor(self):
+        return self.conn.cursor()
 
     def setup_database(self):
         try:
-            # Updated users table to include security question and answer
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS users
-                               (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT, 
-                               security_question TEXT, security_answer TEXT)''')
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS students
-                               (id INTEGER PRIMARY KEY, name TEXT, form TEXT, 
-                               parent_email TEXT, parent_phone TEXT, 
-                               total_paid INTEGER DEFAULT 0)''')
-            self.cursor.execute('''CREATE TABLE IF NOT EXISTS payments
-                               (id INTEGER PRIMARY KEY, student_id INTEGER, 
-                               amount INTEGER, date TEXT,
-                               FOREIGN KEY(student_id) REFERENCES students(id))''')
-            self.conn.commit()
+            if get_schema_version(self.conn) < SCHEMA_VERSION:
+                with self.pool.write_lock:
+                    migrate(self.conn, backup_path=None if self.db_name == ":memory:" else f"{self.db_name}.pre-migration.bak")
         except sqlite3.Error as e:
             logging.error(f"Database setup failed: {str(e)}")
+        self.fts_enabled = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name='students_fts'").fetchone() is not None
 
     def has_users(self):
-        self.cursor.execute("SELECT COUNT(*) FROM users")
-        return self.cursor.fetchone()[0] > 0
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] > 0
 
     def register_user(self, username, password, question, answer):
+        check_password_policy(password)
         hashed_password = self.security.hash_password(password)
         hashed_answer = self.security.hash_password(answer)
         try:
-            self.cursor.execute("INSERT INTO users (username, password, security_question, security_answer) VALUES (?, ?, ?, ?)",
-                              (username, hashed_password, question, hashed_answer))
-            self.conn.commit()
+            with self.pool.transaction() as conn:
+                # The first account administers the installation
+                is_admin = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+                conn.execute("""INSERT INTO users (username, password, security_question, security_answer, is_admin)
+                             VALUES (?, ?, ?, ?, ?)""", (username, hashed_password, question, hashed_answer, is_admin))
             logging.info(f"User registered: {username}")
         except sqlite3.Error as e:
             logging.error(f"User registration failed: {str(e)}")
             raise
 
     def authenticate_user(self, username, password):
-        hashed = self.security.hash_password(password)
-        self.cursor.execute("SELECT * FROM users WHERE username=? AND password=?", (username, hashed))
-        return self.cursor.fetchone() is not None
+        stored = self.get_password_hash(username)
+        if stored is None:
+            return False
+        matches, replacement = self.security.check_password(password, stored)
+        if replacement:
+            self.set_password_hash(username, replacement)
+        return matches
+
+    def is_admin(self, username):
+        row = self.conn.execute("SELECT is_admin FROM users WHERE username=?", (username,)).fetchone()
+        return bool(row and row[0])
+
+    def get_password_hash(self, username):
+        row = self.conn.execute("SELECT password FROM users WHERE username=?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def set_password_hash(self, username, hashed):
+        with self.pool.transaction() as conn:
+            conn.execute("UPDATE users SET password=? WHERE username=?", (hashed, username))
+        logging.info(f"Password hash upgraded for user: {username}")
 
     def get_user_security_info(self, username):
-        self.cursor.execute("SELECT username, security_question, security_answer FROM users WHERE username=?", (username,))
-        return self.cursor.fetchone()
+        return self.conn.execute("SELECT username, security_question, security_answer FROM users WHERE username=?",
+                                 (username,)).fetchone()
 
     def verify_security_answer(self, username, answer):
-        hashed_answer = self.security.hash_password(answer)
-        self.cursor.execute("SELECT security_answer FROM users WHERE username=?", (username,))
-        stored_answer = self.cursor.fetchone()
-        return stored_answer and stored_answer[0] == hashed_answer
+        stored_answer = self.conn.execute("SELECT security_answer FROM users WHERE username=?", (username,)).fetchone()
+        if not stored_answer:
+            return False
+        matches, replacement = self.security.check_password(answer, stored_answer[0])
+        if replacement:
+            with self.pool.transaction() as conn:
+                conn.execute("UPDATE users SET security_answer=? WHERE username=?", (replacement, username))
+        return matches
 
     def update_password(self, username, new_password):
+        check_password_policy(new_password)
         hashed = self.security.hash_password(new_password)
-        self.cursor.execute("UPDATE users SET password=? WHERE username=?", (hashed, username))
-        self.conn.commit()
+        with self.pool.transaction() as conn:
+            conn.execute("UPDATE users SET password=? WHERE username=?", (hashed, username))
         logging.info(f"Password updated for user: {username}")
 
     def add_student(self, name, form, email, phone):
-        encrypted_email = self.security.encrypt_data(email)
-        encrypted_phone = self.security.encrypt_data(phone)
-        self.cursor.execute("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
-                          (name, form, encrypted_email, encrypted_phone))
-        self.conn.commit()
-
-    def update_payment(self, student_id, amount):
-        self.cursor.execute("SELECT total_paid FROM students WHERE id=?", (student_id,))
-        total_paid = self.cursor.fetchone()[0]
-        new_total = total_paid + amount
-        self.cursor.execute("UPDATE students SET total_paid=? WHERE id=?", (new_total, student_id))
-        self.cursor.execute("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
-                          (student_id, amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        self.conn.commit()
+        encrypted_email, encrypted_phone = self.security.encrypt_many([email, phone])
+        with self.pool.transaction() as conn:
+            cursor = conn.execute("INSERT INTO students (name, form, parent_email, parent_phone) VALUES (?, ?, ?, ?)",
+                                  (name, form, encrypted_email, encrypted_phone))
+            if self.ledger:
+                self.ledger.record_student(conn, form)
+        return cursor.lastrowid
+
+    def update_student_contact(self, student_id, email, phone):
+        encrypted_email, encrypted_phone = self.security.encrypt_many([email, phone])
+        with self.pool.transaction() as conn:
+            row = conn.execute("SELECT parent_email, parent_phone FROM students WHERE id=?", (student_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("UPDATE students SET parent_email=?, parent_phone=? WHERE id=?",
+                         (encrypted_email, encrypted_phone, student_id))
+        self.security.invalidate(*row)
+        return True
+
+    def update_payment(self, student_id, amount, reference=None):
+        """Record a payment and return the student's new total_paid.
+
+        Returns None, recording nothing, when the student does not exist. With
+        a bank reference, a payment whose reference was already posted is
+        skipped and None is returned.
+        """
+        start = time.perf_counter()
+        with self.pool.transaction() as conn:
+            date = datetime.now().strftime(DATE_FORMAT)
+            student = conn.execute(
+                "SELECT total_paid, form, balance FROM student_balances WHERE student_id=?", (student_id,)).fetchone()
+            if student is None:
+                logging.warning(f"Payment for unknown student {student_id} not recorded")
+                return None
+            if reference is not None and conn.execute(
+                    """INSERT OR IGNORE INTO payment_references (reference, status, created)
+                    VALUES (?, 'posted', ?)""", (reference, date)).rowcount == 0:
+                logging.info(f"Payment with reference {reference} already posted; skipped")
+                return None
+            total_paid, form, balance = student
+            new_total = total_paid + amount
+            conn.execute("UPDATE students SET total_paid=? WHERE id=?", (new_total, student_id))
+            payment_id = conn.execute("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                                      (student_id, amount, date)).lastrowid
+            if reference is not None:
+                conn.execute("UPDATE payment_references SET payment_id=? WHERE reference=?", (payment_id, reference))
+            if self.ledger:
+                self.ledger.record_payments(conn, [(form, balance, amount, date)])
+        self.history.invalidate()
+        logging.info(f"Payment of {amount:,} TSH recorded for student {student_id}",
+                     extra={"operation": "payment", "student_id": student_id, "amount": amount,
+                            "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
         return new_total
 
+    def post_payments(self, payments):
+        """Record a batch of (student_id, amount) payments in one transaction.
+
+        Returns each payment's new total_paid, or None where the student does not exist.
+        """
+        start = time.perf_counter()
+        date = datetime.now().strftime(DATE_FORMAT)
+        results = []
+        applied = []
+        with self.pool.transaction() as conn:
+            student_ids = list({student_id for student_id, _ in payments})
+            rows = conn.execute(f"""SELECT student_id, form, total_paid, balance FROM student_balances
+                                WHERE student_id IN ({','.join('?' * len(student_ids))})""", student_ids).fetchall()
+            students = {student_id: [form, total_paid, balance] for student_id, form, total_paid, balance in rows}
+            for student_id, amount in payments:
+                student = students.get(student_id)
+                if student is None:
+                    results.append(None)
+                    continue
+                applied.append((student_id, student[0], student[2], amount))
+                student[1] += amount
+                student[2] -= amount
+                results.append(student[1])
+            conn.executemany("UPDATE students SET total_paid=? WHERE id=?",
+                             [(total_paid, student_id) for student_id, (_, total_paid, _) in students.items()])
+            conn.executemany("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                             [(student_id, amount, date) for student_id, _, _, amount in applied])
+            if self.ledger:
+                self.ledger.record_payments(conn, [(form, balance, amount, date)
+                                                   for _, form, balance, amount in applied])
+        self.history.invalidate()
+        # One record per payment, as update_payment writes; the duration is the batch's transaction
+        duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        for student_id, _, _, amount in applied:
+            logging.info(f"Payment of {amount:,} TSH recorded for student {student_id}",
+                         extra={"operation": "payment", "student_id": student_id, "amount": amount,
+                                "duration_ms": duration_ms, "rows": len(applied)})
+        return results
+
+    def get_student_ids(self):
+        return {row[0] for row in self.conn.execute("SELECT id FROM students")}
+
+    def bulk_update_payments(self, payments, chunk_size=500):
+        """Apply (student_id, amount, date) rows in chunked transactions.
+
+        Returns one (row, student_id, amount, status, message) tuple per input row,
+        where status is "accepted" or "rejected".
+        """
+        known_ids = self.get_student_ids()
+        report = []
+        chunk = []
+        for row_number, (student_id, amount, date) in enumerate(payments, start=1):
+            try:
+                student_id, amount = int(student_id), int(amount)
+            except (TypeError, ValueError):
+                report.append((row_number, student_id, amount, "rejected", "Invalid student ID or amount"))
+                continue
+            date = normalize_date(date)
+            if student_id not in known_ids:
+                report.append((row_number, student_id, amount, "rejected", "Unknown student ID"))
+            elif amount <= 0:
+                report.append((row_number, student_id, amount, "rejected", "Amount must be positive"))
+            elif date is None:
+                report.append((row_number, student_id, amount, "rejected", "Invalid date"))
+            else:
+                chunk.append((len(report), student_id, amount, date))
+                report.append((row_number, student_id, amount, "accepted", ""))
+                if len(chunk) >= chunk_size:
+                    self._apply_payment_chunk(chunk, report)
+                    chunk = []
+        if chunk:
+            self._apply_payment_chunk(chunk, report)
+        return report
+
+    def _apply_payment_chunk(self, chunk, report):
+        start = time.perf_counter()
+        try:
+            with self.pool.transaction() as conn:
+                # Read before the UPDATE, so the running totals start from the stored values
+                running = list(self._running_totals(conn, chunk)) if self.ledger else None
+                conn.executemany("UPDATE students SET total_paid = total_paid + ? WHERE id=?",
+                                 [(amount, student_id) for _, student_id, amount, _ in chunk])
+                conn.executemany("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                                 [(student_id, amount, date) for _, student_id, amount, date in chunk])
+                # After the writes, so a rebuild the ledger runs here already includes them
+                if self.ledger:
+                    self.ledger.record_payments(conn, running)
+            self.history.invalidate()
+            logging.info(f"Bulk payment chunk applied: {len(chunk)} rows",
+                         extra={"operation": "bulk_import", "rows": len(chunk),
+                                "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
+        except sqlite3.Error as e:
+            logging.error(f"Bulk payment chunk failed: {str(e)}")
+            for index, student_id, amount, _ in chunk:
+                report[index] = (report[index][0], student_id, amount, "rejected", f"Database error: {e}")
+
+    def post_referenced_payments(self, payments, statement=None):
+        """Post (reference, student_id, amount, date) rows in one transaction.
+
+        Rows whose reference is already recorded, or repeated in payments, are
+        skipped. Returns {reference: payment_id} for the rows posted.
+        """
+        start = time.perf_counter()
+        created = datetime.now().strftime(DATE_FORMAT)
+        posted = {}
+        with self.pool.transaction() as conn:
+            references = [payment[0] for payment in payments]
+            seen = {reference for reference, in conn.execute(
+                f"SELECT reference FROM payment_references WHERE reference IN ({','.join('?' * len(references))})",
+                references)}
+            chunk = []
+            for payment in payments:
+                if payment[0] not in seen:
+                    seen.add(payment[0])
+                    chunk.append(payment)
+            if not chunk:
+                return posted
+            running = list(self._running_totals(conn, chunk)) if self.ledger else None
+            conn.executemany("UPDATE students SET total_paid = total_paid + ? WHERE id=?",
+                             [(amount, student_id) for _, student_id, amount, _ in chunk])
+            for reference, student_id, amount, date in chunk:
+                posted[reference] = conn.execute("INSERT INTO payments (student_id, amount, date) VALUES (?, ?, ?)",
+                                                 (student_id, amount, date)).lastrowid
+            conn.executemany("""INSERT INTO payment_references (reference, payment_id, status, statement, created)
+                             VALUES (?, ?, 'posted', ?, ?)""",
+                             [(reference, payment_id, statement, created) for reference, payment_id in posted.items()])
+            if self.ledger:
+                self.ledger.record_payments(conn, running)
+        self.history.invalidate()
+        logging.info(f"Posted {len(posted)} statement payments",
+                     extra={"operation": "statement_post", "rows": len(posted), "file": statement,
+                            "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
+        return posted
+
+    def _running_totals(self, conn, chunk):
+        """Yield (form, balance_before, amount, date) for each chunk row, in order"""
+        student_ids = list({student_id for _, student_id, _, _ in chunk})
+        rows = conn.execute(f"""SELECT student_id, form, balance FROM student_balances
+                            WHERE student_id IN ({','.join('?' * len(student_ids))})""", student_ids).fetchall()
+        students = {student_id: [form, balance] for student_id, form, balance in rows}
+        for _, student_id, amount, date in chunk:
+            student = students[student_id]
+            yield student[0], student[1], amount, date
+            student[1] -= amount
+
     def get_student(self, student_id):
-        self.cursor.execute("SELECT name, form, parent_email, parent_phone, total_paid FROM students WHERE id=?", 
-                          (student_id,))
-        row = self.cursor.fetchone()
+        row = self.conn.execute("SELECT name, form, parent_email, parent_phone, total_paid FROM students WHERE id=?",
+                                (student_id,)).fetchone()
         if row:
             name, form, enc_email, enc_phone, total_paid = row
-            return (name, form, self.security.decrypt_data(enc_email), 
-                   self.security.decrypt_data(enc_phone), total_paid)
+            email, phone = self.security.decrypt_many([enc_email, enc_phone])
+            return (name, form, email, phone, total_paid)
         return None
 
     def get_all_students(self):
-        self.cursor.execute("SELECT id, name, form, total_paid FROM students")
-        return self.cursor.fetchall()
+        return self.conn.execute("SELECT id, name, form, total_paid FROM students").fetchall()
+
+    def get_students_page(self, after_id=0, limit=200):
+        """Return up to limit (id, name, form, paid, balance) rows with id > after_id, ordered by id"""
+        return self.conn.execute(f"""SELECT {STUDENT_ROW} FROM student_balances b
+                                 WHERE b.student_id > ? ORDER BY b.student_id LIMIT ?""", (after_id, limit)).fetchall()
+
+    def get_balance(self, student_id):
+        """Return (fee, arrears, paid, balance) for the current academic year, or None"""
+        return self.conn.execute("SELECT fee, arrears, paid, balance FROM student_balances WHERE student_id=?",
+                                 (student_id,)).fetchone()
+
+    def get_fees(self):
+        return dict(self.fees)
+
+    def count_outstanding_students(self, threshold, after_id=0):
+        return self.conn.execute("SELECT COUNT(*) FROM student_balances WHERE student_id > ? AND balance > ?",
+                                 (after_id, threshold)).fetchone()[0]
+
+    def iter_outstanding_students(self, threshold, after_id=0, batch_size=200):
+        """Yield batches of (id, name, form, paid, balance, email) with balance above threshold.
+
+        Students are read in id order one batch at a time, so memory use does
+        not grow with the number of recipients.
+        """
+        while True:
+            rows = self.conn.execute("""SELECT s.id, s.name, s.form, b.paid, b.balance, s.parent_email FROM students s
+                                     JOIN student_balances b ON b.student_id = s.id
+                                     WHERE s.id > ? AND b.balance > ? ORDER BY s.id LIMIT ?""",
+                                     (after_id, threshold, batch_size)).fetchall()
+            if not rows:
+                return
+            emails = self.security.decrypt_many([row[5] for row in rows], remember=False)
+            yield [row[:5] + (email,) for row, email in zip(rows, emails)]
+            after_id = rows[-1][0]
+
+    def search_students(self, term, limit=-1, offset=0):
+        """Return students matching term, best matches first.
+
+        A numeric term that is an existing student ID returns just that student.
+        Otherwise every word in term is matched as a name prefix.
+        """
+        term = term.strip()
+        conn = self.conn
+        if term.isdigit():
+            row = conn.execute(f"SELECT {STUDENT_ROW} FROM student_balances b WHERE b.student_id=?",
+                               (int(term),)).fetchone()
+            if row:
+                return [row] if offset == 0 else []
+        words = re.findall(r"\w+", term)
+        if not words:
+            return conn.execute(f"SELECT {STUDENT_ROW} FROM student_balances b ORDER BY b.student_id LIMIT ? OFFSET ?",
+                                (limit, offset)).fetchall()
+        if self.fts_enabled:
+            query = " ".join(f'"{word}"*' for word in words)
+            return conn.execute(f"""SELECT {STUDENT_ROW} FROM students_fts
+                                JOIN student_balances b ON b.student_id = students_fts.rowid
+                                WHERE students_fts MATCH ? ORDER BY rank, b.student_id LIMIT ? OFFSET ?""",
+                                (query, limit, offset)).fetchall()
+        return conn.execute(f"""SELECT {STUDENT_ROW} FROM student_balances b
+                            WHERE b.name LIKE ? ORDER BY b.student_id LIMIT ? OFFSET ?""",
+                            (f"%{term}%", limit, offset)).fetchall()
+
+    def get_receipt_payments(self, form=None):
+        """Return (payment_id, student_id, name, form, amount, paid_after, required_fee, date) for receipt reprints.
 
-    def search_students(self, term):
-        self.cursor.execute("SELECT id, name, form, total_paid FROM students WHERE name LIKE ? OR id LIKE ?",
-                          (f"%{term}%", f"%{term}%"))
-        return self.cursor.fetchall()
+        Like the receipt printed at the time, each shows what had been paid
+        this academic year against this year's fee plus arrears. Payments made
+        before the year was opened were carried over and are not reprinted.
+        """
+        return self.conn.execute("""SELECT id, student_id, name, form, amount, paid_after, required_fee, date FROM
+                                 (SELECT p.id, b.student_id, b.name, b.form, p.amount,
+                                 b.fee + b.arrears AS required_fee, p.date, SUM(p.amount) OVER (PARTITION BY p.student_id ORDER BY p.id)
+                                 - (b.total_paid - b.paid) AS paid_after
+                                 FROM payments p JOIN student_balances b ON b.student_id = p.student_id
+                                 WHERE ? IS NULL OR b.form = ?)
+                                 WHERE paid_after > 0 ORDER BY form, student_id, id""", (form, form)).fetchall()
 
-    def get_payment_history(self, student_id):
-        self.cursor.execute("SELECT date, amount FROM payments WHERE student_id=?", (student_id,))
-        return self.cursor.fetchall()
\ No newline at end of file
+    def get_payment_history(self, student_id, limit=-1):
+        """Return a student's (date, amount) payments, newest first"""
+        return self.conn.execute("""SELECT date, amount FROM payments WHERE student_id=?
+                                 ORDER BY date DESC, id DESC LIMIT ?""", (student_id, limit)).fetchall()
\ No newline at end of file
@@ -0,0 +1,228 @@
+import csv
+import os
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+from metrics import metrics
+import logging
+
+PAYMENT_COLUMNS = ["Payment ID", "Date", "Student ID", "Name", "Form", "Amount (TSH)"]
+BALANCE_COLUMNS = ["Student ID", "Name", "Form", "Required Fee (TSH)", "Arrears (TSH)", "Paid This Year (TSH)",
+                   "Remaining (TSH)"]
+CONTACT_COLUMNS = ["Parent Email", "Parent Phone"]
+
+# Excel's limit per worksheet, including the header row
+XLSX_MAX_ROWS = 1048576
+# Characters XML 1.0 cannot carry at all
+XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+class CSVReportWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        # Text such as "+255..." or "=..." would be read as a formula by spreadsheet programs
+        self.writer.writerows([f"'{value}" if isinstance(value, str) and value[:1] in FORMULA_PREFIXES else value
+                               for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class XLSXReportWriter:
+    """Minimal streaming .xlsx writer.
+
+    Rows go straight into the compressed worksheet XML inside the zip, with
+    strings stored inline, so memory use does not depend on the row count.
+    A new worksheet is started when one reaches Excel's row limit.
+    """
+
+    def __init__(self, path, columns):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self.columns = columns
+        self.sheets = 0
+        self.sheet = None
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self._end_sheet()
+        self.sheets += 1
+        self.sheet = self.zip.open(f"xl/worksheets/sheet{self.sheets}.xml", "w", force_zip64=True)
+        self.sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         b'<sheetData>')
+        self.row_number = 0
+        self._write_row(self.columns)
+
+    def _end_sheet(self):
+        if self.sheet is not None:
+            self.sheet.write(b"</sheetData></worksheet>")
+            self.sheet.close()
+
+    def _write_row(self, row):
+        self.row_number += 1
+        cells = []
+        for value in row:
+            if value is None:
+                cells.append("<c/>")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                cells.append(f"<c><v>{value}</v></c>")
+            else:
+                text = escape(XML_INVALID.sub("", str(value)))
+                cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+        self.sheet.write(f'<row r="{self.row_number}">{"".join(cells)}</row>'.encode())
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.row_number >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self._write_row(row)
+
+    def close(self):
+        self._end_sheet()
+        sheets = range(1, self.sheets + 1)
+        self.zip.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for n in sheets)
+            + "</Types>"))
+        self.zip.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            "</Relationships>"))
+        self.zip.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="Sheet{n}" sheetId="{n}" r:id="rId{n}"/>' for n in sheets)
+            + "</sheets></workbook>"))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" '
+                      'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                      for n in sheets)
+            + "</Relationships>"))
+        self.zip.close()
+
+WRITERS = {".csv": CSVReportWriter, ".xlsx": XLSXReportWriter}
+
+class ReportExporter:
+    """Term-end payment and balance reports written to CSV or XLSX.
+
+    Rows are read from a cursor in batches and written as they arrive, so
+    the export never holds more than one batch in memory.
+    """
+
+    def __init__(self, db_manager, batch_size=2000):
+        self.db = db_manager
+        self.batch_size = batch_size
+
+    def _payment_filter(self, start_date, end_date, form):
+        clauses, params = [], []
+        if start_date:
+            clauses.append("p.date >= ?")
+            params.append(start_date)
+        if end_date:
+            # end_date is a whole day; payment dates carry a time
+            clauses.append("p.date < ?")
+            params.append((datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if form:
+            clauses.append("s.form = ?")
+            params.append(form)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, report="payments", start_date=None, end_date=None, form=None):
+        if report == "balances":
+            return self.db.conn.execute("SELECT COUNT(*) FROM students WHERE ? IS NULL OR form = ?",
+                                        (form, form)).fetchone()[0]
+        where, params = self._payment_filter(start_date, end_date, form)
+        return self.db.conn.execute(f"SELECT COUNT(*) FROM payments p JOIN students s ON s.id = p.student_id{where}",
+                                    params).fetchone()[0]
+
+    def iter_payments(self, start_date=None, end_date=None, form=None, include_contacts=False):
+        """Yield batches of payment rows in date order"""
+        where, params = self._payment_filter(start_date, end_date, form)
+        cursor = self.db.conn.execute(f"""SELECT p.id, p.date, s.id, s.name, s.form, p.amount,
+                                      s.parent_email, s.parent_phone
+                                      FROM payments p JOIN students s ON s.id = p.student_id{where}
+                                      ORDER BY p.date, p.id""", params)
+        yield from self._batches(cursor, 6, include_contacts)
+
+    def iter_balances(self, form=None, include_contacts=False):
+        """Yield batches of per-student balance rows in student ID order"""
+        cursor = self.db.conn.execute("""SELECT s.id, s.name, s.form, b.fee, b.arrears, b.paid, b.balance,
+                                      s.parent_email, s.parent_phone
+                                      FROM students s JOIN student_balances b ON b.student_id = s.id
+                                      WHERE ? IS NULL OR s.form = ? ORDER BY s.id""", (form, form))
+        yield from self._batches(cursor, 7, include_contacts)
+
+    def _batches(self, cursor, width, include_contacts):
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            if not include_contacts:
+                yield [row[:width] for row in rows]
+                continue
+            # Decrypted contacts are not cached; the export would only evict the desk's working set
+            contacts = self.db.security.decrypt_many([value for row in rows for value in row[width:]], remember=False)
+            yield [row[:width] + tuple(contacts[2 * i:2 * i + 2]) for i, row in enumerate(rows)]
+
+    @metrics.timed("export.report")
+    def export(self, path, report="payments", start_date=None, end_date=None, form=None, include_contacts=False,
+               progress=None, cancel=None):
+        """Write a report to path (.csv or .xlsx) and return the number of rows written.
+
+        progress(rows_written, total_rows) is called after each batch. When the
+        cancel event is set the partial file is removed and None is returned.
+        """
+        writer_class = WRITERS.get(os.path.splitext(path)[1].lower())
+        if writer_class is None:
+            raise ValueError(f"Unsupported export format: {path}")
+        columns = PAYMENT_COLUMNS if report == "payments" else BALANCE_COLUMNS
+        if include_contacts:
+            columns = columns + CONTACT_COLUMNS
+        if report == "payments":
+            batches = self.iter_payments(start_date, end_date, form, include_contacts)
+        else:
+            batches = self.iter_balances(form, include_contacts)
+        total = self.count(report, start_date, end_date, form) if progress else None
+
+        temp_path = f"{path}.part"
+        writer = writer_class(temp_path, columns)
+        written = 0
+        completed = False
+        try:
+            for batch in batches:
+                if cancel is not None and cancel.is_set():
+                    break
+                writer.write_rows(batch)
+                written += len(batch)
+                if progress:
+                    progress(written, total)
+            else:
+                completed = True
+        finally:
+            writer.close()
+            batches.close()
+            if not completed:
+                os.remove(temp_path)
+        if not completed:
+            logging.info(f"Export to {path} cancelled after {written} rows")
+            return None
+        os.replace(temp_path, path)
+        logging.info(f"Exported {written} {report} rows to {path}",
+                     extra={"operation": "export", "rows": written, "file": path})
+        return written
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import heapq
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from datetime import datetime, timedelta
+from database import DatabaseManager
+from metrics import metrics
+import logging
+
+def campus_databases(config):
+    """Return {campus: database file} from config.json, defaulting to the single school_fees.db"""
+    return config.get("campuses") or {"Main": "school_fees.db"}
+
+def campus_database(config, campus=None):
+    """Return the database file of campus, or school_fees.db when it is None; raises ValueError if it is unknown"""
+    if campus is None:
+        return "school_fees.db"
+    campuses = campus_databases(config)
+    if campus not in campuses:
+        raise ValueError(f"Unknown campus {campus}; config.json lists {', '.join(campuses)}")
+    return campuses[campus]
+
+class Shard:
+    """One campus database, queried only from its own worker thread.
+
+    The pool opens a connection per thread, so running every query for the
+    campus on one thread keeps it to a single connection, while different
+    campuses are queried in parallel.
+    """
+
+    def __init__(self, campus, path, security_manager, fee_structure=None):
+        self.campus = campus
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{campus}")
+        self._opening = self.executor.submit(DatabaseManager, path, security_manager, fee_structure)
+
+    @property
+    def db(self):
+        return self._opening.result()
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def call(self, method, *args):
+        """Run a DatabaseManager method on the shard's thread and return its future"""
+        return self.executor.submit(lambda: getattr(self.db, method)(*args))
+
+    def close(self):
+        self.executor.submit(lambda: self.db.pool.close_all()).result()
+        self.executor.shutdown()
+
+class CampusFederation:
+    """Fan queries out to every campus in parallel and merge the answers.
+
+    Small results (totals, searches) are gathered whole. Reports are read
+    from each campus in batches, the next batch being fetched on the shard's
+    thread while the current one is consumed, and merged with heapq.merge,
+    so memory use does not grow with the number of rows.
+    """
+
+    def __init__(self, campuses, security_manager, fee_structure=None, batch_size=1000):
+        self.batch_size = batch_size
+        # Shards open their databases concurrently
+        self.shards = [Shard(campus, path, security_manager, fee_structure) for campus, path in campuses.items()]
+        for shard in self.shards:
+            shard.db
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def _gather(self, method, *args):
+        """Return [(campus, result)] of a DatabaseManager method run on every shard"""
+        futures = [(shard.campus, shard.call(method, *args)) for shard in self.shards]
+        return [(campus, future.result()) for campus, future in futures]
+
+    @metrics.timed("federation.totals")
+    def totals(self):
+        """Return (campus, form, students, total_collected, outstanding, fully_paid) rows, from the fee ledgers"""
+        futures = [(shard.campus, shard.submit(lambda shard=shard: shard.db.ledger.form_totals()))
+                   for shard in self.shards]
+        return [(campus, *row) for campus, future in futures for row in future.result()]
+
+    @metrics.timed("federation.search_students")
+    def search_students(self, term, limit=50):
+        """Return up to limit (campus, id, name, form, paid, balance) rows.
+
+        Ranks are not comparable between campuses, so each campus's best
+        matches are taken in turn.
+        """
+        results = [[(campus, *row) for row in rows] for campus, rows in self._gather("search_students", term, limit)]
+        return [row for rank in zip_longest(*results) for row in rank if row is not None][:limit]
+
+    def _stream(self, shard, sql, params):
+        """Start a query on shard and return a generator of its rows, prefixed with the campus"""
+        cursor = []
+
+        def fetch():
+            if not cursor:
+                cursor.append(shard.db.conn.execute(sql, params))
+            return cursor[0].fetchmany(self.batch_size)
+
+        future = shard.submit(fetch)
+
+        def rows():
+            nonlocal future
+            try:
+                while batch := future.result():
+                    future = shard.submit(fetch)
+                    for row in batch:
+                        yield (shard.campus, *row)
+            finally:
+                # An abandoned cursor would hold the campus's read snapshot open
+                if not future.cancel() and future.exception() is None and future.result():
+                    shard.submit(lambda: cursor[0].close())
+        return rows()
+
+    def _merged(self, sql, params, key):
+        # Every shard's first batch is requested before any is waited on
+        return heapq.merge(*[self._stream(shard, sql, params) for shard in self.shards], key=key)
+
+    def iter_balances(self, form=None):
+        """Yield (campus, id, name, form, fee, arrears, paid, balance) rows ordered by form and name"""
+        return self._merged("""SELECT student_id, name, form, fee, arrears, paid, balance FROM student_balances
+                            WHERE ? IS NULL OR form = ? ORDER BY form, name, student_id""", (form, form),
+                            key=lambda row: (row[3], row[2], row[0], row[1]))
+
+    def iter_payments(self, start_date=None, end_date=None):
+        """Yield (campus, payment_id, date, student_id, name, form, amount) rows in date order.
+
+        end_date is a whole day, as in exports.
+        """
+        clauses, params = [], []
+        if start_date:
+            clauses.append("p.date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("p.date < ?")
+            params.append((datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d"))
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return self._merged(f"""SELECT p.id, p.date, s.id, s.name, s.form, p.amount
+                            FROM payments p JOIN students s ON s.id = p.student_id{where}
+                            ORDER BY p.date, p.id""", params, key=lambda row: (row[2], row[0], row[1]))
+
+if __name__ == "__main__":
+    from security import SecurityManager
+    from exports import CSVReportWriter
+    from logs import setup_logging
+    from main import load_config
+
+    parser = argparse.ArgumentParser(description="Query every campus database at once")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("totals", help="Collected and outstanding fees per campus and form")
+    search_parser = commands.add_parser("search", help="Find students by name or ID on every campus")
+    search_parser.add_argument("term")
+    search_parser.add_argument("--limit", type=int, default=50)
+    balances_parser = commands.add_parser("balances", help="Every student's balance")
+    balances_parser.add_argument("--form")
+    balances_parser.add_argument("--output", help="CSV file to write (default standard output)")
+    payments_parser = commands.add_parser("payments", help="Payments in date order")
+    payments_parser.add_argument("--from", dest="start_date")
+    payments_parser.add_argument("--to", dest="end_date")
+    payments_parser.add_argument("--output", help="CSV file to write (default standard output)")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    federation = CampusFederation(campus_databases(config), security, config["fee_structure"])
+    start = time.perf_counter()
+    try:
+        if args.command == "totals":
+            columns = ["Campus", "Form", "Students", "Collected (TSH)", "Outstanding (TSH)", "Fully Paid"]
+            rows = federation.totals()
+        elif args.command == "search":
+            columns = ["Campus", "Student ID", "Name", "Form", "Paid (TSH)", "Balance (TSH)"]
+            rows = federation.search_students(args.term, args.limit)
+        elif args.command == "balances":
+            columns = ["Campus", "Student ID", "Name", "Form", "Required Fee (TSH)", "Arrears (TSH)",
+                       "Paid This Year (TSH)", "Remaining (TSH)"]
+            rows = federation.iter_balances(args.form)
+        else:
+            columns = ["Campus", "Payment ID", "Date", "Student ID", "Name", "Form", "Amount (TSH)"]
+            rows = federation.iter_payments(args.start_date, args.end_date)
+        count = 0
+
+        def counted(rows):
+            global count
+            for row in rows:
+                count += 1
+                yield row
+
+        if getattr(args, "output", None):
+            writer = CSVReportWriter(args.output, columns)
+            try:
+                writer.write_rows(counted(rows))
+            finally:
+                writer.close()
+        else:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(counted(rows))
+        logging.info(f"Federated {args.command} returned {count} rows from {len(federation.shards)} campuses",
+                     extra={"operation": "federation", "rows": count,
+                            "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
+    finally:
+        federation.close()
@@ -0,0 +1,112 @@
+from collections.abc import Mapping
+from datetime import datetime
+import logging
+
+class FeeSchedule(Mapping):
+    """Fees per form and academic year, stored in fee_schedules.
+
+    Reads as a {form: fee} mapping of the fees in effect today, so it can go
+    wherever config.json's fee_structure dict used to. The lookup is cached
+    with the date and the highest schedule ID it was read at: entries are
+    only ever added, so a fee set by another process (manage_fees.py) or
+    one whose effective date arrives is picked up on the next read.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._cache = None  # ((day, last schedule id), {form: fee}, entries in effect)
+
+    @property
+    def conn(self):
+        return self.pool.connection()
+
+    def snapshot(self):
+        """Return ({form: fee}, entries in effect) from one lookup"""
+        key = (datetime.now().strftime("%Y-%m-%d"),
+               self.conn.execute("SELECT MAX(id) FROM fee_schedules").fetchone()[0])
+        cache = self._cache
+        if cache is None or cache[0] != key:
+            fees = dict(self.conn.execute("SELECT form, amount FROM current_fees ORDER BY form").fetchall())
+            in_effect = self.conn.execute("""SELECT COUNT(*) FROM fee_schedules
+                                          WHERE effective_date <= date('now', 'localtime')""").fetchone()[0]
+            cache = self._cache = (key, fees, in_effect)
+        return cache[1], cache[2]
+
+    def current(self):
+        return self.snapshot()[0]
+
+    def in_effect(self):
+        """Number of schedule entries in effect today; it changes whenever fees or the academic year do"""
+        return self.snapshot()[1]
+
+    def reload(self):
+        self._cache = None
+
+    def __getitem__(self, form):
+        return self.current()[form]
+
+    def __iter__(self):
+        return iter(self.current())
+
+    def __len__(self):
+        return len(self.current())
+
+    def academic_year(self):
+        row = self.conn.execute("SELECT academic_year FROM current_academic_year").fetchone()
+        return row[0] if row else None
+
+    def history(self, form=None):
+        """Return (form, academic_year, term, amount, effective_date) rows, oldest first"""
+        return self.conn.execute("""SELECT form, academic_year, term, amount, effective_date FROM fee_schedules
+                                 WHERE ? IS NULL OR form = ? ORDER BY effective_date, id""", (form, form)).fetchall()
+
+    def seed(self, fee_structure, academic_year=None):
+        """Store config.json's fee_structure as the first year's fees if there is no schedule yet.
+
+        The year is dated from the earliest recorded payment, so existing
+        payments all count towards it. Returns True when the schedule was seeded.
+        """
+        with self.pool.transaction() as conn:
+            if conn.execute("SELECT 1 FROM fee_schedules LIMIT 1").fetchone() is not None:
+                return False
+            first_payment = conn.execute("SELECT MIN(date) FROM payments").fetchone()[0]
+            start = first_payment[:10] if first_payment else datetime.now().strftime("%Y-%m-%d")
+            academic_year = academic_year or start[:4]
+            conn.executemany("""INSERT INTO fee_schedules (form, academic_year, term, amount, effective_date)
+                             VALUES (?, ?, NULL, ?, ?)""",
+                             [(form, academic_year, amount, start) for form, amount in fee_structure.items()])
+        self.reload()
+        logging.info(f"Fee schedule for {academic_year} seeded from config with {len(fee_structure)} forms")
+        return True
+
+    def set_fee(self, form, amount, effective_date=None, academic_year=None, term=None):
+        """Change a form's fee from effective_date (default today) within an academic year"""
+        effective_date = effective_date or datetime.now().strftime("%Y-%m-%d")
+        academic_year = academic_year or self.academic_year() or effective_date[:4]
+        with self.pool.transaction() as conn:
+            conn.execute("""INSERT INTO fee_schedules (form, academic_year, term, amount, effective_date)
+                         VALUES (?, ?, ?, ?, ?)""", (form, academic_year, term, amount, effective_date))
+        self.reload()
+        logging.info(f"Fee for {form} set to {amount:,} TSH from {effective_date} ({academic_year})")
+
+    def open_year(self, academic_year, fees, start_date=None):
+        """Start a new academic year with fees {form: amount} from start_date (default today).
+
+        Each student's current balance is carried over as arrears (negative
+        for a credit), along with the total they had paid so far, so only
+        later payments count towards the new year. Run it on or shortly before
+        start_date: students added after the snapshot start without arrears.
+        Returns the number of students carried over.
+        """
+        start_date = start_date or datetime.now().strftime("%Y-%m-%d")
+        with self.pool.transaction() as conn:
+            cursor = conn.execute("""INSERT OR REPLACE INTO fee_carry_over
+                                  (student_id, academic_year, arrears, paid_before)
+                                  SELECT student_id, ?, balance, total_paid FROM student_balances""", (academic_year,))
+            conn.executemany("""INSERT INTO fee_schedules (form, academic_year, term, amount, effective_date)
+                             VALUES (?, ?, NULL, ?, ?)""",
+                             [(form, academic_year, amount, start_date) for form, amount in fees.items()])
+        self.reload()
+        logging.info(f"Academic year {academic_year} opened from {start_date}; "
+                     f"{cursor.rowcount} balances carried over")
+        return cursor.rowcount
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from metrics import instrumented
+
+DAY_FORMAT = "%Y-%m-%d"
+
+# Terms start at the earliest fee schedule entry for each (academic_year, term)
+# and run until the next one starts; entries without a term cover the whole year
+TERMS_SQL = """WITH periods AS (SELECT academic_year, COALESCE(term, '') AS term,
+                               substr(MIN(effective_date), 1, 10) AS start
+                               FROM fee_schedules GROUP BY academic_year, COALESCE(term, '')),
+               bounds AS (SELECT academic_year, term, start, LEAD(start) OVER (ORDER BY start) AS end
+                          FROM periods)"""
+
+def parse_day(value):
+    """Return value as YYYY-MM-DD, None when empty; raises ValueError for anything else"""
+    if value is None or not str(value).strip():
+        return None
+    return datetime.strptime(str(value).strip(), DAY_FORMAT).strftime(DAY_FORMAT)
+
+def day_after(day):
+    return (datetime.strptime(day, DAY_FORMAT) + timedelta(days=1)).strftime(DAY_FORMAT)
+
+@instrumented("history")
+class PaymentHistory:
+    """History queries with a small cache of recent results.
+
+    Each result is cached with the highest payment ID at the time it was
+    read. DatabaseManager calls invalidate() whenever it records payments,
+    and a cached result is not used once MAX(id) has moved, so payments
+    posted by another process (the fee server, import_payments.py) show up
+    on the next read too.
+    """
+
+    def __init__(self, pool, ledger=None, cache_size=256):
+        self.pool = pool
+        self.ledger = ledger
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        return self.pool.connection()
+
+    def invalidate(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _cached(self, key, sql, params):
+        high_water = self.conn.execute("SELECT MAX(id) FROM payments").fetchone()[0]
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == high_water:
+                self._cache.move_to_end(key)
+                return entry[1]
+        rows = self.conn.execute(sql, params).fetchall()
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[key] = (high_water, rows)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return rows
+
+    def _filters(self, student_id, form, start, end, date_column, form_column):
+        clauses, params = [], []
+        if student_id is not None:
+            clauses.append("p.student_id = ?")
+            params.append(int(student_id))
+        if form:
+            # IS rather than =, so SQLite keeps payments LEFT JOIN students as an outer join: turned
+            # into an inner join it is planned with a Bloom filter built over every student first
+            clauses.append(f"{form_column} IS ?")
+            params.append(form)
+        start, end = parse_day(start), parse_day(end)
+        if start:
+            clauses.append(f"{date_column} >= ?")
+            params.append(start)
+        if end:
+            clauses.append(f"{date_column} < ?")
+            params.append(day_after(end))
+        return clauses, params
+
+    def _source(self, student_id, form, start, end):
+        """Return (FROM clause, date column, count, total, WHERE clauses, params) for a rollup"""
+        if student_id is None and self.ledger is not None:
+            # A payment counts under the form its student was in when it was paid
+            clauses, params = self._filters(None, form, start, end, "d.day", "d.form")
+            return "daily_totals d", "d.day", "SUM(d.payments)", "SUM(d.total_collected)", clauses, params
+        clauses, params = self._filters(student_id, form, start, end, "p.date", "s.form")
+        source = "payments p LEFT JOIN students s ON s.id = p.student_id" if form else "payments p"
+        return source, "p.date", "COUNT(*)", "SUM(p.amount)", clauses, params
+
+    def page(self, student_id=None, form=None, start=None, end=None, before=None, limit=100):
+        """Return up to limit (payment_id, date, student_id, name, form, amount) rows, newest first.
+
+        Pass the (date, payment_id) of the last row shown as before for the next page.
+        """
+        if before is None:
+            clauses, params = self._filters(student_id, form, start, end, "p.date", "s.form")
+        else:
+            # The previous page already ended inside the range; its last date bounds the index scan
+            clauses, params = self._filters(student_id, form, start, None, "p.date", "s.form")
+            clauses += ["p.date <= ?", "(p.date, p.id) < (?, ?)"]
+            params += [before[0], *before]
+        # Payments are the outer loop, so rows come off the date index already in order
+        sql = f"""SELECT p.id, p.date, p.student_id, s.name, s.form, p.amount
+                  FROM payments p LEFT JOIN students s ON s.id = p.student_id
+                  WHERE {' AND '.join(clauses) or 1} ORDER BY p.date DESC, p.id DESC LIMIT ?"""
+        return self._cached(("page", sql, *params, limit), sql, (*params, limit))
+
+    def monthly(self, student_id=None, form=None, start=None, end=None):
+        """Return (YYYY-MM, payments, total) rows, oldest month first"""
+        source, date, count, total, clauses, params = self._source(student_id, form, start, end)
+        sql = f"""SELECT substr({date}, 1, 7) AS month, {count}, {total} FROM {source}
+                  WHERE {' AND '.join(clauses) or 1} GROUP BY month ORDER BY month"""
+        return self._cached(("monthly", sql, *params), sql, params)
+
+    def terms(self, student_id=None, form=None, start=None, end=None):
+        """Return (academic_year, term, start, end, payments, total) rows, oldest first.
+
+        term is '' for a year with no terms; end is None for the current term.
+        """
+        source, date, count, total, clauses, params = self._source(student_id, form, start, end)
+        clauses = [f"{date} >= b.start", f"(b.end IS NULL OR {date} < b.end)", *clauses]
+        sql = f"""{TERMS_SQL}
+                  SELECT b.academic_year, b.term, b.start, b.end, {count}, {total}
+                  FROM bounds b CROSS JOIN {source}
+                  WHERE {' AND '.join(clauses)} GROUP BY b.start ORDER BY b.start"""
+        return self._cached(("terms", sql, *params), sql, params)
@@ -0,0 +1,70 @@
+import argparse
+import csv
+import sys
+from security import SecurityManager
+from database import DatabaseManager
+from federation import campus_database
+from logs import setup_logging
+from main import load_config
+
+# Accepted header spellings for bank-statement exports
+COLUMN_ALIASES = {
+    "student_id": ("student_id", "student id", "id", "reference"),
+    "amount": ("amount", "credit", "amount (tsh)"),
+    "date": ("date", "value date", "transaction date"),
+}
+
+def find_columns(header):
+    normalized = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized.index(alias)
+                break
+    if "student_id" not in columns or "amount" not in columns:
+        raise ValueError("Statement must have student ID and amount columns")
+    return columns
+
+def read_statement(path):
+    """Stream (student_id, amount, date) tuples from a CSV bank statement"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        columns = find_columns(next(reader))
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            amount = row[columns["amount"]].replace(",", "").strip()
+            date = row[columns["date"]] if "date" in columns else None
+            yield row[columns["student_id"]].strip(), amount, date
+
+def write_report(report, out):
+    writer = csv.writer(out)
+    writer.writerow(["row", "student_id", "amount", "status", "message"])
+    writer.writerows(report)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import payments from a CSV bank statement")
+    parser.add_argument("statement", help="CSV file with student ID, amount and optional date columns")
+    parser.add_argument("--report", help="Write the per-row accept/reject report to this CSV file")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+
+    report = db.bulk_update_payments(read_statement(args.statement), args.chunk_size)
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            write_report(report, f)
+    else:
+        write_report(report, sys.stdout)
+    accepted = sum(1 for row in report if row[3] == "accepted")
+    print(f"{accepted} accepted, {len(report) - accepted} rejected", file=sys.stderr)
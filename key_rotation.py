@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from metrics import metrics
+import logging
+
+def undecryptable(conn, key, sql, batch_size=2000):
+    """Return the first column of sql's rows whose remaining columns key alone cannot decrypt"""
+    from cryptography.fernet import Fernet, InvalidToken
+    cipher = Fernet(key.encode())
+    failed = []
+    cursor = conn.execute(sql)
+    while rows := cursor.fetchmany(batch_size):
+        for row_id, *values in rows:
+            try:
+                for value in values:
+                    cipher.decrypt(value.encode())
+            except InvalidToken:
+                failed.append(row_id)
+    return failed
+
+PENDING_EMAILS = "SELECT id, recipient, message FROM email_queue WHERE status = 'pending'"
+
+class KeyRotation:
+    """Batched, resumable re-encryption of students' parent_email and parent_phone,
+    of the SMS recipients copied from them, and of the emails waiting to be sent.
+
+    Each batch is re-encrypted outside the write lock, then written together
+    with the checkpoint in one transaction, so a crash loses at most the
+    batch in progress. A row whose contacts change while its batch is being
+    re-encrypted is left alone: update_student_contact already wrote it under
+    the new key.
+    """
+
+    def __init__(self, db_manager, batch_size=500, pause=0.0):
+        self.db = db_manager
+        self.batch_size = batch_size
+        # Seconds to sleep between batches, leaving the writer free for the desk
+        self.pause = pause
+        self.key_id = db_manager.security.key_id
+        self.rows = 0
+        self.rows_per_second = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def checkpoint(self):
+        """Return (last_student_id, rows, started, finished) for the current key, or None"""
+        return self.db.conn.execute("""SELECT last_student_id, rows, started, finished FROM key_rotations
+                                    WHERE key_id = ?""", (self.key_id,)).fetchone()
+
+    def progress(self):
+        """Return (students done, total students, rows per second of the current run)"""
+        checkpoint = self.checkpoint()
+        last_id = checkpoint[0] if checkpoint else 0
+        done, total = self.db.conn.execute("SELECT COUNT(*) FILTER (WHERE id <= ?), COUNT(*) FROM students",
+                                           (last_id,)).fetchone()
+        return done, total, self.rows_per_second
+
+    def _batch(self, last_id):
+        rows = self.db.conn.execute("""SELECT id, parent_email, parent_phone FROM students WHERE id > ?
+                                    ORDER BY id LIMIT ?""", (last_id, self.batch_size)).fetchall()
+        if not rows:
+            return None, 0, 0
+        messages = self.db.conn.execute("""SELECT id, recipient FROM sms_messages
+                                        WHERE student_id > ? AND student_id <= ?""", (last_id, rows[-1][0])).fetchall()
+        with metrics.timer("key_rotation.batch"):
+            rotated = self.db.security.rotate_many(value for row in rows for value in row[1:])
+            recipients = self.db.security.rotate_many(recipient for _, recipient in messages)
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            with self.db.pool.transaction() as conn:
+                updated = conn.executemany("""UPDATE students SET parent_email = ?, parent_phone = ?
+                                           WHERE id = ? AND parent_email = ? AND parent_phone = ?""",
+                                           [(rotated[2 * i], rotated[2 * i + 1], row[0], row[1], row[2])
+                                            for i, row in enumerate(rows)]).rowcount
+                conn.executemany("UPDATE sms_messages SET recipient = ? WHERE id = ? AND recipient = ?",
+                                 [(new, message_id, old) for (message_id, old), new in zip(messages, recipients)])
+                conn.execute("""INSERT INTO key_rotations (key_id, last_student_id, rows, started, updated)
+                             VALUES (?, ?, ?, ?, ?) ON CONFLICT(key_id) DO UPDATE SET
+                             last_student_id = excluded.last_student_id, rows = rows + excluded.rows,
+                             updated = excluded.updated""", (self.key_id, rows[-1][0], updated, now, now))
+        self.db.security.invalidate(*(value for row in rows for value in row[1:]))
+        return rows[-1][0], len(rows), updated
+
+    def _email_batch(self, last_id):
+        """Re-encrypt the next batch of unsent emails after last_id; returns the last ID, or None when done"""
+        rows = self.db.conn.execute(f"{PENDING_EMAILS} AND id > ? ORDER BY id LIMIT ?",
+                                    (last_id, self.batch_size)).fetchall()
+        if not rows:
+            return None
+        rotated = self.db.security.rotate_many(value for row in rows for value in row[1:])
+        with self.db.pool.transaction() as conn:
+            conn.executemany("UPDATE email_queue SET recipient = ?, message = ? WHERE id = ? AND recipient = ?",
+                             [(rotated[2 * i], rotated[2 * i + 1], row[0], row[1]) for i, row in enumerate(rows)])
+        return rows[-1][0]
+
+    def run(self, progress=None):
+        """Rotate from the checkpoint until every student is done or stop() is called.
+
+        progress(done, total, rows_per_second) is called after each batch.
+        Returns the number of students re-encrypted by this run.
+        """
+        checkpoint = self.checkpoint()
+        if checkpoint and checkpoint[3]:
+            return 0
+        last_id = checkpoint[0] if checkpoint else 0
+        total = self.db.conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+        done = self.db.conn.execute("SELECT COUNT(*) FROM students WHERE id <= ?", (last_id,)).fetchone()[0]
+        if last_id:
+            logging.info(f"Resuming key rotation after student {last_id} ({done} of {total} done)")
+        start = time.perf_counter()
+        self.rows = 0
+        while not self._stop.is_set():
+            last_id, batch, updated = self._batch(last_id)
+            if last_id is None:
+                # Emails have no student to checkpoint on; the outbox only holds recent ones
+                email_id = 0
+                while email_id is not None and not self._stop.is_set():
+                    email_id = self._email_batch(email_id)
+                if self._stop.is_set():
+                    break
+                with self.db.pool.transaction() as conn:
+                    conn.execute("""INSERT INTO key_rotations (key_id, started, updated, finished)
+                                 VALUES (:key_id, :now, :now, :now) ON CONFLICT(key_id) DO UPDATE SET
+                                 updated = :now, finished = :now""",
+                                 {"key_id": self.key_id, "now": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+                break
+            self.rows += updated
+            done += batch
+            self.rows_per_second = self.rows / (time.perf_counter() - start)
+            if progress:
+                progress(done, total, self.rows_per_second)
+            if self.pause:
+                self._stop.wait(self.pause)
+        elapsed = time.perf_counter() - start
+        state = "stopped" if self._stop.is_set() else "finished"
+        logging.info(f"Key rotation {state}: {self.rows} students re-encrypted at {self.rows_per_second:.0f} rows/s",
+                     extra={"operation": "key_rotation", "rows": self.rows,
+                            "duration_ms": round(elapsed * 1000, 3)})
+        return self.rows
+
+    def start(self):
+        """Run the rotation on a background thread; the application keeps working meanwhile"""
+        def target():
+            try:
+                self.run()
+            except Exception as e:
+                logging.error(f"Key rotation failed: {str(e)}")
+
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=target, name="key-rotation", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop after the batch in progress; the checkpoint lets a later run resume"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def verify(self, batch_size=2000):
+        """Return (table, ID) of the students, pending SMS and pending emails the current key alone cannot decrypt"""
+        return [(table, row_id) for table, sql in (
+            ("students", "SELECT id, parent_email, parent_phone FROM students ORDER BY id"),
+            ("sms_messages", "SELECT id, recipient FROM sms_messages WHERE status = 'pending'"),
+            ("email_queue", PENDING_EMAILS))
+            for row_id in undecryptable(self.db.conn, self.db.security.key, sql, batch_size)]
+
+def write_config(path, config):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(config, f, indent=4)
+    os.replace(temp_path, path)
+
+if __name__ == "__main__":
+    from security import SecurityManager
+    from database import DatabaseManager
+    from federation import campus_database, campus_databases
+    from logs import setup_logging
+    from main import load_config
+
+    parser = argparse.ArgumentParser(description="Re-encrypt parent contacts under a new encryption key",
+                                     epilog="Run --begin, restart the application (or run this without options), "
+                                            "then --finish. Keep the old key with backups taken before the rotation.")
+    step = parser.add_mutually_exclusive_group()
+    step.add_argument("--begin", action="store_true",
+                      help="Generate a new key in config.json, keeping the current one for decryption")
+    step.add_argument("--finish", action="store_true",
+                      help="Complete the rotation on every campus, verify it and remove the previous keys "
+                           "from config.json")
+    step.add_argument("--status", action="store_true", help="Show the rotation's progress and exit")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--campus", help="Campus whose database to rotate, from config.json's \"campuses\"")
+    parser.add_argument("--outbox", default="outbox.db",
+                        help="Email outbox of a desk run with main.py --connect, rotated and checked if it exists")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    previous_keys = config.get("previous_encryption_keys", [])
+
+    if args.begin:
+        if previous_keys:
+            sys.exit("A rotation is already in progress; run it to completion and --finish it first")
+        from cryptography.fernet import Fernet
+        config["previous_encryption_keys"] = [config["encryption_key"]]
+        config["encryption_key"] = Fernet.generate_key().decode()
+        write_config("config.json", config)
+        print("New key written to config.json; restart the application, then run key_rotation.py")
+        sys.exit()
+
+    security = SecurityManager(config["encryption_key"], previous_keys=previous_keys)
+
+    if args.finish:
+        # Dropping the old key strands every campus still holding contacts under it
+        databases = {name for name in [*campus_databases(config).values(), "school_fees.db"] if os.path.exists(name)}
+        failed = []
+        for db_name in sorted(databases):
+            db = DatabaseManager(db_name, security, config["fee_structure"])
+            rotation = KeyRotation(db, args.batch_size)
+            rows = rotation.run()
+            failed += [(f"{db_name} {table}", row_id) for table, row_id in rotation.verify()]
+            db.pool.close_all()
+            print(f"{db_name}: re-encrypted {rows} students", file=sys.stderr)
+        if os.path.exists(args.outbox):
+            from notifications import EmailQueue
+            EmailQueue(args.outbox, None, security).conn.close()
+            outbox = sqlite3.connect(args.outbox)
+            failed += [(args.outbox, row_id) for row_id in undecryptable(outbox, security.key, PENDING_EMAILS)]
+            outbox.close()
+        if failed:
+            sys.exit(f"{len(failed)} rows still need the previous key (first: {failed[0][0]} {failed[0][1]}); "
+                     "run key_rotation.py again")
+        config.pop("previous_encryption_keys", None)
+        write_config("config.json", config)
+        print(f"All contacts on {len(databases)} campus databases use the current key; "
+              "previous keys removed from config.json")
+        sys.exit()
+
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+    rotation = KeyRotation(db, args.batch_size)
+
+    if args.status:
+        done, total, _ = rotation.progress()
+        checkpoint = rotation.checkpoint()
+        state = "finished" if checkpoint and checkpoint[3] else "in progress" if checkpoint else "not started"
+        print(f"Key {rotation.key_id}: {state}, {done} of {total} students re-encrypted")
+    else:
+        if not previous_keys:
+            print("No previous_encryption_keys in config.json; contacts are re-encrypted under the same key")
+        start = time.perf_counter()
+        rows = rotation.run(lambda done, total, rate: print(f"\r{done}/{total} students, {rate:,.0f} rows/s",
+                                                            end="", file=sys.stderr))
+        print(file=sys.stderr)
+        if os.path.exists(args.outbox):
+            from notifications import EmailQueue
+            # Opening the queue re-encrypts its unsent emails while previous keys are configured
+            EmailQueue(args.outbox, None, security).conn.close()
+        print(f"Re-encrypted {rows} students in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from metrics import instrumented
+import logging
+
+@instrumented("ledger")
+class FeeLedger:
+    """Materialized per-form and per-day fee aggregates.
+
+    form_totals and daily_totals are updated by the same transaction that
+    records a payment, so reads such as outstanding("Form 3") are a single
+    primary-key lookup. rebuild() and check_consistency() recompute them
+    from the student_balances view and payments.
+
+    Balances follow the fee schedule, so each form_totals row records how
+    many schedule entries were in effect when it was built. Once a fee or a
+    new academic year takes effect the count moves and the next read or
+    write through the ledger rebuilds it.
+    """
+
+    def __init__(self, pool, fee_structure):
+        self.pool = pool
+        self.fee_structure = fee_structure
+        self._schedule = None  # entries in effect when the aggregates were last found current
+
+    @property
+    def conn(self):
+        return self.pool.connection()
+
+    def fee(self, form):
+        return self.fee_structure.get(form, 0)
+
+    def ensure_built(self):
+        """Rebuild when the aggregates are missing or were built with other fees"""
+        stored = dict(self.conn.execute("SELECT form, fee FROM form_totals").fetchall())
+        has_students = self.conn.execute("SELECT 1 FROM students LIMIT 1").fetchone() is not None
+        if (has_students and not stored) or any(self.fee(form) != fee for form, fee in stored.items()):
+            self.rebuild()
+        else:
+            self.refresh()
+
+    def refresh(self, schedule=None):
+        """Rebuild when a fee schedule entry has taken effect since the aggregates were built.
+
+        Called inside a write transaction, the rebuild joins it and sees the
+        transaction's own writes. Returns True when it rebuilt.
+        """
+        if schedule is None:
+            schedule = self.fee_structure.in_effect()
+        if schedule == self._schedule:
+            return False
+        if self.conn.execute("SELECT 1 FROM form_totals WHERE schedule IS NOT ? LIMIT 1", (schedule,)).fetchone():
+            # Checked again once the rebuild has committed
+            self.rebuild()
+            return True
+        self._schedule = schedule
+        return False
+
+    def record_student(self, conn, form):
+        fees, schedule = self.fee_structure.snapshot()
+        if self.refresh(schedule):
+            return  # The rebuild counted the new student
+        fee = fees.get(form, 0)
+        conn.execute("""INSERT INTO form_totals (form, fee, students, total_collected, outstanding, fully_paid,
+                       schedule) VALUES (?, ?, 1, 0, ?, ?, ?)
+                       ON CONFLICT(form) DO UPDATE SET students = students + 1,
+                       outstanding = outstanding + excluded.outstanding,
+                       fully_paid = fully_paid + excluded.fully_paid""",
+                       (form, fee, max(fee, 0), int(fee <= 0), schedule))
+
+    def record_payments(self, conn, payments):
+        """Apply (form, balance_before, amount, date) rows within the caller's transaction.
+
+        Call it after the payments are written: when it has to rebuild, the
+        rebuild reads them rather than applying the rows.
+        """
+        fees, schedule = self.fee_structure.snapshot()
+        if self.refresh(schedule):
+            return  # The rebuild counted these payments
+        forms = defaultdict(lambda: [0, 0, 0])
+        days = defaultdict(lambda: [0, 0, 0])
+        for form, balance, amount, date in payments:
+            new_balance = balance - amount
+            now_paid, was_paid = new_balance <= 0, balance <= 0
+            form_delta = forms[form]
+            form_delta[0] += amount
+            form_delta[1] += max(new_balance, 0) - max(balance, 0)
+            form_delta[2] += now_paid - was_paid
+            day_delta = days[(date[:10], form)]
+            day_delta[0] += amount
+            day_delta[1] += 1
+            day_delta[2] += now_paid and not was_paid
+        conn.executemany("""INSERT INTO form_totals (form, fee, students, total_collected, outstanding, fully_paid,
+                           schedule) VALUES (?, ?, 0, ?, ?, ?, ?)
+                           ON CONFLICT(form) DO UPDATE SET total_collected = total_collected + excluded.total_collected,
+                           outstanding = outstanding + excluded.outstanding,
+                           fully_paid = fully_paid + excluded.fully_paid""",
+                           [(form, fees.get(form, 0), *delta, schedule) for form, delta in forms.items()])
+        conn.executemany("""INSERT INTO daily_totals (day, form, total_collected, payments, fully_paid)
+                           VALUES (?, ?, ?, ?, ?)
+                           ON CONFLICT(day, form) DO UPDATE SET total_collected = total_collected + excluded.total_collected,
+                           payments = payments + excluded.payments,
+                           fully_paid = fully_paid + excluded.fully_paid""",
+                           [(day, form, *delta) for (day, form), delta in days.items()])
+
+    def outstanding(self, form):
+        self.refresh()
+        row = self.conn.execute("SELECT outstanding FROM form_totals WHERE form=?", (form,)).fetchone()
+        return row[0] if row else 0
+
+    def form_totals(self):
+        """Return (form, students, total_collected, outstanding, fully_paid) rows"""
+        self.refresh()
+        return self.conn.execute("""SELECT form, students, total_collected, outstanding, fully_paid
+                                 FROM form_totals ORDER BY form""").fetchall()
+
+    def daily_totals(self, day):
+        """Return (form, total_collected, payments, fully_paid) rows for a YYYY-MM-DD day"""
+        return self.conn.execute("""SELECT form, total_collected, payments, fully_paid
+                                 FROM daily_totals WHERE day=? ORDER BY form""", (day,)).fetchall()
+
+    def compute(self):
+        """Recompute both aggregate tables from student balances and payments"""
+        forms = {}
+        for form, students, outstanding, fully_paid in self.conn.execute(
+                """SELECT form, COUNT(*), SUM(MAX(balance, 0)), SUM(balance <= 0)
+                FROM student_balances GROUP BY form"""):
+            forms[form] = [self.fee(form), students, 0, outstanding, fully_paid]
+        for form, collected in self.conn.execute("""SELECT s.form, SUM(p.amount) FROM payments p
+                                                 JOIN students s ON s.id = p.student_id GROUP BY s.form"""):
+            forms.setdefault(form, [self.fee(form), 0, 0, 0, 0])[2] = collected
+        days = defaultdict(lambda: [0, 0, 0])
+        # Balance left after each payment: today's balance plus everything paid since
+        rows = self.conn.execute("""SELECT b.form, substr(p.date, 1, 10), p.amount,
+                                 b.balance + b.total_paid - SUM(p.amount) OVER (PARTITION BY p.student_id ORDER BY p.id)
+                                 FROM payments p JOIN student_balances b ON b.student_id = p.student_id""")
+        for form, day, amount, balance_after in rows:
+            day_delta = days[(day, form)]
+            day_delta[0] += amount
+            day_delta[1] += 1
+            day_delta[2] += balance_after <= 0 < balance_after + amount
+        return forms, days
+
+    def rebuild(self):
+        with self.pool.transaction() as conn:
+            forms, days = self.compute()
+            schedule = self.fee_structure.in_effect()
+            conn.execute("DELETE FROM form_totals")
+            conn.execute("DELETE FROM daily_totals")
+            conn.executemany("""INSERT INTO form_totals (form, fee, students, total_collected, outstanding, fully_paid,
+                             schedule) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                             [(form, *values, schedule) for form, values in forms.items()])
+            conn.executemany("""INSERT INTO daily_totals (day, form, total_collected, payments, fully_paid)
+                             VALUES (?, ?, ?, ?, ?)""", [(day, form, *values) for (day, form), values in days.items()])
+        logging.info(f"Fee ledger rebuilt: {len(forms)} forms, {len(days)} form-days")
+
+    def check_consistency(self):
+        """Compare stored aggregates with recomputed ones.
+
+        Returns a list of (table, key, stored, expected) tuples, empty when the
+        ledger has not drifted.
+        """
+        forms, days = self.compute()
+        drift = []
+        stored_forms = {row[0]: list(row[1:]) for row in self.conn.execute(
+            "SELECT form, fee, students, total_collected, outstanding, fully_paid FROM form_totals")}
+        for form in forms.keys() | stored_forms.keys():
+            if forms.get(form) != stored_forms.get(form):
+                drift.append(("form_totals", form, stored_forms.get(form), forms.get(form)))
+        stored_days = {(row[0], row[1]): list(row[2:]) for row in self.conn.execute(
+            "SELECT day, form, total_collected, payments, fully_paid FROM daily_totals")}
+        for key in days.keys() | stored_days.keys():
+            if days.get(key) != stored_days.get(key):
+                drift.append(("daily_totals", key, stored_days.get(key), days.get(key)))
+        if drift:
+            logging.warning(f"Fee ledger drift detected in {len(drift)} aggregates")
+        return drift
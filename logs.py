@@ -0,0 +1,94 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+
+# Fields other modules attach with extra={...}; they become top-level JSON keys
+STRUCTURED_FIELDS = ("operation", "student_id", "amount", "rows", "duration_ms", "file", "campaign_id", "message_id")
+
+DEFAULT_LOGGING = {
+    "file": "school_fee_system.log",
+    "level": "INFO",
+    "max_bytes": 5 * 1024 * 1024,
+    "backup_count": 10,
+    "when": None,
+    "json": True,
+}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any structured fields"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def compress_rotated(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def rotating_handler(filename, max_bytes, backup_count, when=None):
+    """Size-based rotation, or time-based when `when` is given (e.g. "midnight"); old files are gzipped"""
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backup_count,
+                                                            encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding="utf-8")
+    handler.namer = lambda name: f"{name}.gz"
+    handler.rotator = compress_rotated
+    return handler
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps structured fields and defers formatting to the listener thread"""
+
+    def prepare(self, record):
+        # Resolve the message now, as arguments may change after the call, but
+        # leave JSON encoding and file I/O to the listener. The root handler is
+        # the last to see the record, so it is updated in place rather than copied
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging(config=None):
+    """Route the root logger through a queue to a rotating file written by a background thread.
+
+    config overrides DEFAULT_LOGGING (the "logging" section of config.json).
+    Returns the started QueueListener; it is stopped, flushing pending
+    records, at interpreter exit.
+    """
+    settings = {**DEFAULT_LOGGING, **(config or {})}
+    file_handler = rotating_handler(settings["file"], settings["max_bytes"], settings["backup_count"], settings["when"])
+    file_handler.setFormatter(JSONFormatter() if settings["json"]
+                              else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(StructuredQueueHandler(log_queue))
+    root.setLevel(settings["level"])
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
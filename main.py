@@ -1,11 +1,9 @@
+import argparse
 import json
 from pathlib import Path
-import tkinter as tk
-from security import SecurityManager
-from database import DatabaseManager
-from notifications import NotificationManager
-from backups import BackupManager
-from ui import UIManager
+
+# Only load_config lives at module level: the command-line scripts import it
+# from here, and the application modules are imported below when main.py runs
 
 def load_config():
     config_path = Path("config.json")
@@ -15,13 +13,76 @@ def load_config():
         return json.load(f)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="School Fee Management System")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--server", action="store_true", help="Run the headless HTTP API for other cashier desks")
+    mode.add_argument("--connect", metavar="URL", help="Run the desktop client against a fee server at URL")
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
     config = load_config()
-    
-    security = SecurityManager(config["encryption_key"])
-    db = DatabaseManager("school_fees.db", security)
-    notif = NotificationManager(config["email"]["sender"], config["email"]["password"])
-    backup = BackupManager(db.conn)
-    
-    root = tk.Tk()
-    app = UIManager(root, db, notif, backup, config["fee_structure"], security)
-    root.mainloop()
\ No newline at end of file
+    server_config = config.get("server", {})
+
+    from logs import setup_logging
+    setup_logging(config.get("logging"))
+    metrics_config = config.get("metrics", {})
+
+    from metrics import metrics
+    metrics.start_writer(metrics_config.get("file", "metrics.json"), metrics_config.get("interval", 60))
+
+    from security import SecurityManager
+    security = SecurityManager(config["encryption_key"], password_hashing=config.get("password_hashing"),
+                               previous_keys=config.get("previous_encryption_keys"))
+    if args.connect:
+        from api_client import APIClient, RemoteDatabaseManager, RemoteBackupManager
+        client = APIClient(args.connect, server_config.get("token"))
+        db = RemoteDatabaseManager(client)
+        backup = RemoteBackupManager(client)
+    else:
+        from database import DatabaseManager
+        from backups import BackupManager
+        from federation import campus_database
+        try:
+            db_name = campus_database(config, args.campus)
+        except ValueError as e:
+            parser.error(str(e))
+        db = DatabaseManager(db_name, security, config["fee_structure"])
+        backup = BackupManager(db)
+        if config.get("previous_encryption_keys"):
+            # Re-encrypt contacts under the new key while the desk or server keeps running
+            from key_rotation import KeyRotation
+            rotation_config = config.get("key_rotation", {})
+            KeyRotation(db, rotation_config.get("batch_size", 500), rotation_config.get("pause", 0.05)).start()
+    # Fees come from the database's schedule; config.json's fee_structure only seeds a new one
+    fees = db.fees if not args.connect else db.get_fees()
+
+    if args.server:
+        import asyncio
+        from server import FeeServer
+        server = FeeServer(db, backup, server_config.get("token"))
+        try:
+            asyncio.run(server.serve(server_config.get("host", "127.0.0.1"), server_config.get("port", 8765)))
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        import tkinter as tk
+        from notifications import NotificationManager
+        from campaigns import ReminderCampaigns
+        from exports import ReportExporter
+        from ui import UIManager
+        notif = NotificationManager(config["email"]["sender"], config["email"]["password"])
+        notif.start_queue("outbox.db" if args.connect else db_name, security)
+        # Campaigns and exports stream rows straight from the database, so only the desk that owns it runs them
+        campaigns = exporter = sms = None
+        if not args.connect:
+            campaigns = ReminderCampaigns(db, notif, fees, config.get("reminders", {}).get("rate", 5))
+            exporter = ReportExporter(db)
+            if config.get("twilio"):
+                from sms import sms_notifier
+                sms = sms_notifier(db, config["twilio"])
+                sms.queue.start()
+
+        root = tk.Tk()
+        app = UIManager(root, db, notif, backup, fees, security, campaigns, exporter, sms)
+        root.mainloop()
+        app.tasks.shutdown()
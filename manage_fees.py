@@ -0,0 +1,62 @@
+import argparse
+from datetime import datetime
+from security import SecurityManager
+from database import DatabaseManager
+from federation import campus_database
+from logs import setup_logging
+from main import load_config
+
+def parse_date(value):
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+def parse_fees(values):
+    """Turn ["Form 1=1250000", ...] into {"Form 1": 1250000, ...}"""
+    fees = {}
+    for value in values:
+        form, _, amount = value.rpartition("=")
+        if not form or not amount.isdigit():
+            raise SystemExit(f"Expected FORM=AMOUNT, got {value!r}")
+        fees[form.strip()] = int(amount)
+    return fees
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="View and change the fee schedule")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show every fee schedule entry")
+    set_parser = commands.add_parser("set", help="Change a form's fee within the current academic year")
+    set_parser.add_argument("form")
+    set_parser.add_argument("amount", type=int)
+    set_parser.add_argument("--from", dest="effective_date", type=parse_date,
+                            help="Effective date, YYYY-MM-DD (default today)")
+    set_parser.add_argument("--term", help="Term the change belongs to, e.g. \"Term 2\"")
+    open_parser = commands.add_parser("open-year", help="Start a new academic year, carrying balances over")
+    open_parser.add_argument("academic_year")
+    open_parser.add_argument("fees", nargs="+", metavar="FORM=AMOUNT")
+    open_parser.add_argument("--from", dest="start_date", type=parse_date,
+                             help="First day of the year, YYYY-MM-DD (default today)")
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+
+    if args.command == "list":
+        print(f"Current academic year: {db.fees.academic_year()}")
+        for form, academic_year, term, amount, effective_date in db.fees.history():
+            print(f"{effective_date}  {academic_year:<10} {term or '':<8} {form:<10} {amount:>12,} TSH")
+    else:
+        if args.command == "set":
+            db.fees.set_fee(args.form, args.amount, args.effective_date, term=args.term)
+        else:
+            carried = db.fees.open_year(args.academic_year, parse_fees(args.fees), args.start_date)
+            print(f"Carried over {carried} student balances into {args.academic_year}")
+        # The ledger's outstanding totals depend on the fees and carried balances
+        db.ledger.rebuild()
+        print("Fee schedule updated")
@@ -0,0 +1,236 @@
+import bisect
+import functools
+import inspect
+import io
+import json
+import os
+import threading
+import time
+from time import perf_counter
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+
+# Bucket upper bounds from 10 us to about 100 s, four per doubling, so any
+# percentile is reported within about 19% of the true value
+BOUNDS = [1e-5 * 2 ** (i / 4) for i in range(94)]
+
+class Histogram:
+    """Latency histogram of the last `window` seconds.
+
+    The window is split into rotating slices so that old samples age out
+    without storing them individually; record() is a bisect and a few
+    integer updates.
+    """
+
+    def __init__(self, window=300, slices=5):
+        self.slice_seconds = window / slices
+        self._counts = [[0] * (len(BOUNDS) + 1) for _ in range(slices)]
+        self._totals = [[0, 0.0, 0.0] for _ in range(slices)]  # count, sum, max
+        self._current = 0
+        self._slice_start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _rotate(self, now):
+        elapsed = int((now - self._slice_start) // self.slice_seconds)
+        for _ in range(min(elapsed, len(self._counts))):
+            self._current = (self._current + 1) % len(self._counts)
+            self._counts[self._current] = [0] * (len(BOUNDS) + 1)
+            self._totals[self._current] = [0, 0.0, 0.0]
+        self._slice_start += elapsed * self.slice_seconds
+
+    def record(self, seconds, now=None):
+        """Add a sample; now is the perf_counter() reading when the caller already has one"""
+        if now is None:
+            now = time.perf_counter()
+        if now - self._slice_start >= self.slice_seconds:
+            with self._lock:
+                if now - self._slice_start >= self.slice_seconds:
+                    self._rotate(now)
+        # Only rotation is locked: a sample racing with another thread's is
+        # occasionally lost, which monitoring can tolerate and which keeps
+        # this cheap enough to wrap every query
+        current = self._current
+        self._counts[current][bisect.bisect_left(BOUNDS, seconds)] += 1
+        totals = self._totals[current]
+        totals[0] += 1
+        totals[1] += seconds
+        if seconds > totals[2]:
+            totals[2] = seconds
+
+    def summary(self):
+        """Return count, mean, p50, p95, p99 and max (in seconds) over the window"""
+        with self._lock:
+            self._rotate(time.perf_counter())
+            counts = [sum(column) for column in zip(*self._counts)]
+            count = sum(totals[0] for totals in self._totals)
+            total = sum(totals[1] for totals in self._totals)
+            largest = max(totals[2] for totals in self._totals)
+        summary = {"count": count, "mean": total / count if count else 0.0, "max": largest}
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            summary[name] = self._percentile(counts, count * fraction, largest)
+        return summary
+
+    def _percentile(self, counts, rank, largest):
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if bucket and seen >= rank:
+                return min(BOUNDS[index], largest) if index < len(BOUNDS) else largest
+        return 0.0
+
+class Metrics:
+    """Named rolling latency histograms, e.g. metrics.record("db.get_student", 0.002)"""
+
+    def __init__(self, window=300):
+        self.window = window
+        self.enabled = True
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        self._stop = threading.Event()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.window))
+        return histogram
+
+    def record(self, name, seconds, now=None):
+        if self.enabled:
+            self.histogram(name).record(seconds, now)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.record(name, end - start, end)
+
+    def timed(self, name):
+        """Decorator recording each call's duration under name"""
+        def decorator(fn):
+            histogram = self.histogram(name)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    end = perf_counter()
+                    histogram.record(end - start, end)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Return {name: summary} for every operation recorded in the window"""
+        with self._lock:
+            histograms = list(self._histograms.items())
+        return {name: summary for name, summary in ((name, histogram.summary()) for name, histogram in histograms)
+                if summary["count"]}
+
+    def slowest(self, limit=20, key="p95"):
+        """Return (name, summary) pairs, slowest first"""
+        return sorted(self.snapshot().items(), key=lambda item: item[1][key], reverse=True)[:limit]
+
+    def write(self, path):
+        data = {"written": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "window_seconds": self.window,
+                "operations": self.snapshot()}
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+
+    def start_writer(self, path, interval=60):
+        """Write a snapshot to path every interval seconds from a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logging.error(f"Writing metrics to {path} failed: {str(e)}")
+
+        if self._writer is None or not self._writer.is_alive():
+            self._stop.clear()
+            self._writer = threading.Thread(target=run, name="metrics-writer", daemon=True)
+            self._writer.start()
+
+    def stop_writer(self):
+        self._stop.set()
+
+metrics = Metrics()
+
+def instrumented(prefix):
+    """Class decorator timing every public method as "<prefix>.<method>".
+
+    Generator methods are left alone since their work happens after the call
+    returns.
+    """
+    def decorator(cls):
+        for name, fn in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(fn) or inspect.isgeneratorfunction(fn):
+                continue
+            setattr(cls, name, metrics.timed(f"{prefix}.{name}")(fn))
+        return cls
+    return decorator
+
+class Profiler:
+    """On-demand cProfile capture of the thread that calls start() and stop(),
+    merged with whatever other threads run under capture() meanwhile"""
+
+    def __init__(self):
+        self._profile = None
+        self._captured = []
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        import cProfile
+        self._captured = []
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    @contextmanager
+    def capture(self):
+        """Profile the block on the calling thread if a capture is running, e.g. a background job"""
+        if self._profile is None:
+            yield
+            return
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from start(), and allows only one profiler at a time
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._profile is not None:
+                    self._captured.append(profile)
+
+    def stop(self, path=None, limit=30):
+        """Stop capturing, optionally dump the raw stats to path, and return a text report"""
+        import pstats
+        profile, self._profile = self._profile, None
+        profile.disable()
+        with self._lock:
+            captured, self._captured = self._captured, []
+        report = io.StringIO()
+        stats = pstats.Stats(profile, *captured, stream=report)
+        if path:
+            stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return report.getvalue()
@@ -0,0 +1,233 @@
+import sqlite3
+import logging
+
+# Each migration upgrades the schema by one version; the database's
+# PRAGMA user_version records how many have been applied. Only append.
+
+def initial_schema(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users
+                   (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT,
+                   security_question TEXT, security_answer TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS students
+                   (id INTEGER PRIMARY KEY, name TEXT, form TEXT,
+                   parent_email TEXT, parent_phone TEXT,
+                   total_paid INTEGER DEFAULT 0)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS payments
+                   (id INTEGER PRIMARY KEY, student_id INTEGER,
+                   amount INTEGER, date TEXT,
+                   FOREIGN KEY(student_id) REFERENCES students(id))''')
+
+def student_search_index(cursor):
+    """FTS5 index of student names, kept in sync with students by triggers"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name='students_fts'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5
+                       (name, content='students', content_rowid='id',
+                       tokenize='unicode61 remove_diacritics 2')''')
+    except sqlite3.OperationalError as e:
+        # SQLite builds without FTS5 fall back to LIKE scans
+        logging.warning(f"Full-text search unavailable: {str(e)}")
+        return
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+                   INSERT INTO students_fts(rowid, name) VALUES (new.id, new.name); END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+                   INSERT INTO students_fts(students_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                   END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF name ON students BEGIN
+                   INSERT INTO students_fts(students_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                   INSERT INTO students_fts(rowid, name) VALUES (new.id, new.name); END''')
+    if not exists:
+        cursor.execute("INSERT INTO students_fts(students_fts) VALUES ('rebuild')")
+
+def lookup_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_student_date ON payments(student_id, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_form ON students(form)")
+    cursor.execute("ANALYZE")
+
+def backup_log(cursor):
+    """High-water marks of each backup, the starting point for the next incremental"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS backups
+                   (id INTEGER PRIMARY KEY, kind TEXT, file TEXT, created TEXT,
+                   last_student_id INTEGER, last_payment_id INTEGER)''')
+    # Edits other than payments (which the payments table already records)
+    cursor.execute("CREATE TABLE IF NOT EXISTS student_changes (student_id INTEGER PRIMARY KEY)")
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS students_log_change
+                   AFTER UPDATE OF name, form, parent_email, parent_phone ON students BEGIN
+                   INSERT OR IGNORE INTO student_changes (student_id) VALUES (new.id); END''')
+
+def fee_ledger(cursor):
+    """Materialized aggregates maintained by FeeLedger"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS form_totals
+                   (form TEXT PRIMARY KEY, fee INTEGER, students INTEGER, total_collected INTEGER,
+                   outstanding INTEGER, fully_paid INTEGER)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS daily_totals
+                   (day TEXT, form TEXT, total_collected INTEGER, payments INTEGER, fully_paid INTEGER,
+                   PRIMARY KEY (day, form))''')
+
+def reminder_campaigns(cursor):
+    """Reminder campaigns and their resume checkpoints"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS campaigns
+                   (id INTEGER PRIMARY KEY, subject TEXT, template TEXT, threshold INTEGER,
+                   status TEXT DEFAULT 'running', last_student_id INTEGER DEFAULT 0,
+                   sent INTEGER DEFAULT 0, failed INTEGER DEFAULT 0, created TEXT, finished TEXT)''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS campaign_failures
+                   (campaign_id INTEGER, student_id INTEGER, error TEXT,
+                   PRIMARY KEY (campaign_id, student_id))''')
+
+def user_roles(cursor):
+    """Administrators see the performance panel; existing installs promote their first user"""
+    cursor.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
+    cursor.execute("UPDATE users SET is_admin = 1 WHERE id = (SELECT MIN(id) FROM users)")
+
+def payment_date_index(cursor):
+    """Date-range reports read payments in date order without sorting them"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_date ON payments(date)")
+
+def fee_schedules(cursor):
+    """Fees per form and academic year, replacing config.json's static fee_structure.
+
+    A mid-year change is a later effective_date within the same academic year.
+    When a new year is opened, each student's closing balance is carried over
+    into fee_carry_over together with what they had paid by then, so balances
+    stay a join instead of a per-student scan of payments. FeeSchedule seeds
+    the first year from config.json.
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS fee_schedules
+                   (id INTEGER PRIMARY KEY, form TEXT, academic_year TEXT, term TEXT,
+                   amount INTEGER, effective_date TEXT)''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_schedules_form ON fee_schedules(form, effective_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fee_schedules_date ON fee_schedules(effective_date)")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS fee_carry_over
+                   (student_id INTEGER, academic_year TEXT, arrears INTEGER, paid_before INTEGER,
+                   PRIMARY KEY (student_id, academic_year)) WITHOUT ROWID''')
+    # The year of the most recent schedule entry already in effect
+    cursor.execute('''CREATE VIEW IF NOT EXISTS current_academic_year AS
+                   SELECT academic_year FROM fee_schedules WHERE effective_date <= date('now', 'localtime')
+                   ORDER BY effective_date DESC, id DESC LIMIT 1''')
+    cursor.execute('''CREATE VIEW IF NOT EXISTS current_fees AS
+                   SELECT form, amount FROM fee_schedules f WHERE id =
+                   (SELECT g.id FROM fee_schedules g WHERE g.form = f.form AND g.effective_date <= date('now', 'localtime')
+                   ORDER BY g.effective_date DESC, g.id DESC LIMIT 1)''')
+    # balance = this year's fee + arrears carried over - paid since the year opened.
+    # The fees are materialized once per query rather than looked up per student.
+    cursor.execute('''CREATE VIEW IF NOT EXISTS student_balances AS
+                   WITH f AS MATERIALIZED (SELECT form, amount FROM current_fees)
+                   SELECT s.id AS student_id, s.name AS name, s.form AS form, s.total_paid AS total_paid,
+                   COALESCE(f.amount, 0) AS fee,
+                   COALESCE(c.arrears, 0) AS arrears, s.total_paid - COALESCE(c.paid_before, 0) AS paid,
+                   COALESCE(f.amount, 0) + COALESCE(c.arrears, 0) - s.total_paid + COALESCE(c.paid_before, 0) AS balance
+                   FROM students s
+                   LEFT JOIN f ON f.form = s.form
+                   LEFT JOIN fee_carry_over c ON c.student_id = s.id
+                   AND c.academic_year = (SELECT academic_year FROM current_academic_year)''')
+
+def payment_references(cursor):
+    """Bank references already reconciled or posted, so a statement is never applied twice"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS payment_references
+                   (reference TEXT PRIMARY KEY, payment_id INTEGER, status TEXT, statement TEXT, created TEXT)''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payment_references_payment ON payment_references(payment_id)")
+
+def key_rotations(cursor):
+    """Progress of re-encrypting contacts under each new key, so an interrupted rotation resumes"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS key_rotations
+                   (key_id TEXT PRIMARY KEY, last_student_id INTEGER NOT NULL DEFAULT 0,
+                   rows INTEGER NOT NULL DEFAULT 0, started TEXT, updated TEXT, finished TEXT)''')
+
+def sms_messages(cursor):
+    """Outbound SMS with per-message delivery status; recipients are stored encrypted like parent_phone"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS sms_messages
+                   (id INTEGER PRIMARY KEY, student_id INTEGER, recipient TEXT NOT NULL, body TEXT NOT NULL,
+                   status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                   next_attempt REAL NOT NULL DEFAULT 0, provider_id TEXT, last_error TEXT, created TEXT, sent TEXT)''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sms_messages_due ON sms_messages(status, next_attempt)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sms_messages_student ON sms_messages(student_id)")
+
+def email_queue(cursor):
+    """Outbound email for EmailQueue; recipients and messages are stored encrypted like parent_email"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS email_queue
+                   (id INTEGER PRIMARY KEY, recipient TEXT, message TEXT,
+                   status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0,
+                   next_attempt REAL DEFAULT 0, last_error TEXT, created TEXT, sent TEXT)''')
+    # EmailQueue used to create the table itself, without sent, and kept every delivered message in plaintext
+    if "sent" not in {row[1] for row in cursor.execute("PRAGMA table_info(email_queue)").fetchall()}:
+        cursor.execute("ALTER TABLE email_queue ADD COLUMN sent TEXT")
+    cursor.execute("DELETE FROM email_queue WHERE status = 'sent'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_queue_due ON email_queue(status, next_attempt)")
+
+def student_change_sequence(cursor):
+    """Number student_changes in the order students last changed, so a backup clears only changes it has seen"""
+    cursor.execute("DROP TRIGGER IF EXISTS students_log_change")
+    cursor.execute("ALTER TABLE student_changes RENAME TO student_changes_old")
+    cursor.execute("CREATE TABLE student_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER UNIQUE)")
+    cursor.execute("INSERT INTO student_changes (student_id) SELECT student_id FROM student_changes_old")
+    cursor.execute("DROP TABLE student_changes_old")
+    # REPLACE moves a student who changes again to a new, higher seq
+    cursor.execute('''CREATE TRIGGER students_log_change
+                   AFTER UPDATE OF name, form, parent_email, parent_phone ON students BEGIN
+                   INSERT OR REPLACE INTO student_changes (student_id) VALUES (new.id); END''')
+
+def backup_marks(cursor):
+    """High-water marks for the tables incremental backups copy besides students and payments"""
+    cursor.execute("ALTER TABLE backups ADD COLUMN last_reference_rowid INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE backups ADD COLUMN last_fee_schedule_id INTEGER NOT NULL DEFAULT 0")
+
+def ledger_schedule(cursor):
+    """Fee schedule entries in effect when each form_totals row was built; NULL rows are rebuilt on open"""
+    cursor.execute("ALTER TABLE form_totals ADD COLUMN schedule INTEGER")
+
+MIGRATIONS = [
+    initial_schema,
+    student_search_index,
+    lookup_indexes,
+    backup_log,
+    fee_ledger,
+    reminder_campaigns,
+    user_roles,
+    payment_date_index,
+    fee_schedules,
+    payment_references,
+    key_rotations,
+    sms_messages,
+    email_queue,
+    student_change_sequence,
+    backup_marks,
+    ledger_schedule,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, backup_path=None):
+    """Apply pending migrations, each in its own transaction.
+
+    When backup_path is given and an existing database is about to change,
+    a copy is written there first. Returns the number of migrations applied.
+    """
+    version = get_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return 0
+    has_tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table'").fetchone()[0] > 0
+    if backup_path and has_tables:
+        target = sqlite3.connect(backup_path)
+        try:
+            conn.backup(target)
+        finally:
+            target.close()
+        logging.info(f"Pre-migration backup written to {backup_path}")
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        migration = MIGRATIONS[number - 1]
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            logging.error(f"Migration {number} ({migration.__name__}) failed")
+            raise
+        logging.info(f"Applied migration {number}: {migration.__name__}")
+    return SCHEMA_VERSION - version
@@ -1,33 +1,300 @@
-import smtplib
-from email.mime.text import MIMEText
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from metrics import metrics
+from migrations import migrate
 import logging
 
-class NotificationManager:
-    def __init__(self, email_sender, email_password):
+# smtplib and the email package are imported when first needed, after the
+# login window is up
+
+class Notifier(ABC):
+    """A channel that tells parents about payments; email and SMS implement it.
+
+    queue_payment() returns a message ID, and delivery_status(message_id)
+    returns (status, attempts, last_error) with status pending, sent or
+    failed. contact picks the channel's address out of the
+    (name, form, email, phone, total_paid) row get_student returns.
+    """
+    channel = None
+
+    @abstractmethod
+    def contact(self, student):
+        ...
+
+    @abstractmethod
+    def queue_payment(self, student_id, name, form, contact, amount, total_paid, required_fee):
+        ...
+
+    @abstractmethod
+    def delivery_status(self, message_id):
+        ...
+
+class NotificationManager(Notifier):
+    channel = "email"
+
+    def __init__(self, email_sender, email_password, smtp_host='smtp.gmail.com', smtp_port=587, use_tls=True):
         self.email_sender = email_sender
         self.email_password = email_password
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.use_tls = use_tls
+        self.queue = None
+
+    def build_message(self, name, form, email, amount, total_paid, required_fee):
+        from email.mime.text import MIMEText
+        remaining = required_fee - total_paid
+        msg = MIMEText(f"""Dear Parent,
 
-    def send_email(self, name, form, email, amount, total_paid, required_fee):
-        try:
-            remaining = required_fee - total_paid
-            msg = MIMEText(f"""Dear Parent,
-            
 A payment of {amount:,} TSH has been received for {name} ({form}).
 Total Paid: {total_paid:,} TSH
 Remaining Balance: {remaining:,} TSH
 
 Thank you,
 School Administration""")
-            msg['Subject'] = 'School Fee Payment Update'
-            msg['From'] = self.email_sender
-            msg['To'] = email
+        msg['Subject'] = 'School Fee Payment Update'
+        msg['From'] = self.email_sender
+        msg['To'] = email
+        return msg
 
-            with smtplib.SMTP('smtp.gmail.com', 587) as server:
+    def connect(self):
+        """Open an authenticated SMTP session"""
+        import smtplib
+        server = smtplib.SMTP(self.smtp_host, self.smtp_port)
+        try:
+            if self.use_tls:
                 server.starttls()
-                server.login(self.email_sender, self.email_password)
+            server.login(self.email_sender, self.email_password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    @metrics.timed("email.send")
+    def send_email(self, name, form, email, amount, total_paid, required_fee):
+        try:
+            msg = self.build_message(name, form, email, amount, total_paid, required_fee)
+            with self.connect() as server:
                 server.send_message(msg)
             logging.info(f"Email sent to {email}")
             return True
         except Exception as e:
             logging.error(f"Email failed: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    def start_queue(self, db_name, security):
+        """Deliver queued emails from a background worker backed by db_name.
+
+        security encrypts recipients and messages while they wait in the queue.
+        """
+        self.queue = EmailQueue(db_name, self, security)
+        self.queue.start()
+
+    def queue_email(self, name, form, email, amount, total_paid, required_fee):
+        """Queue a payment email and return its message ID for delivery_status()"""
+        msg = self.build_message(name, form, email, amount, total_paid, required_fee)
+        return self.queue.enqueue(email, msg)
+
+    def contact(self, student):
+        return student[2]
+
+    def queue_payment(self, student_id, name, form, contact, amount, total_paid, required_fee):
+        return self.queue_email(name, form, contact, amount, total_paid, required_fee)
+
+    def delivery_status(self, message_id):
+        return self.queue.status(message_id)
+
+class EmailQueue:
+    """Persistent outbound email queue drained by one background SMTP session.
+
+    Recipients and messages are stored encrypted and decrypted only to be
+    sent; while a key rotation keeps previous keys, unsent ones are
+    re-encrypted under the current key when the queue opens. Sent messages are deleted after keep_sent_days. A failure reading
+    or updating the queue is logged and the worker carries on with the next
+    batch.
+    """
+
+    def __init__(self, db_name, notif_manager, security, batch_size=50, max_attempts=5, retry_delay=5,
+                 max_per_session=100, idle_timeout=30, poll_interval=2, keep_sent_days=7):
+        self.notif = notif_manager
+        self.security = security
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_per_session = max_per_session
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.keep_sent_days = keep_sent_days
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pruned = 0.0
+        with self.lock:
+            # A desk connected to a fee server keeps its outbox in a database of its own
+            migrate(self.conn)
+            self._encrypt_plaintext()
+            if security.previous_keys:
+                self._rotate_keys()
+
+    def _encrypt_plaintext(self):
+        """Encrypt messages queued before the queue encrypted them; a Fernet token never contains @"""
+        rows = self.conn.execute("SELECT id, recipient, message FROM email_queue WHERE recipient LIKE '%@%'").fetchall()
+        if rows:
+            self.conn.executemany("UPDATE email_queue SET recipient=?, message=? WHERE id=?",
+                                  [(*self.security.encrypt_many([recipient, message]), message_id)
+                                   for message_id, recipient, message in rows])
+            self.conn.commit()
+
+    def _rotate_keys(self):
+        """Re-encrypt unsent messages under the current key, so they still send once the old one is dropped"""
+        rows = self.conn.execute("SELECT id, recipient, message FROM email_queue WHERE status='pending'").fetchall()
+        if rows:
+            self.conn.executemany("UPDATE email_queue SET recipient=?, message=? WHERE id=?",
+                                  [(*self.security.rotate_many([recipient, message]), message_id)
+                                   for message_id, recipient, message in rows])
+            self.conn.commit()
+            logging.info(f"Re-encrypted {len(rows)} unsent emails under the current key",
+                         extra={"operation": "email", "rows": len(rows)})
+
+    def enqueue(self, recipient, msg):
+        encrypted = self.security.encrypt_many([recipient, msg.as_string()])
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO email_queue (recipient, message, created) VALUES (?, ?, datetime('now', 'localtime'))",
+                encrypted)
+            self.conn.commit()
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def status(self, message_id):
+        """Return (status, attempts, last_error); status is pending, sent or failed"""
+        with self.lock:
+            return self.conn.execute("SELECT status, attempts, last_error FROM email_queue WHERE id=?",
+                                     (message_id,)).fetchone()
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM email_queue WHERE status='pending'").fetchone()[0]
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="email-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _due_messages(self):
+        with self.lock:
+            return self.conn.execute("""SELECT id, recipient, message, attempts FROM email_queue
+                                     WHERE status='pending' AND next_attempt <= ? ORDER BY id LIMIT ?""",
+                                     (time.time(), self.batch_size)).fetchall()
+
+    def _mark_sent(self, message_id):
+        with self.lock:
+            self.conn.execute("""UPDATE email_queue SET status='sent', attempts=attempts+1, last_error=NULL,
+                              sent=datetime('now', 'localtime') WHERE id=?""", (message_id,))
+            self.conn.commit()
+
+    def _prune(self):
+        """Delete messages sent more than keep_sent_days ago, at most once an hour"""
+        if time.time() - self._pruned < 3600:
+            return
+        cutoff = (datetime.now() - timedelta(days=self.keep_sent_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM email_queue WHERE status='sent' AND sent < ?",
+                                        (cutoff,)).rowcount
+            self.conn.commit()
+        self._pruned = time.time()
+        if deleted:
+            logging.info(f"Pruned {deleted} sent emails", extra={"operation": "email", "rows": deleted})
+
+    def _mark_failed(self, message_id, attempts, error):
+        status = 'failed' if attempts >= self.max_attempts else 'pending'
+        next_attempt = time.time() + self.retry_delay * 2 ** (attempts - 1)
+        with self.lock:
+            self.conn.execute("UPDATE email_queue SET status=?, attempts=?, next_attempt=?, last_error=? WHERE id=?",
+                              (status, attempts, next_attempt, error, message_id))
+            self.conn.commit()
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _run(self):
+        import smtplib
+        server = None
+        sent_in_session = 0
+        last_used = time.time()
+        unmarked = []  # sent, but not yet marked so because the write failed; marked before anything is resent
+        while not self._stop.is_set():
+            try:
+                while unmarked:
+                    self._mark_sent(unmarked[0])
+                    unmarked.pop(0)
+                self._prune()
+                batch = self._due_messages()
+            except Exception:
+                # e.g. "database is locked"; the worker must outlive it, or no email is sent until a restart
+                logging.exception("Email queue failed to read or update the outbox", extra={"operation": "email"})
+                self._stop.wait(self.poll_interval)
+                continue
+            if not batch:
+                if server and time.time() - last_used > self.idle_timeout:
+                    self._close(server)
+                    server = None
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            for message_id, recipient, message, attempts in batch:
+                if self._stop.is_set():
+                    break
+                try:
+                    recipient, message = self.security.decrypt_many([recipient, message], remember=False)
+                except Exception as e:
+                    logging.error(f"Email {message_id} cannot be decrypted: {type(e).__name__}",
+                                  extra={"operation": "email", "message_id": message_id})
+                    self._try(self._mark_failed, message_id, self.max_attempts, "Message cannot be decrypted")
+                    continue
+                try:
+                    if server is None or sent_in_session >= self.max_per_session:
+                        if server:
+                            self._close(server)
+                        server = self.notif.connect()
+                        sent_in_session = 0
+                    with metrics.timer("email.queue_send"):
+                        server.sendmail(self.notif.email_sender, [recipient], message)
+                    sent_in_session += 1
+                except Exception as e:
+                    logging.error(f"Email failed: {str(e)}", extra={"operation": "email", "message_id": message_id})
+                    if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)) and server:
+                        # The session may be broken; reconnect for the next message
+                        self._close(server)
+                        server = None
+                    self._try(self._mark_failed, message_id, attempts + 1, str(e))
+                else:
+                    logging.info(f"Email sent to {recipient}", extra={"operation": "email", "message_id": message_id})
+                    if not self._try(self._mark_sent, message_id):
+                        unmarked.append(message_id)
+                last_used = time.time()
+        if server:
+            self._close(server)
+
+    def _try(self, update, *args):
+        """Run a status update, logging rather than raising if the database refuses it"""
+        try:
+            update(*args)
+            return True
+        except sqlite3.Error:
+            logging.exception("Email queue failed to update the outbox", extra={"operation": "email"})
+            return False
@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# WAL lets readers proceed while a payment is being written; NORMAL sync is
+# durable across application crashes and only fsyncs at checkpoints
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+def configure_connection(conn):
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+class ConnectionPool:
+    """One SQLite connection per thread, with a single serialized writer.
+
+    Readers on different threads run in parallel under WAL. Writes go
+    through transaction(), which holds write_lock so that read-modify-write
+    sequences such as update_payment cannot interleave.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.uri = False
+        if db_name == ":memory:":
+            # Every thread must see the same in-memory database
+            self.db_name, self.uri = f"file:memdb{id(self)}?mode=memory&cache=shared", True
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Keeps a shared in-memory database alive for the life of the pool
+        self.connection()
+
+    def connection(self):
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, uri=self.uri, check_same_thread=False)
+            configure_connection(conn)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction; nested use joins the outermost one"""
+        conn = self.connection()
+        with self.write_lock:
+            if self._local.depth:
+                self._local.depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._local.depth -= 1
+                return
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            self._local.depth = 1
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.depth = 0
+
+    def close_all(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
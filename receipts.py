@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+from itertools import groupby
+import logging
+
+def draw_receipt(c, receipt):
+    """Draw one receipt page; receipt is (payment_id, student_id, name, form, amount, total_paid, required_fee, date)"""
+    _, student_id, name, form, amount, total_paid, required_fee, date = receipt
+    c.setFillColorRGB(0.17, 0.62, 0.86)  # Blue color for header
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(300, 750, "School Fee Payment Receipt")
+    c.setFillColorRGB(0, 0, 0)  # Black for text
+    c.setFont("Helvetica", 12)
+    c.drawString(100, 720, "-" * 80)
+    c.drawString(100, 700, f"Date: {date}")
+    c.drawString(100, 680, f"Student ID: {student_id}")
+    c.drawString(100, 660, f"Student Name: {name}")
+    c.drawString(100, 640, f"Form: {form}")
+    c.drawString(100, 620, f"Amount Paid: {amount:,} TSH")
+    c.drawString(100, 600, f"Total Paid: {total_paid:,} TSH")
+    c.drawString(100, 580, f"Remaining: {required_fee - total_paid:,} TSH")
+    c.drawString(100, 540, "Thank you for your payment!")
+    c.drawString(100, 520, "-" * 80)
+    c.showPage()
+
+def render_pdf(filename, receipts):
+    """Render receipts as the pages of one PDF"""
+    # reportlab is imported on first use; it is most of the application's startup time
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(filename, pagesize=letter)
+    for receipt in receipts:
+        draw_receipt(c, receipt)
+    c.save()
+    return filename
+
+def render_each(output_dir, receipts):
+    """Render every receipt to its own PDF (runs inside worker processes)"""
+    return [render_pdf(os.path.join(output_dir, f"receipt_{receipt[1]}_{receipt[0]}.pdf"), [receipt])
+            for receipt in receipts]
+
+def open_file(filename):
+    import platform
+    if platform.system() == "Windows":
+        os.startfile(filename)
+    elif platform.system() == "Darwin":
+        os.system(f"open {filename}")
+    else:
+        os.system(f"xdg-open {filename}")
+
+class ReceiptRenderer:
+    def __init__(self, fee_structure, output_dir="."):
+        self.fee_structure = fee_structure
+        self.output_dir = output_dir
+
+    def render(self, student_id, name, form, amount, total_paid, required_fee=None):
+        """Render a receipt for a payment just made and return its filename.
+
+        required_fee defaults to the form's current fee.
+        """
+        return render_pdf(*self.prepare(student_id, name, form, amount, total_paid, required_fee))
+
+    def prepare(self, student_id, name, form, amount, total_paid, required_fee=None):
+        """Return the (filename, receipts) arguments of render_pdf for a payment just made.
+
+        Both are plain values, so the rendering can be sent to another process.
+        """
+        now = datetime.now()
+        filename = os.path.join(self.output_dir, f"receipt_{student_id}_{now.strftime('%Y%m%d_%H%M%S')}.pdf")
+        if required_fee is None:
+            required_fee = self.fee_structure[form]
+        return filename, [(None, student_id, name, form, amount, total_paid,
+                           required_fee, now.strftime('%Y-%m-%d %H:%M:%S'))]
+
+    def render_batch(self, receipts, workers=None, merge_by_form=False, chunk_size=50):
+        """Render receipts for draw_receipt's rows, e.g. from DatabaseManager.get_receipt_payments.
+
+        Work is spread over a process pool; workers=1 renders in this process.
+        With merge_by_form, each form gets one multi-page PDF instead of a file
+        per receipt. Returns the list of files written.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        receipts = list(receipts)
+        if merge_by_form:
+            receipts.sort(key=lambda receipt: receipt[3])
+            jobs = [(render_pdf, os.path.join(self.output_dir, f"receipts_{form.replace(' ', '_')}.pdf"), list(group))
+                    for form, group in groupby(receipts, key=lambda receipt: receipt[3])]
+        else:
+            jobs = [(render_each, self.output_dir, receipts[i:i + chunk_size])
+                    for i in range(0, len(receipts), chunk_size)]
+
+        if workers == 1 or len(jobs) <= 1:
+            results = [fn(target, batch) for fn, target, batch in jobs]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(fn, target, batch) for fn, target, batch in jobs]
+                results = [future.result() for future in futures]
+        files = []
+        for result in results:
+            files.extend(result if isinstance(result, list) else [result])
+        logging.info(f"Rendered {len(receipts)} receipts into {len(files)} files",
+                     extra={"operation": "receipt_batch", "rows": len(receipts)})
+        return files
@@ -0,0 +1,250 @@
+import argparse
+import csv
+import hashlib
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date as Date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from database import normalize_date
+from metrics import metrics
+import logging
+
+# Column names banks use for their own transaction identifier
+REFERENCE_ALIASES = ("transaction id", "transaction reference", "bank reference", "txn id", "receipt no")
+
+REPORT_COLUMNS = ["row", "reference", "student_id", "amount", "date", "status", "payment_id"]
+
+def read_statement_lines(path):
+    """Stream (reference, student_id, amount, date) tuples from a CSV bank statement.
+
+    Statements without a transaction ID column get a reference derived from
+    the line itself and how many identical lines precede it, so importing
+    the same file again yields the same references.
+    """
+    from import_payments import find_columns
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = find_columns(header)
+        normalized = [name.strip().lower() for name in header]
+        reference_column = next((normalized.index(alias) for alias in REFERENCE_ALIASES if alias in normalized), None)
+        occurrences = Counter()
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            student_id = row[columns["student_id"]].strip()
+            amount = row[columns["amount"]].replace(",", "").strip()
+            date = row[columns["date"]].strip() if "date" in columns else ""
+            reference = row[reference_column].strip() if reference_column is not None else ""
+            if not reference:
+                key = f"{student_id}|{amount}|{date}"
+                occurrences[key] += 1
+                reference = "auto-" + hashlib.sha1(f"{key}|{occurrences[key]}".encode()).hexdigest()[:20]
+            yield reference, student_id, amount, date
+
+def parse_amount(value):
+    """Return a statement amount such as "1250000.00" as whole TSH; raises ValueError for a fraction or non-number"""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        raise ValueError(f"Amount is not a whole number of TSH: {value!r}")
+    return int(amount)
+
+class Reconciler:
+    """Match bank statement lines against recorded payments.
+
+    Payments in the statement's date range (widened by window_days) are
+    loaded once into hash indexes keyed on (student_id, amount, day),
+    (student_id, amount) and (student_id, day), so each line is matched by
+    dictionary lookups instead of a scan. Each line gets one status:
+
+    matched          an unclaimed payment with the same student, amount and day
+    matched_window   the same student and amount within window_days
+    amount_mismatch  the student has an unclaimed payment that day for another amount
+    unmatched        no payment found; posted when apply=True
+    reconciled       the reference was recorded by an earlier run
+    duplicate        the reference appears earlier in this statement
+    rejected         unknown student, an amount that is not a positive whole number of TSH, or a missing
+                     or invalid date
+    """
+
+    def __init__(self, db_manager, window_days=3, chunk_size=500):
+        self.db = db_manager
+        self.window_days = window_days
+        self.chunk_size = chunk_size
+
+    def _parse(self, lines, known_ids):
+        """Yield [row, reference, student_id, amount, date, status, payment_id] report rows"""
+        for row_number, (reference, student_id, amount, date) in enumerate(lines, start=1):
+            try:
+                student_id, amount = int(student_id), parse_amount(amount)
+            except (TypeError, ValueError):
+                yield [row_number, reference, student_id, amount, date, "rejected", None]
+                continue
+            # normalize_date reads a blank as now(), which would match the line against today's payments
+            date = normalize_date(date) if date and date.strip() else None
+            status = None if student_id in known_ids and amount > 0 and date else "rejected"
+            yield [row_number, reference, student_id, amount, date, status, None]
+
+    def _load_payments(self, first_day, last_day):
+        """Return (id, student_id, amount, date) for payments in range not already reconciled"""
+        start = (Date.fromisoformat(first_day) - timedelta(days=self.window_days)).isoformat()
+        end = (Date.fromisoformat(last_day) + timedelta(days=self.window_days + 1)).isoformat()
+        return self.db.conn.execute("""SELECT p.id, p.student_id, p.amount, p.date FROM payments p
+                                    WHERE p.date >= ? AND p.date < ? AND NOT EXISTS
+                                    (SELECT 1 FROM payment_references r WHERE r.payment_id = p.id)""",
+                                    (start, end)).fetchall()
+
+    @metrics.timed("reconcile.statement")
+    def reconcile(self, lines, apply=False, statement=None):
+        """Classify statement lines and return (report, unclaimed).
+
+        report has one [row, reference, student_id, amount, date, status,
+        payment_id] list per line. unclaimed lists (payment_id, student_id,
+        amount, date, status) for payments within the statement's dates that
+        no line matched: "duplicate_posting" when a matched payment has the
+        same student, amount and day, otherwise "not_on_statement".
+
+        With apply=True, matches are recorded against their references and
+        unmatched lines are posted as payments, both idempotently.
+        """
+        start = time.perf_counter()
+        report = list(self._parse(lines, self.db.get_student_ids()))
+        valid = [line for line in report if line[5] is None]
+
+        # References seen before, in this statement or an earlier run
+        known = {}
+        references = [line[1] for line in valid]
+        for i in range(0, len(references), self.chunk_size):
+            batch = references[i:i + self.chunk_size]
+            known.update(self.db.conn.execute(f"""SELECT reference, payment_id FROM payment_references
+                                              WHERE reference IN ({','.join('?' * len(batch))})""", batch))
+        seen = set()
+        pending = []
+        for line in valid:
+            if line[1] in known:
+                line[5], line[6] = "reconciled", known[line[1]]
+            elif line[1] in seen:
+                line[5] = "duplicate"
+            else:
+                seen.add(line[1])
+                pending.append(line)
+
+        first_day = min((line[4][:10] for line in pending), default=None)
+        last_day = max((line[4][:10] for line in pending), default=None)
+        payments = self._load_payments(first_day, last_day) if pending else []
+        by_day = defaultdict(list)
+        by_amount = defaultdict(list)
+        by_student_day = defaultdict(list)
+        for payment_id, student_id, amount, date in payments:
+            day = date[:10]
+            by_day[(student_id, amount, day)].append(payment_id)
+            by_amount[(student_id, amount)].append((Date.fromisoformat(day).toordinal(), payment_id))
+            by_student_day[(student_id, day)].append(payment_id)
+        claimed = set()
+
+        # Exact matches first, so that a fuzzy match never takes a payment another line matches exactly
+        for line in pending:
+            for payment_id in by_day.get((line[2], line[3], line[4][:10]), ()):
+                if payment_id not in claimed:
+                    claimed.add(payment_id)
+                    line[5], line[6] = "matched", payment_id
+                    break
+        for line in pending:
+            if line[5] is not None:
+                continue
+            day = Date.fromisoformat(line[4][:10]).toordinal()
+            candidates = [(abs(ordinal - day), payment_id)
+                          for ordinal, payment_id in by_amount.get((line[2], line[3]), ())
+                          if payment_id not in claimed and abs(ordinal - day) <= self.window_days]
+            if candidates:
+                payment_id = min(candidates)[1]
+                claimed.add(payment_id)
+                line[5], line[6] = "matched_window", payment_id
+        # Only payments no line matched are offered as amount mismatches, so the
+        # outcome does not depend on line order and a re-import classifies alike
+        for line in pending:
+            if line[5] is not None:
+                continue
+            mismatched = [payment_id for payment_id in by_student_day.get((line[2], line[4][:10]), ())
+                          if payment_id not in claimed]
+            if mismatched:
+                line[5], line[6] = "amount_mismatch", mismatched[0]
+            else:
+                line[5] = "unmatched"
+
+        unclaimed = []
+        for payment_id, student_id, amount, date in payments:
+            if payment_id in claimed or not first_day <= date[:10] <= last_day:
+                continue
+            twin = any(other in claimed for other in by_day[(student_id, amount, date[:10])])
+            unclaimed.append((payment_id, student_id, amount, date,
+                              "duplicate_posting" if twin else "not_on_statement"))
+
+        if apply:
+            self._apply(pending, statement)
+        counts = Counter(line[5] for line in report)
+        logging.info(f"Reconciled {len(report)} statement lines: "
+                     + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())),
+                     extra={"operation": "reconcile", "rows": len(report), "file": statement,
+                            "duration_ms": round((time.perf_counter() - start) * 1000, 3)})
+        return report, unclaimed
+
+    def _apply(self, lines, statement):
+        created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        matches = [(line[1], line[6], line[5], statement, created) for line in lines
+                   if line[5] in ("matched", "matched_window")]
+        with self.db.pool.transaction() as conn:
+            conn.executemany("""INSERT OR IGNORE INTO payment_references
+                             (reference, payment_id, status, statement, created) VALUES (?, ?, ?, ?, ?)""", matches)
+        unmatched = [line for line in lines if line[5] == "unmatched"]
+        for i in range(0, len(unmatched), self.chunk_size):
+            chunk = unmatched[i:i + self.chunk_size]
+            posted = self.db.post_referenced_payments([tuple(line[1:5]) for line in chunk], statement)
+            for line in chunk:
+                if line[1] in posted:
+                    line[5], line[6] = "posted", posted[line[1]]
+
+if __name__ == "__main__":
+    from security import SecurityManager
+    from database import DatabaseManager
+    from federation import campus_database
+    from logs import setup_logging
+    from main import load_config
+
+    parser = argparse.ArgumentParser(description="Reconcile a CSV bank statement against recorded payments")
+    parser.add_argument("statement", help="CSV file with student ID, amount, date and optional transaction ID columns")
+    parser.add_argument("--apply", action="store_true",
+                        help="Record matches and post unmatched lines; without it nothing is written")
+    parser.add_argument("--window", type=int, default=3, help="Days a deposit may differ from its payment's date")
+    parser.add_argument("--report", help="Write the per-line report to this CSV file")
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+
+    report, unclaimed = Reconciler(db, args.window).reconcile(read_statement_lines(args.statement), args.apply,
+                                                              args.statement)
+    out = open(args.report, 'w', newline='') if args.report else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(report)
+        writer.writerows([("", "", student_id, amount, date, status, payment_id)
+                          for payment_id, student_id, amount, date, status in unclaimed])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    counts = Counter(line[5] for line in report)
+    print(", ".join(f"{count} {status}" for status, count in sorted(counts.items())), file=sys.stderr)
+    print(f"{len(unclaimed)} recorded payments not on the statement", file=sys.stderr)
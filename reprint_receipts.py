@@ -0,0 +1,29 @@
+import argparse
+from security import SecurityManager
+from database import DatabaseManager
+from federation import campus_database
+from receipts import ReceiptRenderer
+from logs import setup_logging
+from main import load_config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reprint payment receipts without opening a viewer")
+    parser.add_argument("--form", help="Only reprint receipts for this form, e.g. \"Form 3\"")
+    parser.add_argument("--output", default="receipts", help="Directory to write PDFs into")
+    parser.add_argument("--merge", action="store_true", help="Write one multi-page PDF per form")
+    parser.add_argument("--workers", type=int, help="Rendering processes (default: one per CPU)")
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+
+    renderer = ReceiptRenderer(db.fees, args.output)
+    files = renderer.render_batch(db.get_receipt_payments(args.form), args.workers, args.merge)
+    print(f"Wrote {len(files)} file(s) to {args.output}")
@@ -0,0 +1,22 @@
+import argparse
+import os
+import sys
+from backups import restore_backup
+from logs import setup_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restore the fee database from backup zips")
+    parser.add_argument("full_backup", help="Full backup zip created by BackupManager.create_backup")
+    parser.add_argument("incrementals", nargs="*", help="Incremental backup zips taken after the full backup")
+    parser.add_argument("--target", default="school_fees.db")
+    parser.add_argument("--force", action="store_true", help="Overwrite an existing target database")
+    args = parser.parse_args()
+    setup_logging()
+
+    if os.path.exists(args.target) and not args.force:
+        sys.exit(f"{args.target} exists; close the application and pass --force to overwrite it")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(args.target + suffix):
+            os.remove(args.target + suffix)
+    restore_backup(args.full_backup, args.incrementals, args.target)
+    print(f"Restored {args.target} from {1 + len(args.incrementals)} backup(s)")
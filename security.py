@@ -1,23 +1,168 @@
-from cryptography.fernet import Fernet
-import hashlib
+from collections import OrderedDict
 import base64
+import binascii
+import hashlib
+import hmac
+import os
+import threading
+
+# Override with a "password_hashing" section in config.json; see
+# benchmarks/calibrate_password_hashing.py for picking costs
+DEFAULT_PASSWORD_HASHING = {"algorithm": "scrypt", "n": 2 ** 14, "r": 8, "p": 1}
+MIN_PASSWORD_LENGTH = 6
+
+def scrypt_maxmem(n, r, p):
+    return 128 * r * (n + p + 2) + 1024 * 1024
+
+def check_key(key):
+    try:
+        valid_key = len(base64.urlsafe_b64decode(key.encode())) == 32
+    except (binascii.Error, ValueError):
+        valid_key = False
+    if not valid_key:
+        raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+
+def check_password_policy(password):
+    if len(password or "") < MIN_PASSWORD_LENGTH:
+        raise ValueError(f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
+
+def key_fingerprint(key):
+    """Short identifier for a key that does not reveal it"""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
 
 class SecurityManager:
-    def __init__(self, key):
-        self.cipher = Fernet(key.encode())
+    def __init__(self, key, cache_size=50000, password_hashing=None, previous_keys=None):
+        """key encrypts; previous_keys (config.json's "previous_encryption_keys")
+        can still decrypt while key_rotation.py re-encrypts stored contacts"""
+        for value in [key, *(previous_keys or ())]:
+            check_key(value)
+        self.key = key
+        self.previous_keys = list(previous_keys or ())
+        self._cipher = None
+        self.password_hashing = password_hashing or DEFAULT_PASSWORD_HASHING
+        # Decrypted contact details keyed by ciphertext, least recently used first
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def cipher(self):
+        # cryptography is imported when contact details are first encrypted or decrypted, not at login
+        if self._cipher is None:
+            from cryptography.fernet import Fernet, MultiFernet
+            # MultiFernet encrypts with the first key and tries each in turn to decrypt
+            self._cipher = MultiFernet([Fernet(key.encode()) for key in [self.key, *self.previous_keys]])
+        return self._cipher
+
+    @property
+    def key_id(self):
+        return key_fingerprint(self.key)
 
     def encrypt_data(self, data):
         """Encrypt sensitive data"""
         return self.cipher.encrypt(data.encode()).decode()
 
     def decrypt_data(self, encrypted_data):
-        """Decrypt sensitive data"""
-        return self.cipher.decrypt(encrypted_data.encode()).decode()
+        """Decrypt sensitive data, reusing recently decrypted values"""
+        with self._cache_lock:
+            if encrypted_data in self._cache:
+                self._cache.move_to_end(encrypted_data)
+                return self._cache[encrypted_data]
+        value = self.cipher.decrypt(encrypted_data.encode()).decode()
+        with self._cache_lock:
+            self._remember(encrypted_data, value)
+        return value
+
+    def encrypt_many(self, values):
+        """Encrypt a batch of values"""
+        return [self.cipher.encrypt(value.encode()).decode() for value in values]
+
+    def decrypt_many(self, encrypted_values, remember=True):
+        """Decrypt a batch of values, taking the cache lock once per batch.
+
+        One-off sweeps such as reminder campaigns pass remember=False so they
+        do not evict the contacts the desk is actually working with.
+        """
+        encrypted_values = list(encrypted_values)
+        with self._cache_lock:
+            results = [self._cache.get(value) for value in encrypted_values]
+            for value, result in zip(encrypted_values, results):
+                if result is not None:
+                    self._cache.move_to_end(value)
+        misses = {value: self.cipher.decrypt(value.encode()).decode()
+                  for value, result in zip(encrypted_values, results) if result is None}
+        if remember:
+            with self._cache_lock:
+                for value, plain in misses.items():
+                    self._remember(value, plain)
+        return [misses[value] if result is None else result for value, result in zip(encrypted_values, results)]
+
+    def rotate_many(self, encrypted_values):
+        """Re-encrypt a batch of values under the current key"""
+        return [self.cipher.rotate(value.encode()).decode() for value in encrypted_values]
+
+    def _remember(self, encrypted_data, value):
+        if self.cache_size <= 0:
+            return
+        self._cache[encrypted_data] = value
+        self._cache.move_to_end(encrypted_data)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, *encrypted_values):
+        """Drop cached plaintext for ciphertexts that are being replaced"""
+        with self._cache_lock:
+            for value in encrypted_values:
+                self._cache.pop(value, None)
+
+    def clear_cache(self):
+        """Wipe all cached plaintext, e.g. on logout"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def hash_password(self, password, params=None):
+        """Hash passwords with a salted KDF; the hash records its algorithm and cost"""
+        params = params or self.password_hashing
+        salt = os.urandom(16)
+        if params["algorithm"] == "scrypt":
+            n, r, p = params["n"], params["r"], params["p"]
+            key = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=scrypt_maxmem(n, r, p), dklen=32)
+            return f"scrypt${n}${r}${p}${salt.hex()}${key.hex()}"
+        if params["algorithm"] == "pbkdf2_sha256":
+            iterations = params["iterations"]
+            key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+            return f"pbkdf2_sha256${iterations}${salt.hex()}${key.hex()}"
+        raise ValueError(f"Unknown password hashing algorithm: {params['algorithm']}")
+
+    def check_password(self, password, stored_hash):
+        """Verify password against a stored hash.
 
-    def hash_password(self, password):
-        """Hash passwords using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        Returns (matches, replacement) where replacement is a fresh hash when
+        the stored one is a legacy SHA-256 digest or uses outdated parameters,
+        else None.
+        """
+        algorithm, _, rest = stored_hash.partition("$")
+        if not rest:
+            # Legacy unsalted SHA-256 hex digest
+            matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+            return matches, self.hash_password(password) if matches else None
+        fields = rest.split("$")
+        if algorithm == "scrypt":
+            n, r, p = (int(field) for field in fields[:3])
+            params = {"algorithm": algorithm, "n": n, "r": r, "p": p}
+            salt, expected = bytes.fromhex(fields[3]), bytes.fromhex(fields[4])
+            key = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=scrypt_maxmem(n, r, p),
+                                 dklen=len(expected))
+        elif algorithm == "pbkdf2_sha256":
+            params = {"algorithm": algorithm, "iterations": int(fields[0])}
+            salt, expected = bytes.fromhex(fields[1]), bytes.fromhex(fields[2])
+            key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["iterations"])
+        else:
+            return False, None
+        matches = hmac.compare_digest(key, expected)
+        outdated = any(self.password_hashing.get(name) != value for name, value in params.items())
+        return matches, self.hash_password(password) if matches and outdated else None
 
 # Generate a key for encryption if needed (run once and store in config)
 # key = Fernet.generate_key()
-# print(key.decode())
\ No newline at end of file
+# print(key.decode())
@@ -0,0 +1,276 @@
+import asyncio
+import hmac
+import ipaddress
+import json
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+from metrics import metrics
+import logging
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+           404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+# Requests are small JSON documents; anything bigger is refused before it is read
+MAX_BODY = 1024 * 1024
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class PaymentBatcher:
+    """Coalesce concurrent payment requests into one write transaction.
+
+    Requests that arrive while a batch is being written are queued and
+    committed together by the next post_payments call, so throughput grows
+    with load without adding latency when the server is idle.
+    """
+
+    def __init__(self, db, executor, max_batch=500):
+        self.db = db
+        self.executor = executor
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+
+    async def submit(self, student_id, amount):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((student_id, amount, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(self.executor, self.db.post_payments,
+                                                     [(student_id, amount) for student_id, amount, _ in batch])
+            except Exception as e:
+                logging.error(f"Payment batch of {len(batch)} failed: {str(e)}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+
+class FeeServer:
+    """Local HTTP/JSON API over a DatabaseManager for several cashier desks"""
+
+    def __init__(self, db, backup_manager=None, token=None, workers=8):
+        self.db = db
+        self.backup = backup_manager
+        self.token = token
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fee-api")
+        self.batcher = PaymentBatcher(db, self.executor)
+        self.routes = [
+            ("GET", r"/students", self.list_students),
+            ("POST", r"/students", self.add_student),
+            ("GET", r"/students/search", self.search_students),
+            ("GET", r"/students/(\d+)", self.get_student),
+            ("GET", r"/students/(\d+)/payments", self.payment_history),
+            ("GET", r"/students/(\d+)/balance", self.student_balance),
+            ("GET", r"/fees", self.fees),
+            ("POST", r"/payments", self.post_payment),
+            ("GET", r"/balances", self.balances),
+            ("GET", r"/balances/daily", self.daily_balances),
+            ("GET", r"/balances/check", self.check_balances),
+            ("POST", r"/balances/rebuild", self.rebuild_balances),
+            ("GET", r"/history/payments", self.history_payments),
+            ("GET", r"/history/monthly", self.history_monthly),
+            ("GET", r"/history/terms", self.history_terms),
+            ("GET", r"/users", self.has_users),
+            ("POST", r"/users", self.register_user),
+            ("POST", r"/login", self.login),
+            ("GET", r"/users/([^/]+)/role", self.user_role),
+            ("GET", r"/users/([^/]+)/security-question", self.security_question),
+            ("POST", r"/users/([^/]+)/security-answer", self.verify_security_answer),
+            ("POST", r"/users/([^/]+)/password", self.reset_password),
+            ("POST", r"/backups", self.create_backup),
+        ]
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        # Without a token any machine that can reach the port could post payments and read contacts
+        if not self.token and not is_loopback(host):
+            raise ValueError(f"Refusing to listen on {host} without an API token; "
+                             "set \"token\" in config.json's \"server\" section or listen on 127.0.0.1")
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        batcher = asyncio.create_task(self.batcher.run())
+        logging.info(f"Fee API listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if not 0 <= length <= MAX_BODY:
+                    status, payload = 413, {"error": f"Request body over {MAX_BODY} bytes"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length)
+                    status, payload = await self.dispatch(method, target, headers, body)
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body):
+        # Compared in constant time, so response timing does not reveal how much of a guess was right
+        if self.token and not hmac.compare_digest(headers.get("x-api-token", "").encode(), self.token.encode()):
+            return 401, {"error": "Missing or invalid API token"}
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            start = time.perf_counter()
+            try:
+                data = json.loads(body) if body else {}
+                return await handler(query, data, *(unquote(group) for group in match.groups()))
+            except (KeyError, ValueError, TypeError) as e:
+                return 400, {"error": f"Bad request: {e}"}
+            except sqlite3.Error as e:
+                logging.error(f"API {method} {url.path} failed: {str(e)}")
+                return 500, {"error": "Database error"}
+            except Exception as e:
+                logging.error(f"API {method} {url.path} failed: {str(e)}")
+                return 500, {"error": "Internal error"}
+            finally:
+                metrics.record(f"api.{handler.__name__}", time.perf_counter() - start)
+        return (405, {"error": "Method not allowed"}) if allowed else (404, {"error": "Not found"})
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def list_students(self, query, data):
+        return 200, await self.run(self.db.get_students_page, int(query.get("after_id", 0)),
+                                   int(query.get("limit", 200)))
+
+    async def search_students(self, query, data):
+        return 200, await self.run(self.db.search_students, query.get("q", ""), int(query.get("limit", -1)),
+                                   int(query.get("offset", 0)))
+
+    async def get_student(self, query, data, student_id):
+        student = await self.run(self.db.get_student, int(student_id))
+        return (200, student) if student else (404, {"error": "Student not found"})
+
+    async def add_student(self, query, data):
+        student_id = await self.run(self.db.add_student, data["name"], data["form"], data["email"], data["phone"])
+        return 201, {"id": student_id}
+
+    async def payment_history(self, query, data, student_id):
+        return 200, await self.run(self.db.get_payment_history, int(student_id), int(query.get("limit", -1)))
+
+    async def student_balance(self, query, data, student_id):
+        balance = await self.run(self.db.get_balance, int(student_id))
+        return (200, balance) if balance else (404, {"error": "Student not found"})
+
+    async def fees(self, query, data):
+        return 200, await self.run(self.db.get_fees)
+
+    async def post_payment(self, query, data):
+        amount = int(data["amount"])
+        if amount <= 0:
+            return 400, {"error": "Amount must be positive"}
+        new_total = await self.batcher.submit(int(data["student_id"]), amount)
+        if new_total is None:
+            return 404, {"error": "Student not found"}
+        return 201, {"total_paid": new_total}
+
+    async def balances(self, query, data):
+        return 200, await self.run(self.db.ledger.form_totals)
+
+    async def daily_balances(self, query, data):
+        return 200, await self.run(self.db.ledger.daily_totals, query["day"])
+
+    async def check_balances(self, query, data):
+        return 200, await self.run(self.db.ledger.check_consistency)
+
+    async def rebuild_balances(self, query, data):
+        await self.run(self.db.ledger.rebuild)
+        return 200, {"rebuilt": True}
+
+    def history_filters(self, query):
+        """(student_id, form, start, end) for PaymentHistory from a query string"""
+        student_id = int(query["student_id"]) if "student_id" in query else None
+        return student_id, query.get("form"), query.get("start"), query.get("end")
+
+    async def history_payments(self, query, data):
+        before = (query["before_date"], int(query["before_id"])) if "before_date" in query else None
+        return 200, await self.run(self.db.history.page, *self.history_filters(query), before,
+                                   int(query.get("limit", 100)))
+
+    async def history_monthly(self, query, data):
+        return 200, await self.run(self.db.history.monthly, *self.history_filters(query))
+
+    async def history_terms(self, query, data):
+        return 200, await self.run(self.db.history.terms, *self.history_filters(query))
+
+    async def has_users(self, query, data):
+        return 200, {"has_users": await self.run(self.db.has_users)}
+
+    async def register_user(self, query, data):
+        # Only the first account can be created remotely, matching the UI's first-run flow
+        if await self.run(self.db.has_users):
+            return 403, {"error": "Users already exist"}
+        await self.run(self.db.register_user, data["username"], data["password"], data["question"], data["answer"])
+        return 201, {"username": data["username"]}
+
+    async def login(self, query, data):
+        return 200, {"authenticated": await self.run(self.db.authenticate_user, data["username"], data["password"])}
+
+    async def user_role(self, query, data, username):
+        return 200, {"is_admin": await self.run(self.db.is_admin, username)}
+
+    async def security_question(self, query, data, username):
+        info = await self.run(self.db.get_user_security_info, username)
+        return (200, {"question": info[1]}) if info else (404, {"error": "User not found"})
+
+    async def verify_security_answer(self, query, data, username):
+        return 200, {"verified": bool(await self.run(self.db.verify_security_answer, username, data["answer"]))}
+
+    async def reset_password(self, query, data, username):
+        if not await self.run(self.db.verify_security_answer, username, data["answer"]):
+            return 403, {"error": "Incorrect security answer"}
+        await self.run(self.db.update_password, username, data["new_password"])
+        return 200, {"username": username}
+
+    async def create_backup(self, query, data):
+        if self.backup is None:
+            return 404, {"error": "Backups are not enabled on this server"}
+        if data.get("incremental"):
+            backup_file = await self.run(self.backup.create_incremental_backup)
+        else:
+            backup_file = await self.run(self.backup.create_backup)
+        return (201, {"file": backup_file}) if backup_file else (500, {"error": "Backup failed"})
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+from string import Template
+from urllib.parse import urlencode, urlsplit
+from metrics import metrics
+from notifications import Notifier
+import logging
+
+TWILIO_API = "https://api.twilio.com"
+
+PAYMENT_TEMPLATE = ("$name ($form): payment of $amount TSH received. Paid $total_paid of $required_fee TSH, "
+                    "balance $balance TSH.")
+REMINDER_TEMPLATE = ("$name ($form) has an outstanding school fee balance of $balance TSH. "
+                     "Please pay at the school office.")
+
+class HTTPConnectionPool:
+    """Up to size keep-alive HTTP/1.1 connections to one host, shared by the coroutines of one event loop"""
+
+    def __init__(self, base_url, size=4, timeout=30):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.ssl = url.scheme == "https"
+        self.port = url.port or (443 if self.ssl else 80)
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._slots = None
+
+    async def _connect(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl or None),
+                                      self.timeout)
+
+    async def _exchange(self, reader, writer, method, path, headers, body):
+        head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n{head}\r\n"
+                     .encode() + body)
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("Connection closed by server")
+        status = int(line.split()[1])
+        response_headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                data += await reader.readexactly(size)
+                await reader.readline()
+            await reader.readline()
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+            response_headers["connection"] = "close"
+        return status, response_headers, data
+
+    async def request(self, method, path, headers, body=b""):
+        """Return (status, headers, body); waits for a free connection when all size are busy"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._connect()
+            try:
+                try:
+                    response = await asyncio.wait_for(self._exchange(reader, writer, method, path, headers, body),
+                                                      self.timeout)
+                except ConnectionResetError:
+                    if not reused:
+                        raise
+                    # The server closed the idle connection before reading the request
+                    writer.close()
+                    reader, writer = await self._connect()
+                    response = await asyncio.wait_for(self._exchange(reader, writer, method, path, headers, body),
+                                                      self.timeout)
+            except BaseException:
+                writer.close()
+                raise
+            if response[1].get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return response
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+class SMSGateway:
+    """Client for Twilio's Messages API"""
+
+    def __init__(self, sid, token, sender, base_url=TWILIO_API, max_connections=4, timeout=30):
+        self.sender = sender
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.path = f"/2010-04-01/Accounts/{sid}/Messages.json"
+        self._headers = {"Authorization": "Basic " + base64.b64encode(f"{sid}:{token}".encode()).decode(),
+                         "Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"}
+        self._http = None
+
+    async def send(self, to, body):
+        """Submit one message and return (HTTP status, headers, decoded JSON body)"""
+        # The pool belongs to the event loop that first uses it; close() lets another loop start afresh
+        if self._http is None:
+            self._http = HTTPConnectionPool(self.base_url, self.max_connections, self.timeout)
+        status, headers, data = await self._http.request(
+            "POST", self.path, self._headers, urlencode({"To": to, "From": self.sender, "Body": body}).encode())
+        try:
+            response = json.loads(data) if data else {}
+        except ValueError:
+            response = None
+        if not isinstance(response, dict):
+            response = {"message": data[:200].decode(errors="replace")}
+        return status, headers, response
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+class RateLimiter:
+    """Spaces sends rate per second apart across all coroutines; pause() holds them all back"""
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+class SMSQueue:
+    """Persistent outbound SMS queue drained by a background asyncio loop.
+
+    Due messages are read in batches. Each batch is sent concurrently over
+    the gateway's connections, spaced to at most rate messages per second,
+    and its results are written back in one transaction. A 429 from the
+    provider pauses all sending for its Retry-After and requeues the
+    message without counting an attempt; other 4xx responses fail it at
+    once; network errors and 5xx responses are retried with exponential
+    backoff. A recipient that cannot be decrypted fails its own message. If
+    a batch's results cannot be written, the worker logs it and writes them
+    before sending anything else, so nothing already sent goes out twice.
+    """
+
+    def __init__(self, db_manager, gateway, rate=10, batch_size=100, max_attempts=5, retry_delay=5,
+                 poll_interval=2):
+        self.db = db_manager
+        self.gateway = gateway
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, messages):
+        """Queue (student_id, encrypted recipient, body) messages and return their IDs"""
+        created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.db.pool.transaction() as conn:
+            ids = [conn.execute("INSERT INTO sms_messages (student_id, recipient, body, created) VALUES (?, ?, ?, ?)",
+                                (student_id, recipient, body, created)).lastrowid
+                   for student_id, recipient, body in messages]
+        self._wakeup.set()
+        return ids
+
+    def status(self, message_id):
+        """Return (status, attempts, last_error); status is pending, sent or failed"""
+        return self.db.conn.execute("SELECT status, attempts, last_error FROM sms_messages WHERE id=?",
+                                    (message_id,)).fetchone()
+
+    def counts(self):
+        return dict(self.db.conn.execute("SELECT status, COUNT(*) FROM sms_messages GROUP BY status"))
+
+    def pending_count(self):
+        return self.db.conn.execute("SELECT COUNT(*) FROM sms_messages WHERE status='pending'").fetchone()[0]
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="sms-queue", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the batch in flight"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _due_messages(self):
+        return self.db.conn.execute("""SELECT id, recipient, body, attempts FROM sms_messages
+                                    WHERE status='pending' AND next_attempt <= ? ORDER BY id LIMIT ?""",
+                                    (time.time(), self.batch_size)).fetchall()
+
+    async def _run(self):
+        limiter = RateLimiter(self.rate)
+        unrecorded = None  # results of a batch whose write failed; recorded before anything is resent
+        try:
+            while not self._stop.is_set():
+                try:
+                    if unrecorded:
+                        self._record(*unrecorded)
+                        unrecorded = None
+                    batch = self._due_messages()
+                    if not batch:
+                        await asyncio.to_thread(self._wakeup.wait, self.poll_interval)
+                        self._wakeup.clear()
+                        continue
+                    start = time.perf_counter()
+                    results = await asyncio.gather(*(self._send(limiter, message_id, recipient, body, attempts)
+                                                     for message_id, recipient, body, attempts in batch))
+                    unrecorded = (results, time.perf_counter() - start)
+                    self._record(*unrecorded)
+                    unrecorded = None
+                except Exception:
+                    # e.g. "database is locked"; the worker must outlive it, or nothing is sent until a restart
+                    logging.exception("SMS batch failed", extra={"operation": "sms"})
+                    await asyncio.to_thread(self._stop.wait, self.poll_interval)
+        finally:
+            await self.gateway.close()
+
+    def _decrypt(self, recipient):
+        # One row at a time, so a recipient no key can read fails only its own message
+        return self.db.security.decrypt_many([recipient], remember=False)[0]
+
+    async def _send(self, limiter, message_id, recipient, body, attempts):
+        """Return (message_id, status, attempts, next_attempt, provider_id, error); never raises"""
+        try:
+            recipient = self._decrypt(recipient)
+        except Exception as e:
+            return message_id, "failed", attempts + 1, 0, None, f"Recipient cannot be decrypted: {type(e).__name__}"
+        await limiter.wait()
+        start = time.perf_counter()
+        try:
+            status, headers, response = await self.gateway.send(recipient, body)
+        except Exception as e:
+            # Network errors, timeouts and malformed responses alike; the message is retried
+            return self._retry(message_id, attempts + 1, str(e) or type(e).__name__)
+        finally:
+            metrics.record("sms.send", time.perf_counter() - start)
+        if status in (200, 201):
+            return message_id, "sent", attempts + 1, 0, response.get("sid"), None
+        error = f"HTTP {status}: {response.get('message', '')} ({response.get('code', '')})"
+        if status == 429:
+            try:
+                delay = float(headers.get("retry-after") or self.retry_delay)
+            except ValueError:
+                delay = self.retry_delay
+            limiter.pause(delay)
+            return message_id, "pending", attempts, time.time() + delay, None, error
+        if status < 500:
+            return message_id, "failed", attempts + 1, 0, None, error
+        return self._retry(message_id, attempts + 1, error)
+
+    def _retry(self, message_id, attempts, error):
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        return message_id, status, attempts, time.time() + self.retry_delay * 2 ** (attempts - 1), None, error
+
+    def _record(self, results, elapsed):
+        sent = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.db.pool.transaction() as conn:
+            conn.executemany("""UPDATE sms_messages SET status=?, attempts=?, next_attempt=?, provider_id=?,
+                             last_error=?, sent=? WHERE id=?""",
+                             [(status, attempts, next_attempt, provider_id, error, sent if status == "sent" else None,
+                               message_id)
+                              for message_id, status, attempts, next_attempt, provider_id, error in results])
+        outcomes = {}
+        for message_id, status, attempts, _, _, error in results:
+            throttled = status == "pending" and error and error.startswith("HTTP 429")
+            status = "throttled" if throttled else "retrying" if status == "pending" else status
+            outcomes[status] = outcomes.get(status, 0) + 1
+            if error and not throttled:
+                logging.error(f"SMS {message_id} failed on attempt {attempts}: {error}",
+                              extra={"operation": "sms", "message_id": message_id})
+        if outcomes.get("throttled"):
+            logging.warning(f"Provider rate limit hit; {outcomes['throttled']} SMS deferred")
+        logging.info(f"SMS batch of {len(results)}: " + ", ".join(f"{count} {status}"
+                                                                  for status, count in sorted(outcomes.items())),
+                     extra={"operation": "sms", "rows": len(results), "duration_ms": round(elapsed * 1000, 3)})
+
+class SMSNotifier(Notifier):
+    """Payment confirmations and balance reminders by SMS to parent_phone"""
+    channel = "sms"
+
+    def __init__(self, db_manager, gateway, rate=10, payment_template=PAYMENT_TEMPLATE, **queue_options):
+        self.db = db_manager
+        self.payment_template = Template(payment_template)
+        self.queue = SMSQueue(db_manager, gateway, rate, **queue_options)
+
+    def contact(self, student):
+        return student[3]
+
+    def queue_payment(self, student_id, name, form, contact, amount, total_paid, required_fee):
+        body = self.payment_template.substitute(name=name, form=form, amount=f"{amount:,}",
+                                                total_paid=f"{total_paid:,}", required_fee=f"{required_fee:,}",
+                                                balance=f"{required_fee - total_paid:,}")
+        return self.queue.enqueue([(student_id, self.db.security.encrypt_data(contact), body)])[0]
+
+    def delivery_status(self, message_id):
+        return self.queue.status(message_id)
+
+    def queue_reminders(self, threshold, template=REMINDER_TEMPLATE, batch_size=1000):
+        """Queue a reminder to every parent whose balance is above threshold and return how many.
+
+        Recipients are copied still encrypted from students.parent_phone, so
+        nothing is decrypted until the message is sent.
+        """
+        template = Template(template)
+        after_id = queued = 0
+        while True:
+            rows = self.db.conn.execute("""SELECT s.id, s.name, s.form, b.paid, b.balance, s.parent_phone
+                                        FROM students s JOIN student_balances b ON b.student_id = s.id
+                                        WHERE s.id > ? AND b.balance > ? ORDER BY s.id LIMIT ?""",
+                                        (after_id, threshold, batch_size)).fetchall()
+            if not rows:
+                break
+            self.queue.enqueue([(student_id, phone, template.substitute(name=name, form=form, total_paid=f"{paid:,}",
+                                                                        balance=f"{balance:,}"))
+                                for student_id, name, form, paid, balance, phone in rows])
+            queued += len(rows)
+            after_id = rows[-1][0]
+        logging.info(f"Queued {queued} SMS reminders for balances above {threshold:,} TSH",
+                     extra={"operation": "sms_reminders", "rows": queued})
+        return queued
+
+def sms_notifier(db_manager, twilio_config):
+    """Build an SMSNotifier from config.json's "twilio" section"""
+    gateway = SMSGateway(twilio_config["sid"], twilio_config["token"], twilio_config["phone"],
+                         twilio_config.get("base_url", TWILIO_API), twilio_config.get("max_connections", 4))
+    return SMSNotifier(db_manager, gateway, twilio_config.get("rate", 10))
+
+if __name__ == "__main__":
+    from security import SecurityManager
+    from database import DatabaseManager
+    from federation import campus_database
+    from logs import setup_logging
+    from main import load_config
+
+    parser = argparse.ArgumentParser(description="Send SMS balance reminders through Twilio")
+    commands = parser.add_subparsers(dest="command", required=True)
+    remind_parser = commands.add_parser("remind", help="Queue and send a reminder to every parent above a balance")
+    remind_parser.add_argument("threshold", type=int)
+    commands.add_parser("status", help="Count messages by status")
+    parser.add_argument("--campus", help="Campus whose database to open, from config.json's \"campuses\"")
+    args = parser.parse_args()
+
+    config = load_config()
+    setup_logging(config.get("logging"))
+    security = SecurityManager(config["encryption_key"], previous_keys=config.get("previous_encryption_keys"))
+    try:
+        db_name = campus_database(config, args.campus)
+    except ValueError as e:
+        parser.error(str(e))
+    db = DatabaseManager(db_name, security, config["fee_structure"])
+    notifier = sms_notifier(db, config["twilio"])
+
+    if args.command == "remind":
+        queued = notifier.queue_reminders(args.threshold)
+        start = time.perf_counter()
+        notifier.queue.start()
+        try:
+            while (pending := notifier.queue.pending_count()):
+                print(f"\r{queued - pending}/{queued} handled", end="", file=sys.stderr)
+                time.sleep(0.5)
+        finally:
+            notifier.queue.stop()
+        elapsed = time.perf_counter() - start
+        print(f"\r{queued} reminders handled in {elapsed:.1f}s ({queued / elapsed if elapsed else 0:.1f} msg/s)",
+              file=sys.stderr)
+    print(", ".join(f"{count} {status}" for status, count in sorted(notifier.queue.counts().items())) or "No messages")
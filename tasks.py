@@ -0,0 +1,209 @@
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import logging
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+class JobCancelled(Exception):
+    """Raised by Job.check() inside a job that has been cancelled"""
+
+class Job:
+    def __init__(self, id, name, process=False):
+        self.id = id
+        self.name = name
+        self.process = process
+        self.state = PENDING
+        self.progress = (0, None, None)  # (done, total, message), replaced whole by report()
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """Ask the job to stop: a pending job never starts, a running one stops at its next check()"""
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def report(self, done, total=None, message=None):
+        """Publish progress from the worker; the UI sees only the latest report on its next poll"""
+        self.progress = (done, total, message)
+
+    @property
+    def active(self):
+        return self.state in (PENDING, RUNNING)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+class TaskExecutor:
+    """Run jobs on worker threads or processes; root.after() delivers their callbacks on the Tk thread"""
+
+    def __init__(self, root, workers=4, process_workers=1, poll_ms=50, history=50, profiler=None):
+        self.root = root
+        # A metrics.Profiler whose captures include the jobs run on worker threads
+        self.profiler = profiler
+        self.poll_ms = poll_ms
+        self.history = history
+        self.threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-task")
+        self.process_workers = process_workers
+        self.processes = None  # started on the first process job
+        self.jobs = deque()
+        self.finished = queue.SimpleQueue()  # jobs whose future is done, put by the pools' threads
+        self.callbacks = {}
+        self.ids = itertools.count(1)
+        self.after_id = None
+
+    def submit(self, name, fn, *args, on_done=None, on_error=None, on_progress=None, process=False):
+        """Run fn in the background and return its Job. Call from the Tk thread.
+
+        On a worker thread fn is called as fn(job, *args) and can report
+        progress and check for cancellation through job. With process=True,
+        fn(*args) runs in a worker process instead, so fn and its arguments
+        must be picklable and the job can only be cancelled before it starts.
+        on_done(result), on_error(exception) and on_progress(done, total,
+        message) are called on the Tk thread.
+        """
+        job = Job(next(self.ids), name, process)
+        if process:
+            if self.processes is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Spawned rather than forked, so workers do not inherit the Tk connection or held locks
+                self.processes = ProcessPoolExecutor(max_workers=self.process_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            job.future = self.processes.submit(fn, *args)
+        else:
+            job.future = self.threads.submit(self._run, job, fn, args)
+        self.callbacks[job.id] = (on_done, on_error, on_progress, None)
+        self.jobs.append(job)
+        job.future.add_done_callback(lambda future: self.finished.put(job))
+        self._schedule()
+        return job
+
+    def _run(self, job, fn, args):
+        if job.cancelled:
+            job.state = CANCELLED
+            job.started = job.finished = time.time()
+            return
+        job.started = time.time()
+        job.state = RUNNING
+        try:
+            with self.profiler.capture() if self.profiler else nullcontext():
+                job.result = fn(job, *args)
+            job.state = DONE
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            logging.error(f"Background job {job.name} failed: {str(e)}")
+            job.error = e
+            job.state = FAILED
+        finally:
+            job.finished = time.time()
+
+    def _schedule(self):
+        if self.after_id is None:
+            self.after_id = self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self.after_id = None
+        for job in self.jobs:
+            if job.id not in self.callbacks:
+                continue
+            if job.process and job.state == PENDING and job.future.running():
+                job.started = time.time()
+                job.state = RUNNING
+            on_done, on_error, on_progress, reported = self.callbacks[job.id]
+            if on_progress is not None and job.progress != reported:
+                self.callbacks[job.id] = (on_done, on_error, on_progress, job.progress)
+                self._call(job, on_progress, *job.progress)
+        while True:
+            try:
+                job = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(job)
+        self._trim()
+        # A job can finish between its worker returning and its future's callback; keep polling until delivered
+        if self.callbacks:
+            self._schedule()
+
+    def _finish(self, job):
+        if job.process or job.future.cancelled():
+            self._settle(job)
+        on_done, on_error, on_progress, reported = self.callbacks.pop(job.id)
+        if on_progress is not None and job.progress != reported:
+            self._call(job, on_progress, *job.progress)
+        if job.state == DONE and on_done is not None:
+            self._call(job, on_done, job.result)
+        elif job.state == FAILED and on_error is not None:
+            self._call(job, on_error, job.error)
+
+    def _settle(self, job):
+        """Record the outcome of a process job, or of a thread job cancelled before it started"""
+        job.finished = time.time()
+        job.started = job.started or job.finished
+        if job.future.cancelled():
+            job.state = CANCELLED
+        elif job.future.exception() is not None:
+            job.error = job.future.exception()
+            logging.error(f"Background job {job.name} failed: {str(job.error)}")
+            job.state = FAILED
+        else:
+            job.result = job.future.result()
+            job.state = DONE
+
+    def _call(self, job, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception(f"Callback for background job {job.name} failed")
+
+    def _trim(self):
+        finished = [job for job in self.jobs if job.id not in self.callbacks]
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            self.jobs.remove(job)
+
+    def active(self):
+        return [job for job in self.jobs if job.active]
+
+    def clear_finished(self):
+        for job in [job for job in self.jobs if job.id not in self.callbacks]:
+            self.jobs.remove(job)
+
+    def cancel_all(self):
+        """Cancel every unfinished job and drop its callbacks, e.g. when the windows they update are gone"""
+        for job_id in self.callbacks:
+            self.callbacks[job_id] = (None, None, None, None)
+        for job in self.active():
+            job.cancel()
+
+    def shutdown(self, wait=False):
+        """Cancel every job and stop the pools"""
+        self.cancel_all()
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+        self.callbacks.clear()
+        self.threads.shutdown(wait=wait, cancel_futures=True)
+        if self.processes is not None:
+            self.processes.shutdown(wait=wait, cancel_futures=True)
@@ -1,24 +1,44 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import platform
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from receipts import ReceiptRenderer, open_file, render_pdf
+from campaigns import DEFAULT_SUBJECT, DEFAULT_TEMPLATE
+from metrics import metrics, Profiler
+from tasks import TaskExecutor
+from history import parse_day
+from security import MIN_PASSWORD_LENGTH
 import re
-import os
 from datetime import datetime
+import logging
+
+RECORDS_PAGE_SIZE = 200
+HISTORY_PAGE_SIZE = 100
+CHANNEL_NAMES = {"email": "Email", "sms": "SMS"}
+SEARCH_DEBOUNCE_MS = 250
+JOBS_REFRESH_MS = 250
 
 class UIManager:
-    def __init__(self, root, db_manager, notif_manager, backup_manager, fee_structure, security_manager):
+    def __init__(self, root, db_manager, notif_manager, backup_manager, fee_structure, security_manager,
+                 campaigns=None, exporter=None, sms=None):
         self.root = root
         self.root.title("School Fee Management System")
         self.root.geometry("1200x800")
         self.root.configure(bg="#e6f3fa")  # Light blue background
         self.db = db_manager
         self.notif = notif_manager
+        # Every channel implementing notifications.Notifier hears about payments
+        self.notifiers = [notifier for notifier in (notif_manager, sms) if notifier is not None]
         self.backup = backup_manager
         self.fee_structure = fee_structure
         self.security = security_manager
+        self.campaigns = campaigns
+        self.exporter = exporter
+        self.receipts = ReceiptRenderer(fee_structure)
+        self.profiler = Profiler()
+        # Anything slower than a click's worth of work runs here rather than on the Tk thread
+        self.tasks = TaskExecutor(root, profiler=self.profiler)
         self.logged_in = False
+        self.username = None
+        self.is_admin = False
         
         # Configure ttk style for modern look
         self.style = ttk.Style()
@@ -56,8 +76,9 @@ class UIManager:
         self.password_entry = ttk.Entry(self.login_window, show="*")
         self.password_entry.pack(pady=5)
 
-        ttk.Button(self.login_window, text="Login", style="Accent.TButton",
-                  command=lambda: self.authenticate(self.username_entry.get(), self.password_entry.get())).pack(pady=10)
+        self.login_button = ttk.Button(self.login_window, text="Login", style="Accent.TButton",
+                  command=lambda: self.authenticate(self.username_entry.get(), self.password_entry.get()))
+        self.login_button.pack(pady=10)
 
         ttk.Button(self.login_window, text="Forgot Password?", style="Link.TButton",
                   command=self.recover_password).pack(pady=5)
@@ -73,14 +94,29 @@ class UIManager:
             self.register_first_user()
 
     def authenticate(self, username, password):
-        if self.db.authenticate_user(username, password):
+        # The password KDF is deliberately slow (and may be a server round trip),
+        # so verify off the Tk thread
+        self.login_button.config(state="disabled")
+        self.tasks.submit("Sign in", lambda job: self.db.authenticate_user(username, password)
+                          and (username, self.db.is_admin(username)),
+                          on_done=self.finish_authentication, on_error=self.authentication_failed)
+
+    def finish_authentication(self, matches):
+        if matches:
             self.logged_in = True
+            self.username, self.is_admin = matches
             self.login_window.destroy()
             self.root.deiconify()  # Show the main window
             self.create_main_ui()
         else:
+            self.login_button.config(state="normal")
             messagebox.showerror("Error", "Invalid credentials!")
 
+    def authentication_failed(self, error):
+        # The database or the fee server could not be reached; the credentials were never checked
+        self.login_button.config(state="normal")
+        messagebox.showerror("Error", f"Could not sign in: {error}")
+
     def register_first_user(self):
         register_window = tk.Toplevel(self.root)
         register_window.title("Register First User")
@@ -125,16 +161,28 @@ class UIManager:
             if password != confirm:
                 messagebox.showerror("Error", "Passwords do not match!")
                 return
-            if len(password) < 6:
-                messagebox.showerror("Error", "Password must be at least 6 characters!")
+            if len(password) < MIN_PASSWORD_LENGTH:
+                messagebox.showerror("Error", f"Password must be at least {MIN_PASSWORD_LENGTH} characters!")
                 return
 
-            self.db.register_user(username, password, question, answer)
+            # Hashing the password and the answer runs the KDF twice; keep it off the Tk thread
+            register_btn.configure(state="disabled")
+            self.tasks.submit("Register user", lambda job: self.db.register_user(username, password, question, answer),
+                              on_done=registered, on_error=registration_failed)
+
+        def registered(result):
             messagebox.showinfo("Success", "User registered successfully! Please log in.")
-            register_window.destroy()
+            if register_window.winfo_exists():
+                register_window.destroy()
             self.show_login()
 
-        ttk.Button(register_window, text="Register", style="Accent.TButton", command=register).pack(pady=20)
+        def registration_failed(error):
+            if register_window.winfo_exists():
+                register_btn.configure(state="normal")
+            messagebox.showerror("Error", f"Registration failed: {error}")
+
+        register_btn = ttk.Button(register_window, text="Register", style="Accent.TButton", command=register)
+        register_btn.pack(pady=20)
 
     def recover_password(self):
         username = self.username_entry.get().strip()
@@ -159,22 +207,43 @@ class UIManager:
         answer_entry = ttk.Entry(recovery_window, show="*")
         answer_entry.pack(pady=5)
 
+        # Checking the answer and hashing the new password each run the KDF, so both are background jobs
         def verify_and_reset():
             answer = answer_entry.get().strip()
-            if self.db.verify_security_answer(username, answer):
-                new_password = simpledialog.askstring("Reset Password", "Enter new password:", show="*", parent=recovery_window)
-                if new_password and len(new_password) >= 6:
-                    self.db.update_password(username, new_password)
-                    messagebox.showinfo("Success", "Password reset successfully! Please log in.")
-                    recovery_window.destroy()
-                elif new_password:
-                    messagebox.showerror("Error", "Password must be at least 6 characters!")
-                else:
-                    messagebox.showerror("Error", "Password cannot be empty!")
-            else:
+            submit_btn.configure(state="disabled")
+            self.tasks.submit("Verify security answer", lambda job: self.db.verify_security_answer(username, answer),
+                              on_done=reset, on_error=reset_failed)
+
+        def reset(verified):
+            if not recovery_window.winfo_exists():
+                return
+            if not verified:
+                submit_btn.configure(state="normal")
                 messagebox.showerror("Error", "Incorrect answer!")
+                return
+            new_password = simpledialog.askstring("Reset Password", "Enter new password:", show="*", parent=recovery_window)
+            if new_password and len(new_password) >= MIN_PASSWORD_LENGTH:
+                self.tasks.submit("Reset password", lambda job: self.db.update_password(username, new_password),
+                                  on_done=password_reset, on_error=reset_failed)
+                return
+            submit_btn.configure(state="normal")
+            if new_password:
+                messagebox.showerror("Error", f"Password must be at least {MIN_PASSWORD_LENGTH} characters!")
+            else:
+                messagebox.showerror("Error", "Password cannot be empty!")
+
+        def password_reset(result):
+            messagebox.showinfo("Success", "Password reset successfully! Please log in.")
+            if recovery_window.winfo_exists():
+                recovery_window.destroy()
 
-        ttk.Button(recovery_window, text="Submit", style="Accent.TButton", command=verify_and_reset).pack(pady=20)
+        def reset_failed(error):
+            if recovery_window.winfo_exists():
+                submit_btn.configure(state="normal")
+            messagebox.showerror("Error", f"Password reset failed: {error}")
+
+        submit_btn = ttk.Button(recovery_window, text="Submit", style="Accent.TButton", command=verify_and_reset)
+        submit_btn.pack(pady=20)
 
     def create_main_ui(self):
         # Header
@@ -184,6 +253,10 @@ class UIManager:
                  font=("Arial", 24, "bold"), foreground="white", background="#2c3e50").pack(pady=10)
         self.style.configure("Header.TFrame", background="#2c3e50")
 
+        # Status bar
+        self.status_var = tk.StringVar(value="Ready")
+        ttk.Label(self.root, textvariable=self.status_var, anchor="w", relief="sunken").pack(side="bottom", fill="x")
+
         # Main frame with scrollable canvas
         main_frame = ttk.Frame(self.root)
         main_frame.pack(pady=20, padx=20, fill="both", expand=True)
@@ -228,6 +301,8 @@ class UIManager:
         ttk.Label(left_scrollable_frame, text="Search Student:").grid(row=8, column=0, pady=5, padx=10, sticky="w")
         self.search_entry = ttk.Entry(left_scrollable_frame)
         self.search_entry.grid(row=9, column=0, pady=5, padx=10)
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
+        self.search_after_id = None
 
         # Buttons with colors
         btn_frame = ttk.Frame(left_scrollable_frame)
@@ -237,7 +312,16 @@ class UIManager:
         ttk.Button(btn_frame, text="View Records", style="Purple.TButton", command=self.view_records).pack(pady=5, fill="x")
         ttk.Button(btn_frame, text="Search", style="Orange.TButton", command=self.search_student).pack(pady=5, fill="x")
         ttk.Button(btn_frame, text="Payment History", style="Teal.TButton", command=self.view_payment_history).pack(pady=5, fill="x")
+        ttk.Button(btn_frame, text="Dashboard", style="Teal.TButton", command=self.view_dashboard).pack(pady=5, fill="x")
+        ttk.Button(btn_frame, text="Fee Reminders", style="Orange.TButton", command=self.send_reminders).pack(pady=5, fill="x")
+        ttk.Button(btn_frame, text="Export Report", style="Purple.TButton", command=self.export_report).pack(pady=5, fill="x")
+        if self.is_admin:
+            ttk.Button(btn_frame, text="Performance", style="Gray.TButton",
+                      command=self.view_performance).pack(pady=5, fill="x")
         ttk.Button(btn_frame, text="Backup", style="Gray.TButton", command=self.backup_database).pack(pady=5, fill="x")
+        ttk.Button(btn_frame, text="Incremental Backup", style="Gray.TButton",
+                  command=self.incremental_backup).pack(pady=5, fill="x")
+        ttk.Button(btn_frame, text="Jobs", style="Gray.TButton", command=self.view_jobs).pack(pady=5, fill="x")
         ttk.Button(btn_frame, text="Logout", style="Red.TButton", command=self.logout).pack(pady=5, fill="x")
 
         # Button styles
@@ -253,23 +337,21 @@ class UIManager:
         right_panel = ttk.LabelFrame(main_frame, text="Records", style="Panel.TLabelframe")
         right_panel.pack(side="right", fill="both", expand=True, padx=10, pady=10)
 
-        right_canvas = tk.Canvas(right_panel, bg="#ffffff", highlightthickness=0)
-        right_scrollbar = ttk.Scrollbar(right_panel, orient="vertical", command=right_canvas.yview)
-        right_scrollable_frame = ttk.Frame(right_canvas)
-        right_scrollable_frame.bind("<Configure>", lambda e: right_canvas.configure(scrollregion=right_canvas.bbox("all")))
-        right_canvas.create_window((0, 0), window=right_scrollable_frame, anchor="nw")
-        right_canvas.configure(yscrollcommand=right_scrollbar.set)
-        right_canvas.pack(side="left", fill="both", expand=True)
-        right_scrollbar.pack(side="right", fill="y")
-
-        self.tree = ttk.Treeview(right_scrollable_frame, columns=("ID", "Name", "Form", "Paid", "Remaining"), 
-                                show="headings", style="Treeview")
+        # The tree scrolls itself so that reaching the bottom can fetch the next page
+        self.records_scrollbar = ttk.Scrollbar(right_panel, orient="vertical")
+        self.tree = ttk.Treeview(right_panel, columns=("ID", "Name", "Form", "Paid", "Remaining"), 
+                                show="headings", style="Treeview", yscrollcommand=self.on_records_scroll)
+        self.records_scrollbar.configure(command=self.tree.yview)
         self.tree.heading("ID", text="ID")
         self.tree.heading("Name", text="Name")
         self.tree.heading("Form", text="Form")
         self.tree.heading("Paid", text="Amount Paid")
         self.tree.heading("Remaining", text="Remaining")
-        self.tree.pack(fill="both", expand=True)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.records_scrollbar.pack(side="right", fill="y")
+        self.records_fetch = None
+        self.records_pending = False
+        self.records_generation = 0
 
     def validate_email_callback(self, value):
         valid = self.validate_email(value)
@@ -311,109 +393,660 @@ class UIManager:
         def process_payment():
             try:
                 student_id, amount = int(id_entry.get()), int(amount_entry.get())
-                student = self.db.get_student(student_id)
-                if not student:
-                    messagebox.showerror("Error", "Student not found!")
-                    return
-                name, form, email, _, total_paid = student
-                new_total = self.db.update_payment(student_id, amount)
-                if self.notif.send_email(name, form, email, amount, new_total, self.fee_structure[form]):
-                    messagebox.showinfo("Success", "Payment processed and email sent!")
-                else:
-                    messagebox.showwarning("Warning", "Payment processed but email failed!")
-                self.generate_receipt(student_id, name, form, amount, new_total)
-                payment_window.destroy()
-                self.view_records()
             except ValueError:
                 messagebox.showerror("Error", "Invalid input! Please enter numeric values.")
+                return
+            # Disabled until the payment is recorded, so a second click cannot post it twice
+            submit_btn.configure(state="disabled")
+            self.tasks.submit(f"Payment of {amount:,} TSH for student {student_id}", self.record_payment,
+                              student_id, amount, on_done=lambda result: finish_payment(student_id, amount, result),
+                              on_error=payment_failed)
 
-        ttk.Button(payment_window, text="Submit Payment", style="Green.TButton", command=process_payment).pack(pady=20)
-
-    def generate_receipt(self, student_id, name, form, amount, total_paid):
-        filename = f"receipt_{student_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        c = canvas.Canvas(filename, pagesize=letter)
-        c.setFillColorRGB(0.17, 0.62, 0.86)  # Blue color for header
-        c.setFont("Helvetica-Bold", 16)
-        c.drawCentredString(300, 750, "School Fee Payment Receipt")
-        c.setFillColorRGB(0, 0, 0)  # Black for text
-        c.setFont("Helvetica", 12)
-        c.drawString(100, 720, "-" * 80)
-        c.drawString(100, 700, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        c.drawString(100, 680, f"Student ID: {student_id}")
-        c.drawString(100, 660, f"Student Name: {name}")
-        c.drawString(100, 640, f"Form: {form}")
-        c.drawString(100, 620, f"Amount Paid: {amount:,} TSH")
-        c.drawString(100, 600, f"Total Paid: {total_paid:,} TSH")
-        c.drawString(100, 580, f"Remaining: {self.fee_structure[form] - total_paid:,} TSH")
-        c.drawString(100, 540, "Thank you for your payment!")
-        c.drawString(100, 520, "-" * 80)
-        c.showPage()
-        c.save()
-        
-        if platform.system() == "Windows":
-            os.startfile(filename)
-        elif platform.system() == "Darwin":
-            os.system(f"open {filename}")
+        def finish_payment(student_id, amount, result):
+            if result is None:
+                if payment_window.winfo_exists():
+                    submit_btn.configure(state="normal")
+                messagebox.showerror("Error", "Student not found!")
+                return
+            name, form, paid, required_fee, messages, errors = result
+            for notifier, message_id, contact in messages:
+                self.watch_delivery(notifier, message_id, contact)
+            channels = " and ".join(CHANNEL_NAMES[notifier.channel] for notifier, _, _ in messages)
+            if errors:
+                # The payment is committed: report the rest as a warning so nobody posts it again
+                messagebox.showwarning("Payment recorded", "Payment recorded, but "
+                                       + "; ".join(errors)
+                                       + (f". {channels} notification queued." if channels else "."))
+            else:
+                messagebox.showinfo("Success", f"Payment processed! {channels} notification queued.")
+            if paid is not None:
+                self.generate_receipt(student_id, name, form, amount, paid, required_fee)
+            if payment_window.winfo_exists():
+                payment_window.destroy()
+            self.view_records()
+
+        def payment_failed(error):
+            if payment_window.winfo_exists():
+                submit_btn.configure(state="normal")
+            messagebox.showerror("Error", f"Payment failed: {error}")
+
+        submit_btn = ttk.Button(payment_window, text="Submit Payment", style="Green.TButton", command=process_payment)
+        submit_btn.pack(pady=20)
+
+    def record_payment(self, job, student_id, amount):
+        """Record a payment and queue its notifications; runs as a background job.
+
+        Returns (name, form, total_paid, required_fee, [(notifier, message_id, contact)], errors),
+        or None if there is no such student. Only recording the payment can raise: what fails
+        once it is committed is returned in errors, with total_paid None if the balance could
+        not be read back.
+        """
+        student = self.db.get_student(student_id)
+        if not student:
+            return None
+        name, form, email, _, total_paid = student
+        if self.db.update_payment(student_id, amount) is None:
+            return None
+        messages, errors = [], []
+        try:
+            # Notifications and receipts show this year's fee plus any arrears against what was paid this year
+            fee, arrears, paid, _ = self.db.get_balance(student_id)
+        except Exception as e:
+            logging.error(f"Balance of student {student_id} unavailable after payment: {str(e)}")
+            return name, form, None, None, messages, [f"the new balance could not be read ({e}), "
+                                                      "so no notification or receipt was made"]
+        for notifier in self.notifiers:
+            kind = CHANNEL_NAMES[notifier.channel]
+            try:
+                contact = notifier.contact(student)
+                messages.append((notifier, notifier.queue_payment(student_id, name, form, contact, amount, paid,
+                                                                  fee + arrears), contact))
+            except Exception as e:
+                logging.error(f"{kind} notification for student {student_id} failed: {str(e)}")
+                errors.append(f"the {kind} notification failed ({e})")
+        return name, form, paid, fee + arrears, messages, errors
+
+    def watch_delivery(self, notifier, message_id, contact):
+        """Poll a notifier's queue and report delivery in the status bar"""
+        if not self.logged_in:
+            return
+        kind = CHANNEL_NAMES[notifier.channel]
+        status, attempts, error = notifier.delivery_status(message_id)
+        if status == "sent":
+            self.status_var.set(f"{kind} sent to {contact}")
+        elif status == "failed":
+            self.status_var.set(f"{kind} to {contact} failed")
+            messagebox.showwarning("Warning", f"Payment {kind} to {contact} failed after {attempts} attempts: {error}")
         else:
-            os.system(f"xdg-open {filename}")
+            if attempts:
+                self.status_var.set(f"{kind} to {contact} failed ({error}), retrying...")
+            else:
+                self.status_var.set(f"Sending {kind} to {contact}...")
+            self.root.after(1000, self.watch_delivery, notifier, message_id, contact)
+
+    def generate_receipt(self, student_id, name, form, amount, total_paid, required_fee):
+        # reportlab holds the GIL while it draws, so the PDF is rendered in a worker process
+        def rendered(filename):
+            metrics.record("receipt.render", job.elapsed)
+            open_file(filename)
+
+        filename, receipts = self.receipts.prepare(student_id, name, form, amount, total_paid, required_fee)
+        job = self.tasks.submit(f"Receipt for {name}", render_pdf, filename, receipts, process=True,
+                                on_done=rendered,
+                                on_error=lambda e: messagebox.showerror("Error", f"Receipt failed: {e}"))
 
     def view_records(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for id, name, form, paid in self.db.get_all_students():
-            remaining = self.fee_structure[form] - paid
-            self.tree.insert("", "end", values=(id, name, form, f"{paid:,}", f"{remaining:,}"))
+        self.load_records(self.db.get_students_page)
 
     def search_student(self):
-        term = self.search_entry.get()
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        for id, name, form, paid in self.db.search_students(term):
-            remaining = self.fee_structure[form] - paid
+        self.search_after_id = None
+        term = self.search_entry.get().strip()
+        if not term:
+            self.view_records()
+            return
+        # Ranked results page by offset: the number of rows already loaded
+        self.load_records(lambda after_id, limit: self.db.search_students(term, limit, self.records_loaded))
+
+    def on_search_key(self, event):
+        """Search as the user types, once they pause for SEARCH_DEBOUNCE_MS"""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.search_student)
+
+    def load_records(self, fetch_page):
+        """Reset the records view to a keyset-paginated source of (id, name, form, paid, balance) rows"""
+        self.tree.delete(*self.tree.get_children())
+        self.records_fetch = fetch_page
+        self.records_last_id = 0
+        self.records_loaded = 0
+        self.records_exhausted = False
+        # Pages still in flight for the previous source are dropped when they arrive
+        self.records_generation += 1
+        self.load_more_records()
+
+    def load_more_records(self):
+        if self.records_fetch is None or self.records_exhausted:
+            self.records_pending = False
+            return
+        self.records_pending = True
+        generation = self.records_generation
+        self.tasks.submit("Load records", lambda job, fetch, after_id: fetch(after_id, RECORDS_PAGE_SIZE),
+                          self.records_fetch, self.records_last_id,
+                          on_done=lambda rows: self.show_records(generation, rows),
+                          on_error=lambda e: self.show_records(generation, None))
+
+    def show_records(self, generation, rows):
+        if generation != self.records_generation:
+            return
+        self.records_pending = False
+        if rows is None:
+            self.status_var.set("Loading records failed")
+            return
+        for id, name, form, paid, remaining in rows:
             self.tree.insert("", "end", values=(id, name, form, f"{paid:,}", f"{remaining:,}"))
+        if rows:
+            self.records_last_id = rows[-1][0]
+        self.records_loaded += len(rows)
+        self.records_exhausted = len(rows) < RECORDS_PAGE_SIZE
+
+    def on_records_scroll(self, first, last):
+        self.records_scrollbar.set(first, last)
+        if (float(last) >= 0.9 and self.records_fetch is not None and not self.records_exhausted
+                and not self.records_pending):
+            # Defer so the fetch does not run inside the Treeview's own redraw
+            self.records_pending = True
+            self.root.after_idle(self.load_more_records)
 
     def view_payment_history(self):
         history_window = tk.Toplevel(self.root)
         history_window.title("Payment History")
-        history_window.geometry("600x400")
+        history_window.geometry("900x600")
         history_window.configure(bg="#d5e8f7")
 
-        ttk.Label(history_window, text="Enter Student ID:", background="#d5e8f7").pack(pady=10)
-        id_entry = ttk.Entry(history_window)
-        id_entry.pack(pady=5)
+        filter_frame = ttk.Frame(history_window)
+        filter_frame.pack(pady=10)
+        ttk.Label(filter_frame, text="Student ID:").grid(row=0, column=0, padx=5, sticky="w")
+        id_entry = ttk.Entry(filter_frame, width=10)
+        id_entry.grid(row=1, column=0, padx=5)
+        ttk.Label(filter_frame, text="Form:").grid(row=0, column=1, padx=5, sticky="w")
+        form_combo = ttk.Combobox(filter_frame, values=["All forms"] + list(self.fee_structure.keys()),
+                                  state="readonly", width=12)
+        form_combo.set("All forms")
+        form_combo.grid(row=1, column=1, padx=5)
+        ttk.Label(filter_frame, text="From (YYYY-MM-DD):").grid(row=0, column=2, padx=5, sticky="w")
+        start_entry = ttk.Entry(filter_frame, width=12)
+        start_entry.grid(row=1, column=2, padx=5)
+        ttk.Label(filter_frame, text="To (YYYY-MM-DD):").grid(row=0, column=3, padx=5, sticky="w")
+        end_entry = ttk.Entry(filter_frame, width=12)
+        end_entry.grid(row=1, column=3, padx=5)
+        show_btn = ttk.Button(filter_frame, text="Show History", style="Blue.TButton")
+        show_btn.grid(row=1, column=4, padx=10)
+
+        summary_var = tk.StringVar()
+        ttk.Label(history_window, textvariable=summary_var, background="#d5e8f7").pack(pady=5)
+
+        notebook = ttk.Notebook(history_window)
+        notebook.pack(fill="both", expand=True, padx=10, pady=10)
+        payments_frame = ttk.Frame(notebook)
+        notebook.add(payments_frame, text="Payments")
+        payments_scrollbar = ttk.Scrollbar(payments_frame, orient="vertical")
+        payments_tree = ttk.Treeview(payments_frame, columns=("Date", "ID", "Name", "Form", "Amount"),
+                                     show="headings", style="Treeview")
+        for column, text in (("Date", "Date"), ("ID", "Student ID"), ("Name", "Name"), ("Form", "Form"),
+                             ("Amount", "Amount (TSH)")):
+            payments_tree.heading(column, text=text)
+        payments_scrollbar.configure(command=payments_tree.yview)
+        payments_tree.pack(side="left", fill="both", expand=True)
+        payments_scrollbar.pack(side="right", fill="y")
+        monthly_tree = ttk.Treeview(notebook, columns=("Month", "Payments", "Total"), show="headings",
+                                    style="Treeview")
+        for column, text in (("Month", "Month"), ("Payments", "Payments"), ("Total", "Total (TSH)")):
+            monthly_tree.heading(column, text=text)
+        notebook.add(monthly_tree, text="Monthly")
+        terms_tree = ttk.Treeview(notebook, columns=("Year", "Term", "From", "To", "Payments", "Total"),
+                                  show="headings", style="Treeview")
+        for column, text in (("Year", "Academic Year"), ("Term", "Term"), ("From", "From"), ("To", "To"),
+                             ("Payments", "Payments"), ("Total", "Total (TSH)")):
+            terms_tree.heading(column, text=text)
+        notebook.add(terms_tree, text="Terms")
 
-        # Scrollable Treeview
-        history_frame = ttk.Frame(history_window)
-        history_frame.pack(fill="both", expand=True, pady=10)
-        history_canvas = tk.Canvas(history_frame, bg="#ffffff", highlightthickness=0)
-        history_scrollbar = ttk.Scrollbar(history_frame, orient="vertical", command=history_canvas.yview)
-        history_scrollable_frame = ttk.Frame(history_canvas)
-        history_scrollable_frame.bind("<Configure>", lambda e: history_canvas.configure(scrollregion=history_canvas.bbox("all")))
-        history_canvas.create_window((0, 0), window=history_scrollable_frame, anchor="nw")
-        history_canvas.configure(yscrollcommand=history_scrollbar.set)
-        history_canvas.pack(side="left", fill="both", expand=True)
-        history_scrollbar.pack(side="right", fill="y")
-
-        tree = ttk.Treeview(history_scrollable_frame, columns=("Date", "Amount"), show="headings", style="Treeview")
-        tree.heading("Date", text="Date")
-        tree.heading("Amount", text="Amount (TSH)")
-        tree.pack(fill="both", expand=True)
+        # The query being shown, and the keyset of the last payment row loaded; a newer query replaces
+        # the generation so that pages still in flight for the old one are dropped
+        state = {"filters": None, "before": None, "exhausted": True, "pending": False, "generation": 0}
 
         def show_history():
-            for item in tree.get_children():
-                tree.delete(item)
-            for date, amount in self.db.get_payment_history(id_entry.get()):
-                tree.insert("", "end", values=(date, f"{amount:,}"))
+            student_id = id_entry.get().strip()
+            if student_id and not student_id.isdigit():
+                messagebox.showerror("Error", "Student ID must be a number.", parent=history_window)
+                return
+            try:
+                start, end = parse_day(start_entry.get()), parse_day(end_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "Dates must be YYYY-MM-DD.", parent=history_window)
+                return
+            form = None if form_combo.get() == "All forms" else form_combo.get()
+            filters = (int(student_id) if student_id else None, form, start, end)
+            state.update(filters=filters, before=None, exhausted=False, pending=True,
+                         generation=state["generation"] + 1)
+            generation = state["generation"]
+            for tree in (payments_tree, monthly_tree, terms_tree):
+                tree.delete(*tree.get_children())
+            summary_var.set("Loading...")
+            show_btn.configure(state="disabled")
+            self.tasks.submit("Payment history", lambda job: (self.db.history.monthly(*filters),
+                                                             self.db.history.terms(*filters),
+                                                             self.db.history.page(*filters, limit=HISTORY_PAGE_SIZE)),
+                              on_done=lambda result: show_rollups(generation, *result),
+                              on_error=lambda e: failed(generation, e))
+
+        def show_rollups(generation, months, terms, rows):
+            if generation != state["generation"] or not history_window.winfo_exists():
+                return
+            show_btn.configure(state="normal")
+            for month, payments, total in months:
+                monthly_tree.insert("", "end", values=(month, f"{payments:,}", f"{total:,}"))
+            for academic_year, term, start, end, payments, total in terms:
+                terms_tree.insert("", "end", values=(academic_year, term, start, end or "", f"{payments:,}",
+                                                     f"{total:,}"))
+            summary_var.set(f"{sum(row[1] for row in months):,} payments totalling "
+                            f"{sum(row[2] for row in months):,} TSH")
+            show_payments(generation, rows)
+
+        def show_payments(generation, rows):
+            if generation != state["generation"] or not history_window.winfo_exists():
+                return
+            state["pending"] = False
+            for payment_id, date, student_id, name, form, amount in rows:
+                payments_tree.insert("", "end", values=(date, student_id, name, form, f"{amount:,}"))
+            if rows:
+                state["before"] = (rows[-1][1], rows[-1][0])
+            state["exhausted"] = len(rows) < HISTORY_PAGE_SIZE
+
+        def failed(generation, error):
+            if generation != state["generation"] or not history_window.winfo_exists():
+                return
+            show_btn.configure(state="normal")
+            state["pending"] = False
+            summary_var.set("")
+            messagebox.showerror("Error", f"Loading payment history failed: {error}", parent=history_window)
+
+        def load_more():
+            generation, filters, before = state["generation"], state["filters"], state["before"]
+            self.tasks.submit("Payment history page",
+                              lambda job: self.db.history.page(*filters, before=before, limit=HISTORY_PAGE_SIZE),
+                              on_done=lambda rows: show_payments(generation, rows),
+                              on_error=lambda e: failed(generation, e))
+
+        def on_payments_scroll(first, last):
+            payments_scrollbar.set(first, last)
+            # Fetch the next page as the user nears the end of the rows loaded so far
+            if float(last) >= 0.9 and not state["exhausted"] and not state["pending"]:
+                state["pending"] = True
+                load_more()
+
+        payments_tree.configure(yscrollcommand=on_payments_scroll)
+        show_btn.configure(command=show_history)
+
+    def view_dashboard(self):
+        dashboard_window = tk.Toplevel(self.root)
+        dashboard_window.title("Fee Dashboard")
+        dashboard_window.geometry("700x400")
+        dashboard_window.configure(bg="#d5e8f7")
 
-        ttk.Button(history_window, text="Show History", style="Blue.TButton", command=show_history).pack(pady=10)
+        tree = ttk.Treeview(dashboard_window, columns=("Form", "Students", "Collected", "Outstanding", "Fully Paid"),
+                            show="headings", style="Treeview")
+        for column, text in (("Form", "Form"), ("Students", "Students"), ("Collected", "Collected (TSH)"),
+                             ("Outstanding", "Outstanding (TSH)"), ("Fully Paid", "Fully Paid")):
+            tree.heading(column, text=text)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        today_var = tk.StringVar()
+        ttk.Label(dashboard_window, textvariable=today_var, background="#d5e8f7").pack(pady=5)
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            totals = [0, 0, 0, 0]
+            for form, students, collected, outstanding, fully_paid in self.db.ledger.form_totals():
+                tree.insert("", "end", values=(form, students, f"{collected:,}", f"{outstanding:,}", fully_paid))
+                totals = [a + b for a, b in zip(totals, (students, collected, outstanding, fully_paid))]
+            tree.insert("", "end", values=("All forms", totals[0], f"{totals[1]:,}", f"{totals[2]:,}", totals[3]))
+            today = self.db.ledger.daily_totals(datetime.now().strftime("%Y-%m-%d"))
+            today_var.set(f"Today: {sum(row[1] for row in today):,} TSH from {sum(row[2] for row in today)} payments")
+
+        def check_consistency():
+            # Both the check and the rebuild read every payment
+            consistency_btn.configure(state="disabled")
+            self.tasks.submit("Check ledger consistency", lambda job: self.db.ledger.check_consistency(),
+                              on_done=checked, on_error=failed)
+
+        def checked(drift):
+            if not dashboard_window.winfo_exists():
+                return
+            consistency_btn.configure(state="normal")
+            if not drift:
+                messagebox.showinfo("Consistency", "Aggregates match the payment records.", parent=dashboard_window)
+            elif messagebox.askyesno("Consistency", f"{len(drift)} aggregates have drifted from the payment records. "
+                                     "Rebuild them now?", parent=dashboard_window):
+                consistency_btn.configure(state="disabled")
+                self.tasks.submit("Rebuild ledger", lambda job: self.db.ledger.rebuild(), on_done=rebuilt,
+                                  on_error=failed)
+
+        def rebuilt(result):
+            if dashboard_window.winfo_exists():
+                consistency_btn.configure(state="normal")
+                refresh()
+
+        def failed(error):
+            if dashboard_window.winfo_exists():
+                consistency_btn.configure(state="normal")
+                messagebox.showerror("Error", f"Consistency check failed: {error}", parent=dashboard_window)
+
+        btn_frame = ttk.Frame(dashboard_window)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="Refresh", style="Blue.TButton", command=refresh).pack(side="left", padx=5)
+        consistency_btn = ttk.Button(btn_frame, text="Check Consistency", style="Orange.TButton",
+                                     command=check_consistency)
+        consistency_btn.pack(side="left", padx=5)
+        refresh()
+
+    def send_reminders(self):
+        if self.campaigns is None:
+            messagebox.showerror("Error", "Reminder campaigns can only be run on the fee server's desk.")
+            return
+        reminder_window = tk.Toplevel(self.root)
+        reminder_window.title("Fee Reminders")
+        reminder_window.geometry("600x550")
+        reminder_window.configure(bg="#d5e8f7")
+
+        ttk.Label(reminder_window, text="Remind parents with a balance above (TSH):", background="#d5e8f7").pack(pady=5)
+        threshold_entry = ttk.Entry(reminder_window)
+        threshold_entry.insert(0, "0")
+        threshold_entry.pack(pady=5)
+        ttk.Label(reminder_window, text="Subject:", background="#d5e8f7").pack(pady=5)
+        subject_entry = ttk.Entry(reminder_window, width=60)
+        subject_entry.insert(0, DEFAULT_SUBJECT)
+        subject_entry.pack(pady=5)
+        ttk.Label(reminder_window, text="Message ($name, $form, $total_paid, $balance, $required_fee):",
+                  background="#d5e8f7").pack(pady=5)
+        template_text = tk.Text(reminder_window, height=12, width=70)
+        template_text.insert("1.0", DEFAULT_TEMPLATE)
+        template_text.pack(pady=5)
+
+        progress_bar = ttk.Progressbar(reminder_window, length=500, mode="determinate")
+        progress_bar.pack(pady=10)
+        progress_var = tk.StringVar()
+        ttk.Label(reminder_window, textvariable=progress_var, background="#d5e8f7").pack()
+        state = {"job": None}
+
+        def show_progress(handled, total, message):
+            if reminder_window.winfo_exists():
+                progress_bar.configure(maximum=max(total or 0, 1), value=handled)
+                progress_var.set(message or "")
+
+        def finished(paused, error=None):
+            if not reminder_window.winfo_exists():
+                return
+            start_btn.configure(state="normal")
+            if error is not None:
+                messagebox.showerror("Error", f"Reminder campaign failed: {error}", parent=reminder_window)
+            else:
+                messagebox.showinfo("Fee Reminders", "Reminder campaign paused." if paused
+                                    else "Reminder campaign finished.", parent=reminder_window)
+
+        def run(job, campaign_id):
+            def update(sent, failed, remaining):
+                job.report(sent + failed, sent + failed + remaining,
+                           f"{sent:,} sent, {failed:,} failed, {remaining:,} remaining")
+            return self.campaigns.run(campaign_id, update, job.cancel_event)
+
+        def start(campaign_id):
+            campaign = self.campaigns.get(campaign_id)
+            remaining = self.campaigns.remaining(campaign_id)
+            handled = campaign[5] + campaign[6]
+            show_progress(handled, handled + remaining,
+                          f"{campaign[5]:,} sent, {campaign[6]:,} failed, {remaining:,} remaining")
+            start_btn.configure(state="disabled")
+            job = self.tasks.submit(f"Reminder campaign {campaign_id}", run, campaign_id, on_progress=show_progress,
+                                    on_done=lambda result: finished(job.cancelled),
+                                    on_error=lambda e: finished(False, e))
+            state["job"] = job
+
+        def pause():
+            if state["job"] is not None:
+                state["job"].cancel()
+
+        def start_new():
+            unfinished = self.campaigns.unfinished()
+            if unfinished and messagebox.askyesno("Fee Reminders", f"Campaign {unfinished[-1][0]} "
+                                                  f"({unfinished[-1][5]:,} sent) was not finished. Resume it instead?",
+                                                  parent=reminder_window):
+                start(unfinished[-1][0])
+                return
+            try:
+                campaign_id = self.campaigns.create(int(threshold_entry.get()), template_text.get("1.0", "end-1c"),
+                                                    subject_entry.get())
+            except (KeyError, ValueError) as e:
+                messagebox.showerror("Error", f"Invalid threshold or message template: {e}", parent=reminder_window)
+                return
+            start(campaign_id)
+
+        btn_frame = ttk.Frame(reminder_window)
+        btn_frame.pack(pady=10)
+        start_btn = ttk.Button(btn_frame, text="Send Reminders", style="Green.TButton", command=start_new)
+        start_btn.pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Pause", style="Red.TButton", command=pause).pack(side="left", padx=5)
+
+    def export_report(self):
+        if self.exporter is None:
+            messagebox.showerror("Error", "Reports can only be exported on the fee server's desk.")
+            return
+        export_window = tk.Toplevel(self.root)
+        export_window.title("Export Report")
+        export_window.geometry("450x450")
+        export_window.configure(bg="#d5e8f7")
+
+        ttk.Label(export_window, text="Report:", background="#d5e8f7").pack(pady=5)
+        report_combo = ttk.Combobox(export_window, values=["Payments", "Balances"], state="readonly")
+        report_combo.set("Payments")
+        report_combo.pack(pady=5)
+        ttk.Label(export_window, text="Payments from / to (YYYY-MM-DD, optional):", background="#d5e8f7").pack(pady=5)
+        date_frame = ttk.Frame(export_window)
+        date_frame.pack(pady=5)
+        start_entry = ttk.Entry(date_frame, width=12)
+        start_entry.pack(side="left", padx=5)
+        end_entry = ttk.Entry(date_frame, width=12)
+        end_entry.pack(side="left", padx=5)
+        ttk.Label(export_window, text="Form:", background="#d5e8f7").pack(pady=5)
+        form_combo = ttk.Combobox(export_window, values=["All forms"] + list(self.fee_structure.keys()), state="readonly")
+        form_combo.set("All forms")
+        form_combo.pack(pady=5)
+        contacts_var = tk.BooleanVar(value=False)
+        # Decrypted parent contacts leave the database only at an administrator's request
+        ttk.Checkbutton(export_window, text="Include parent contacts", variable=contacts_var,
+                        state="normal" if self.is_admin else "disabled").pack(pady=5)
+
+        progress_bar = ttk.Progressbar(export_window, length=350, mode="determinate")
+        progress_bar.pack(pady=10)
+        progress_var = tk.StringVar()
+        ttk.Label(export_window, textvariable=progress_var, background="#d5e8f7").pack()
+        state = {"job": None}
+
+        def show_progress(written, total, message):
+            if export_window.winfo_exists():
+                progress_bar.configure(maximum=max(total or 0, 1), value=written)
+                progress_var.set(f"{written:,} of {total or 0:,} rows")
+
+        def finished(path, rows):
+            if rows is not None:
+                self.status_var.set(f"Exported {rows:,} rows to {path}")
+            else:
+                self.status_var.set("Export cancelled")
+            if export_window.winfo_exists():
+                export_btn.configure(state="normal")
+                if rows is not None:
+                    messagebox.showinfo("Success", f"Exported {rows:,} rows to {path}", parent=export_window)
+
+        def failed(error):
+            if export_window.winfo_exists():
+                export_btn.configure(state="normal")
+                messagebox.showerror("Error", f"Export failed: {error}", parent=export_window)
+
+        def cancel():
+            if state["job"] is not None:
+                state["job"].cancel()
+
+        def start():
+            dates = [entry.get().strip() or None for entry in (start_entry, end_entry)]
+            try:
+                for value in dates:
+                    if value:
+                        datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Error", "Dates must be YYYY-MM-DD.", parent=export_window)
+                return
+            path = filedialog.asksaveasfilename(parent=export_window, defaultextension=".csv",
+                                                filetypes=[("CSV", "*.csv"), ("Excel workbook", "*.xlsx")])
+            if not path:
+                return
+            report = report_combo.get().lower()
+            form = None if form_combo.get() == "All forms" else form_combo.get()
+            include_contacts = contacts_var.get() and self.is_admin
+            show_progress(0, 0, None)
+            export_btn.configure(state="disabled")
+            state["job"] = self.tasks.submit(
+                f"Export {report} to {path}",
+                lambda job: self.exporter.export(path, report, *dates, form, include_contacts,
+                                                 lambda written, total: job.report(written, total), job.cancel_event),
+                on_progress=show_progress, on_done=lambda rows: finished(path, rows), on_error=failed)
+
+        btn_frame = ttk.Frame(export_window)
+        btn_frame.pack(pady=10)
+        export_btn = ttk.Button(btn_frame, text="Export", style="Green.TButton", command=start)
+        export_btn.pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cancel", style="Red.TButton", command=cancel).pack(side="left", padx=5)
+
+    def view_performance(self):
+        perf_window = tk.Toplevel(self.root)
+        perf_window.title("Performance")
+        perf_window.geometry("900x650")
+        perf_window.configure(bg="#d5e8f7")
+
+        ttk.Label(perf_window, text=f"Slowest operations over the last {metrics.window // 60} minutes",
+                  background="#d5e8f7").pack(pady=5)
+        columns = ("Operation", "Calls", "Mean", "p95", "p99", "Max")
+        tree = ttk.Treeview(perf_window, columns=columns, show="headings", style="Treeview", height=10)
+        for column in columns:
+            tree.heading(column, text=column if column in ("Operation", "Calls") else f"{column} (ms)")
+        tree.column("Operation", width=300)
+        tree.pack(fill="x", padx=10, pady=5)
+
+        report_text = tk.Text(perf_window, height=18, font=("Courier", 9))
+        report_text.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def refresh():
+            if not perf_window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for name, summary in metrics.slowest():
+                tree.insert("", "end", values=(name, summary["count"],
+                                               *(f"{summary[key] * 1000:.1f}" for key in ("mean", "p95", "p99", "max"))))
+            perf_window.after(2000, refresh)
+
+        def toggle_profiling():
+            # Profiles the Tk thread and the background jobs on worker threads; receipts render in a
+            # worker process and are not included
+            if not self.profiler.running:
+                self.profiler.start()
+                profile_btn.configure(text="Stop Profiling")
+                self.status_var.set("Profiling the window and background jobs... use the application, "
+                                    "then stop profiling")
+                return
+            filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+            report = self.profiler.stop(filename)
+            profile_btn.configure(text="Start Profiling")
+            self.status_var.set(f"Profile saved to {filename}")
+            report_text.delete("1.0", tk.END)
+            report_text.insert("1.0", report)
+
+        btn_frame = ttk.Frame(perf_window)
+        btn_frame.pack(pady=10)
+        profile_btn = ttk.Button(btn_frame, text="Stop Profiling" if self.profiler.running else "Start Profiling",
+                                 style="Blue.TButton", command=toggle_profiling)
+        profile_btn.pack(side="left", padx=5)
+        refresh()
 
     def backup_database(self):
-        backup_file = self.backup.create_backup()
+        def run(job):
+            def progress(remaining, total):
+                job.report(total - remaining, total)
+                # Raising from the progress callback aborts the backup; create_backup then returns None
+                job.check()
+            return self.backup.create_backup(progress=progress)
+
+        job = self.tasks.submit("Full backup", run, on_progress=self.show_backup_progress,
+                                on_done=lambda backup_file: self.backup_finished(job, backup_file))
+
+    def show_backup_progress(self, done, total, message):
+        if self.logged_in:
+            self.status_var.set(f"Backing up... {100 * done // max(total or 0, 1)}%")
+
+    def incremental_backup(self):
+        job = self.tasks.submit("Incremental backup", lambda job: self.backup.create_incremental_backup(),
+                                on_done=lambda backup_file: self.backup_finished(job, backup_file))
+
+    def backup_finished(self, job, backup_file):
+        self.status_var.set("Ready")
         if backup_file:
             messagebox.showinfo("Success", f"Backup created: {backup_file}")
+        elif job.cancelled:
+            self.status_var.set("Backup cancelled")
         else:
             messagebox.showerror("Error", "Backup failed!")
 
+    def view_jobs(self):
+        jobs_window = tk.Toplevel(self.root)
+        jobs_window.title("Jobs")
+        jobs_window.geometry("750x400")
+        jobs_window.configure(bg="#d5e8f7")
+
+        columns = ("Job", "State", "Progress", "Elapsed")
+        tree = ttk.Treeview(jobs_window, columns=columns, show="headings", style="Treeview")
+        for column in columns:
+            tree.heading(column, text=column)
+        tree.column("Job", width=380)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def describe(job):
+            done, total, message = job.progress
+            if message:
+                return message
+            if total:
+                return f"{100 * done // total}%"
+            return f"{done:,}" if done else ""
+
+        def refresh():
+            if not jobs_window.winfo_exists():
+                return
+            selected = tree.selection()
+            tree.delete(*tree.get_children())
+            for job in reversed(self.tasks.jobs):
+                tree.insert("", "end", iid=str(job.id),
+                            values=(job.name, job.state, describe(job), f"{job.elapsed:.1f}s"))
+            tree.selection_set([iid for iid in selected if tree.exists(iid)])
+            jobs_window.after(JOBS_REFRESH_MS, refresh)
+
+        def cancel():
+            selected = {int(iid) for iid in tree.selection()}
+            for job in self.tasks.jobs:
+                if job.id in selected and job.active:
+                    job.cancel()
+
+        btn_frame = ttk.Frame(jobs_window)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="Cancel", style="Red.TButton", command=cancel).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Clear Finished", style="Gray.TButton",
+                   command=self.tasks.clear_finished).pack(side="left", padx=5)
+        refresh()
+
     def clear_entries(self):
         self.name_entry.delete(0, tk.END)
         self.form_combo.set("")
@@ -423,6 +1056,14 @@ class UIManager:
 
     def logout(self):
         self.logged_in = False
+        self.username, self.is_admin = None, False
+        if self.profiler.running:
+            self.profiler.stop()
+        self.security.clear_cache()
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        # Their callbacks would update the windows destroyed below
+        self.tasks.cancel_all()
         for widget in self.root.winfo_children():
             widget.destroy()
         self.root.withdraw()  # Hide root window again